@@ -0,0 +1,218 @@
+import numpy as np
+import pandas as pd
+import config
+import sde_csp_meta
+
+ASSIGNMENT_COLUMNS = ['ticker', 'strike_offset', 'strike_pct', 'strike', 'hist_pct_assigned', 'mc_pct_assigned',
+                      'mc_ci_low', 'mc_ci_high', 'paths', 'vol_scaled']
+
+# Returns the EWMA volatility needs before it is trusted for scaling; earlier weeks are left out
+VOL_WARMUP_WEEKS = 10
+
+
+def bootstrap_assignment(returns_pct, thresholds, paths=None, block_weeks=None, ci=None, vol_scale=None,
+                         vol_lambda=None, seed=None, chunk_paths=None, max_elements=None):
+    """
+    Distribution of the % of weeks closing at or below each threshold, by moving block bootstrap of the
+    weekly returns, for a batch of tickers at once.
+
+    Every path resamples a ticker's history: ceil(n / block_weeks) blocks of block_weeks consecutive weekly
+    returns drawn with replacement, so volatility clustering inside a block is kept. A block's count of
+    weeks at or below a threshold is taken from prefix sums, so each path costs one gather per block
+    (for up to four thresholds at once) instead of one comparison per week.
+
+    With vol_scale, every return is first rescaled by the ratio of the current EWMA volatility to the
+    EWMA volatility when it happened (filtered historical simulation), so calm or turbulent recent weeks
+    move the estimate.
+
+    Paths are drawn chunk_paths at a time and tickers are batched so that, apart from the packed copy of the
+    returns themselves, no intermediate array (prefix sums, drawn blocks, path percentages) has more than about
+    max_elements entries. The random draws only depend on the seed and chunk_paths, so a ticker gets the
+    same result alone or in any batch.
+
+    Parameters:
+    returns_pct (array): Weekly returns in percent, weeks x tickers (or one ticker's 1-D array), NaN where
+        there is no return.
+    thresholds (array): Threshold moves in percent, tickers x strikes (or 1-D for one ticker).
+    paths (int): Bootstrap paths per ticker (default ASSIGNMENT_PATHS).
+    block_weeks (int): Weeks per block (default ASSIGNMENT_BLOCK_WEEKS).
+    ci (float): Confidence level in percent of the interval (default ASSIGNMENT_CI).
+    vol_scale (bool): Rescale returns to the current volatility (default ASSIGNMENT_VOL_SCALE).
+    vol_lambda (float): EWMA decay of the volatility estimate (default ASSIGNMENT_VOL_LAMBDA).
+    seed (int): Seed of the draws (default ASSIGNMENT_SEED).
+    chunk_paths (int): Paths drawn at a time (default ASSIGNMENT_CHUNK_PATHS).
+    max_elements (int): Memory bound of the intermediate arrays (default ASSIGNMENT_MAX_ELEMENTS).
+
+    Returns:
+    tuple: Mean, lower and upper CI bound of the % of weeks at or below each threshold, each an array of
+    tickers x strikes (NaN for tickers with less than one block of returns).
+    """
+    paths = paths or config.ASSIGNMENT_PATHS
+    block_weeks = block_weeks or config.ASSIGNMENT_BLOCK_WEEKS
+    ci = config.ASSIGNMENT_CI if ci is None else ci
+    vol_scale = config.ASSIGNMENT_VOL_SCALE if vol_scale is None else vol_scale
+    vol_lambda = config.ASSIGNMENT_VOL_LAMBDA if vol_lambda is None else vol_lambda
+    seed = config.ASSIGNMENT_SEED if seed is None else seed
+    chunk_paths = min(paths, chunk_paths or config.ASSIGNMENT_CHUNK_PATHS)
+    max_elements = max_elements or config.ASSIGNMENT_MAX_ELEMENTS
+
+    returns_pct = np.asarray(returns_pct, dtype=np.float64)
+    if returns_pct.ndim == 1:
+        returns_pct = returns_pct[:, None]
+    thresholds = np.atleast_2d(np.asarray(thresholds, dtype=np.float64))
+
+    # Each ticker's returns packed to the bottom of its column, oldest first, gaps closed
+    valid = ~np.isnan(returns_pct)
+    returns_pct = np.take_along_axis(returns_pct, np.argsort(valid, axis=0, kind='stable'), axis=0)
+
+    if vol_scale:
+        returns_pct = _vol_scaled(returns_pct, vol_lambda)
+
+    rows, tickers = returns_pct.shape
+    strikes = thresholds.shape[1]
+    return_counts = (~np.isnan(returns_pct)).sum(axis=0)
+    block_counts = -(-return_counts // block_weeks)
+    block_starts = np.maximum(return_counts - block_weeks + 1, 0)
+
+    mean = np.full((tickers, strikes), np.nan)
+    ci_low, ci_high = mean.copy(), mean.copy()
+    tail = (100 - ci) / 2
+
+    # Batches of tickers small enough for the prefix sums of their weeks, the drawn blocks of a chunk and the
+    # percentages of all paths
+    max_blocks = max(1, int(block_counts.max()))
+    batch_size = max(1, max_elements // max(max_blocks * chunk_paths, paths * strikes, (rows + 1) * strikes))
+
+    for batch_start in range(0, tickers, batch_size):
+        columns = np.arange(batch_start, min(batch_start + batch_size, tickers))
+        columns = columns[block_starts[columns] > 0]
+        if not columns.size:
+            continue
+
+        # Weeks at or below each threshold in the block starting at every row, from prefix sums
+        with np.errstate(invalid='ignore'):
+            at_or_below = returns_pct[:, columns].T[None, :, :] <= thresholds[columns].T[:, :, None]
+        below_count = np.zeros((strikes, columns.size, rows + 1), dtype=np.int64)
+        np.cumsum(at_or_below, axis=2, out=below_count[:, :, 1:])
+        block_sums = below_count[:, :, block_weeks:] - below_count[:, :, :-block_weeks]
+        start_rows = block_sums.shape[2]
+
+        # Four strikes per int64 in 16 bit lanes, so one gather and one sum serve four strikes. A lane's total
+        # over a path is at most the ticker's return count plus a block, far below 2 ** 16 even for daily horizons.
+        # Laid out ticker by ticker with a trailing 0 that blocks a ticker does not draw point to.
+        packed = np.zeros((-(-strikes // 4), columns.size * start_rows + 1), dtype=np.int64)
+        for strike in range(strikes):
+            packed[strike // 4, :-1] |= block_sums[strike].ravel() << (16 * (strike % 4))
+        not_drawn = packed.shape[1] - 1
+        first_start = np.arange(columns.size) * start_rows + rows - return_counts[columns]
+
+        batch_blocks = int(block_counts[columns].max())
+        sampled_weeks = block_counts[columns] * block_weeks
+        pct_at_or_below = np.empty((paths, columns.size, strikes), dtype=np.float32)
+
+        for path_start in range(0, paths, chunk_paths):
+            path_count = min(chunk_paths, paths - path_start)
+
+            # Drawn as blocks x paths, so the first b blocks' draws do not depend on how many blocks the
+            # longest history needs; the same draws serve every ticker
+            uniforms = np.random.default_rng([seed, path_start // chunk_paths]).random((max_blocks, chunk_paths))
+            uniforms = uniforms[:batch_blocks, :path_count, None]
+
+            # Position of every drawn block in the packed table, blocks past a ticker's count pointing to the 0
+            drawn = (uniforms * block_starts[columns]).astype(np.int64)
+            drawn += first_start
+            np.copyto(drawn, not_drawn, where=np.arange(batch_blocks)[:, None, None] >= block_counts[columns])
+
+            for word in range(packed.shape[0]):
+                lane_sums = packed[word].take(drawn).sum(axis=0)
+                for strike in range(4 * word, min(4 * word + 4, strikes)):
+                    weeks_below = (lane_sums >> (16 * (strike % 4))) & 0xFFFF
+                    pct_at_or_below[path_start:path_start + path_count, :, strike] = weeks_below / sampled_weeks * 100
+
+        mean[columns] = pct_at_or_below.mean(axis=0, dtype=np.float64)
+        ci_low[columns], ci_high[columns] = np.percentile(pct_at_or_below, [tail, 100 - tail], axis=0)
+
+    return mean, ci_low, ci_high
+
+
+def _vol_scaled(returns_pct, vol_lambda):
+    # Scale each return by current EWMA vol / EWMA vol before it; pandas ewm starts at each packed column's
+    # first return, so the NaN padding in front of it does not matter
+    df = pd.DataFrame(returns_pct)
+    variance = (df ** 2).ewm(alpha=1 - vol_lambda, adjust=False, min_periods=VOL_WARMUP_WEEKS).mean()
+
+    current_vol = np.sqrt(variance.iloc[-1].to_numpy())
+    prior_vol = np.sqrt(variance.shift(1).to_numpy())
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scaled = returns_pct * current_vol / prior_vol
+    scaled[~np.isfinite(scaled)] = np.nan
+    return scaled
+
+
+def assignment_thresholds(tgt_strike_pct, strikes_each_side=None):
+    # The target strike % and its neighbours on the same 0.5% grid the target is chosen from
+    strikes_each_side = config.ASSIGNMENT_STRIKES if strikes_each_side is None else strikes_each_side
+    offsets = np.arange(-strikes_each_side, strikes_each_side + 1)
+    return offsets, tgt_strike_pct + 0.5 * offsets
+
+
+def assignment_ticker(sde):
+    """
+    Bootstrap estimate, with a confidence interval, of the chance of assignment at the target strike and at
+    ASSIGNMENT_STRIKES neighbouring strikes on each side, next to the plain historical frequency.
+
+    In HORIZON_MODE the strikes are centred on the expiry matched target instead, and the paths resample the
+    overlapping returns over its holding period in blocks of ASSIGNMENT_BLOCK_WEEKS worth of trading days.
+
+    Parameters:
+    sde (StockDataEntry): An entry whose weekly stats (and horizon returns) are still loaded.
+
+    Returns:
+    DataFrame: One row per strike with ASSIGNMENT_COLUMNS.
+    """
+    if config.HORIZON_MODE and pd.notna(sde.csp_horizon_tgt_strike_pct):
+        returns_pct = sde.horizon_returns.returns(sde.csp_horizon_days)
+        offsets, strike_pcts = assignment_thresholds(sde.csp_horizon_tgt_strike_pct)
+        mean, ci_low, ci_high = bootstrap_assignment(returns_pct, strike_pcts,
+                                                     block_weeks=config.ASSIGNMENT_BLOCK_WEEKS * 5)
+
+        return assignment_table(sde.ticker, offsets, strike_pcts, sde.last_close_price, returns_pct,
+                                returns_pct.shape[0], mean[0], ci_low[0], ci_high[0])
+
+    stats = sde.weekly_stats
+    offsets, strike_pcts = assignment_thresholds(sde.tgt_strike_pct)
+    mean, ci_low, ci_high = bootstrap_assignment(stats.returns_pct, strike_pcts)
+
+    return assignment_table(sde.ticker, offsets, strike_pcts, sde.last_close_price, stats.returns_pct,
+                            stats.total_weeks, mean[0], ci_low[0], ci_high[0])
+
+
+def assignment_table(ticker, offsets, strike_pcts, last_close_price, returns_pct, total_weeks, mean, ci_low,
+                     ci_high):
+    # Rows of one ticker; the historical % is computed like pct_chance_assigned, so the target's row matches it
+    with np.errstate(invalid='ignore'):
+        hist_weeks_below = (returns_pct[:, None] <= strike_pcts[None, :]).sum(axis=0)
+
+    return pd.DataFrame({
+        'ticker': ticker,
+        'strike_offset': offsets,
+        'strike_pct': strike_pcts,
+        'strike': sde_csp_meta.strike_on_grid(last_close_price, strike_pcts),
+        'hist_pct_assigned': np.round(hist_weeks_below / total_weeks * 100, 2),
+        'mc_pct_assigned': np.round(mean, 2),
+        'mc_ci_low': np.round(ci_low, 2),
+        'mc_ci_high': np.round(ci_high, 2),
+        'paths': config.ASSIGNMENT_PATHS,
+        'vol_scaled': config.ASSIGNMENT_VOL_SCALE
+    }, columns=ASSIGNMENT_COLUMNS)
+
+
+def combine_assignments(sde_results):
+    # Stack every ticker's strikes into one table
+    assignments = [result.df_assignment for result in sde_results if result.df_assignment is not None]
+
+    if not assignments:
+        return pd.DataFrame(columns=ASSIGNMENT_COLUMNS)
+
+    return pd.concat(assignments, ignore_index=True)
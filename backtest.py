@@ -0,0 +1,166 @@
+import math
+from bisect import bisect_left, insort
+import numpy as np
+import pandas as pd
+import options_pricing
+import sde_csp_meta
+import config
+
+BACKTEST_COLUMNS = ['ticker', 'weeks_tested', 'assignments', 'assignment_rate_pct', 'expected_assignment_rate_pct',
+                    'avg_tgt_strike_pct', 'avg_premium_pct', 'worst_week_pct', 'total_return_pct',
+                    'annualized_return_pct', 'max_drawdown_pct']
+
+# Each simulated put is sold at one week's close and settles at the next
+HOLDING_DAYS = 7
+
+
+def walk_forward_targets(weekly_returns, safety_pct=None, window=0, min_weeks=52):
+    """
+    Target strike % and % chance assigned as calculate_tgt_strike_pct_data would have produced them at the
+    close of every historical week, using only the returns known at that point.
+
+    The window's returns are kept in a sorted list updated by insertion (and deletion for a rolling window),
+    so each week costs a few binary searches instead of a fresh sort. The target is found from a single
+    order statistic: a threshold qualifies when fewer than safety_pct % of the window's weeks closed at or
+    below it, which holds exactly when it sits below the (j + 1)th smallest return, j being the most weeks
+    the safety % allows (sde_csp_meta.max_weeks_below, shared with the per ticker and panel calculations).
+
+    Parameters:
+    weekly_returns (array): Weekly returns in percent, NaN for weeks without a return.
+    safety_pct (float): Safety percentage (default CSP_SAFETY_PCT).
+    window (int): Rolling window in weeks, or 0 for an expanding window over all prior weeks.
+    min_weeks (int): Weeks of history required before a target is produced.
+
+    Returns:
+    tuple: Arrays of target strike % and % chance assigned per week, NaN where there is no target.
+    """
+    if safety_pct is None:
+        safety_pct = config.CSP_SAFETY_PCT
+
+    weekly_returns = np.asarray(weekly_returns, dtype=np.float64)
+    total_weeks = weekly_returns.shape[0]
+
+    # Weeks in the window at every week, and the most of them the safety % allows at or below the target
+    weeks_in_windows = np.arange(1, total_weeks + 1)
+    if window:
+        weeks_in_windows = np.minimum(weeks_in_windows, window)
+    max_weeks_below = sde_csp_meta.max_weeks_below(weeks_in_windows, safety_pct)
+    weeks_below_list = max_weeks_below.tolist()
+
+    # Walk the weeks for the order statistic, the return count and the truncated worst move of each window
+    order_statistics = np.full(total_weeks, np.nan)
+    return_counts = np.zeros(total_weeks, dtype=np.int64)
+    lowest_moves = np.full(total_weeks, np.nan)
+    sorted_returns = []
+
+    for week in range(total_weeks):
+        weekly_return = weekly_returns[week]
+        if not math.isnan(weekly_return):
+            insort(sorted_returns, weekly_return)
+
+        if window and week >= window:
+            dropped_return = weekly_returns[week - window]
+            if not math.isnan(dropped_return):
+                del sorted_returns[bisect_left(sorted_returns, dropped_return)]
+
+        if not sorted_returns:
+            continue
+
+        return_counts[week] = len(sorted_returns)
+        lowest_moves[week] = int(sorted_returns[0])
+        if 0 <= weeks_below_list[week] < len(sorted_returns):
+            order_statistics[week] = sorted_returns[weeks_below_list[week]]
+
+    # Thresholds only run down to the truncated worst move
+    tgt_strike_pcts = sde_csp_meta.order_statistic_tgt_strike_pct(order_statistics, max_weeks_below, return_counts)
+    found = (weeks_in_windows >= min_weeks) & (return_counts > 0) & (max_weeks_below >= 0) & \
+        (tgt_strike_pcts > lowest_moves)
+    tgt_strike_pcts = np.where(found, tgt_strike_pcts, np.nan)
+
+    # Weeks of each window at or below its target, a few hundred target weeks at a time
+    pct_chances_assigned = np.full(total_weeks, np.nan)
+    target_weeks = np.flatnonzero(found)
+    all_weeks = np.arange(total_weeks)
+    for batch in np.array_split(target_weeks, max(1, -(-target_weeks.size // 256))):
+        in_window = all_weeks[None, :] <= batch[:, None]
+        if window:
+            in_window &= all_weeks[None, :] > batch[:, None] - window
+        weeks_at_or_below = ((weekly_returns[None, :] <= tgt_strike_pcts[batch, None]) & in_window).sum(axis=1)
+        pct_chances_assigned[batch] = np.round(weeks_at_or_below / weeks_in_windows[batch] * 100, 2)
+
+    return tgt_strike_pcts, pct_chances_assigned
+
+
+def backtest_ticker(sde, safety_pct=None, window=None, min_weeks=None, vol_weeks=None, rate=None):
+    """
+    Walk-forward backtest of the target strike rule on a ticker's weekly history: every week a put is
+    sold at the target strike and held to the next week's close.
+
+    The premium is a Black-Scholes proxy priced with the trailing realized volatility of weekly returns,
+    since historical option quotes are not available. Returns are on the cash secured (the strike).
+
+    Parameters:
+    sde (StockDataEntry): An entry whose weekly stats are still loaded.
+    safety_pct (float): Safety percentage (default CSP_SAFETY_PCT).
+    window (int): Rolling window in weeks, 0 for expanding (default BACKTEST_WINDOW).
+    min_weeks (int): Weeks of history before the first trade (default BACKTEST_MIN_WEEKS).
+    vol_weeks (int): Weeks of returns in the realized volatility (default BACKTEST_VOL_WEEKS).
+    rate (float): Risk free rate in percent used for the premium proxy (default BACKTEST_RATE).
+
+    Returns:
+    DataFrame: One row with BACKTEST_COLUMNS.
+    """
+    window = config.BACKTEST_WINDOW if window is None else window
+    min_weeks = config.BACKTEST_MIN_WEEKS if min_weeks is None else min_weeks
+    vol_weeks = config.BACKTEST_VOL_WEEKS if vol_weeks is None else vol_weeks
+    rate = config.BACKTEST_RATE if rate is None else rate
+
+    stats = sde.weekly_stats
+    closes = stats.closes
+    tgt_strike_pcts, pct_chances_assigned = walk_forward_targets(stats.returns_pct, safety_pct, window, min_weeks)
+
+    strikes = sde_csp_meta.strike_on_grid(closes, tgt_strike_pcts)
+    next_closes = np.r_[closes[1:], np.nan]
+
+    # Annualized realized volatility of the weekly returns up to each week
+    realized_vol = pd.Series(stats.returns).rolling(vol_weeks, min_periods=max(2, vol_weeks // 2)).std().to_numpy()
+    realized_vol = realized_vol * np.sqrt(52) * 100
+
+    traded = ~np.isnan(strikes) & ~np.isnan(next_closes) & ~np.isnan(realized_vol) & (strikes > 0)
+    closes, strikes, next_closes = closes[traded], strikes[traded], next_closes[traded]
+
+    premiums = options_pricing.calculate_option_prices(closes, strikes, rate, HOLDING_DAYS, realized_vol[traded],
+                                                       option_type='put')
+    assigned = next_closes < strikes
+    weekly_pnl = (premiums - np.maximum(strikes - next_closes, 0)) / strikes
+
+    weeks_tested = int(traded.sum())
+    row = {'ticker': sde.ticker, 'weeks_tested': weeks_tested}
+
+    if weeks_tested:
+        equity = np.cumprod(1 + weekly_pnl)
+        drawdowns = equity / np.maximum.accumulate(equity) - 1
+
+        row.update({
+            'assignments': int(assigned.sum()),
+            'assignment_rate_pct': np.round(assigned.mean() * 100, 2),
+            'expected_assignment_rate_pct': np.round(pct_chances_assigned[traded].mean(), 2),
+            'avg_tgt_strike_pct': np.round(tgt_strike_pcts[traded].mean(), 2),
+            'avg_premium_pct': np.round((premiums / strikes).mean() * 100, 3),
+            'worst_week_pct': np.round(weekly_pnl.min() * 100, 2),
+            'total_return_pct': np.round((equity[-1] - 1) * 100, 2),
+            'annualized_return_pct': np.round((equity[-1] ** (52 / weeks_tested) - 1) * 100, 2),
+            'max_drawdown_pct': np.round(drawdowns.min() * 100, 2)
+        })
+
+    return pd.DataFrame([row], columns=BACKTEST_COLUMNS)
+
+
+def combine_backtests(sde_results):
+    # Stack every ticker's backtest row into one table
+    backtests = [result.df_backtest for result in sde_results if result.df_backtest is not None]
+
+    if not backtests:
+        return pd.DataFrame(columns=BACKTEST_COLUMNS)
+
+    return pd.concat(backtests, ignore_index=True)
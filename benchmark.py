@@ -0,0 +1,226 @@
+"""
+Offline benchmark of the analysis pipeline on synthetic universes.
+
+Times every stage and the end-to-end run (analysis plus results file) at each universe size, writes
+the timings to JSON and optionally compares them with an earlier benchmark file, exiting with status 1
+when anything got slower than the allowed threshold. No network access is needed.
+
+    python benchmark.py --scales 10,100,1000,5000 --repeat 3
+    python benchmark.py --compare BENCHMARK_before.json --threshold 0.2
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import config
+import data_providers
+import fetch_pipeline
+import instrumentation
+import utilities as ut
+from instrumentation import logger
+from synthetic_data import SyntheticProvider, synthetic_tickers
+
+# Features that keep state on disk between runs are pinned off so every run measures the same cold work
+PINNED_CONFIG = {
+    'USE_HISTORY_CACHE': False,
+    'TA_INCREMENTAL': False,
+    'DOWNLOAD_TICKER_DATA_TO_CSV': False
+}
+
+# Settings that change how much work a run does, recorded with the results
+RECORDED_CONFIG = ['MAX_CONCURRENT_TICKERS', 'HISTORY_BATCH_SIZE', 'MAX_PAIN_TERM_STRUCTURE', 'GREEKS_IV_SOURCE',
+                   'SCAN_MODE', 'RESULTS_FORMATS']
+
+
+def run_once(provider, tickers):
+    """
+    One end-to-end run over tickers in a scratch data directory.
+
+    Returns:
+    tuple: (end-to-end wall seconds, stage totals from the tracer, completed ticker count)
+    """
+    with tempfile.TemporaryDirectory(prefix='csp_benchmark_') as scratch_dir:
+        config.STOCK_DATA_DIR = os.path.join(scratch_dir, 'stockData')
+        config.RESULTS_DATA_DIR = os.path.join(scratch_dir, 'results')
+        ut.create_data_dirs()
+
+        data_providers.set_provider(provider)
+        tracer = instrumentation.start_tracing()
+
+        start = time.perf_counter()
+        sde_results = fetch_pipeline.run_universe(tickers, max_workers=config.MAX_CONCURRENT_TICKERS)
+        ut.generate_results_file(sde_results)
+        wall = time.perf_counter() - start
+
+    stages, _ = tracer.summary()
+    return wall, stages, len(sde_results)
+
+
+def benchmark_scale(provider, ticker_count, repeat):
+    tickers = synthetic_tickers(ticker_count)
+    runs = [run_once(provider, tickers) for _ in range(repeat)]
+
+    # Medians across repeats, so one noisy run does not decide the result
+    walls = [wall for wall, _, _ in runs]
+    stage_names = sorted({name for _, stages, _ in runs for name in stages})
+    stages = {}
+    for name in stage_names:
+        totals = [run_stages[name] for _, run_stages, _ in runs if name in run_stages]
+        stages[name] = {
+            'count': totals[0]['count'],
+            'wall': float(np.median([total['wall'] for total in totals])),
+            'cpu': float(np.median([total['cpu'] for total in totals]))
+        }
+
+    return {
+        'tickers': ticker_count,
+        'completed': runs[0][2],
+        'end_to_end': {
+            'wall': float(np.median(walls)),
+            'per_ticker_ms': float(np.median(walls)) / ticker_count * 1000,
+            'runs': walls
+        },
+        'stages': stages
+    }
+
+
+def find_regressions(baseline, current, threshold, min_seconds):
+    """
+    Compare two benchmark results and list every timing that got slower by more than threshold.
+
+    Parameters:
+    baseline (dict): Earlier benchmark results.
+    current (dict): New benchmark results.
+    threshold (float): Allowed slowdown as a fraction (0.2 allows 20%).
+    min_seconds (float): Timings below this in the baseline are too noisy to compare and are skipped.
+
+    Returns:
+    list: (scale, metric, baseline seconds, current seconds) for each regression.
+    """
+    regressions = []
+
+    for scale, current_scale in current['scales'].items():
+        baseline_scale = baseline['scales'].get(scale)
+        if baseline_scale is None:
+            continue
+
+        pairs = [('end_to_end', baseline_scale['end_to_end']['wall'], current_scale['end_to_end']['wall'])]
+        pairs += [(name, baseline_scale['stages'][name]['wall'], totals['wall'])
+                  for name, totals in current_scale['stages'].items() if name in baseline_scale['stages']]
+
+        for metric, old_wall, new_wall in pairs:
+            if old_wall >= min_seconds and new_wall > old_wall * (1 + threshold):
+                regressions.append((scale, metric, old_wall, new_wall))
+
+    return regressions
+
+
+def log_results(results):
+    for scale, scale_results in results['scales'].items():
+        end_to_end = scale_results['end_to_end']
+        logger.info(f"-- {scale} TICKERS: {end_to_end['wall']:.3f}s end to end, "
+                    f"{end_to_end['per_ticker_ms']:.2f} ms per ticker --")
+        logger.info(f"{'stage':<28}{'count':>8}{'wall s':>12}{'cpu s':>12}")
+        for name, totals in sorted(scale_results['stages'].items(), key=lambda item: -item[1]['wall']):
+            logger.info(f"{name:<28}{totals['count']:>8}{totals['wall']:>12.3f}{totals['cpu']:>12.3f}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the CSP analysis pipeline on synthetic data.")
+    parser.add_argument('--scales', default='10,100,1000,5000',
+                        help="Comma separated universe sizes to benchmark (default: 10,100,1000,5000)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per scale, the median is reported")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic data")
+    parser.add_argument('--years', type=float, default=20, help="Years of daily history per ticker")
+    parser.add_argument('--strikes', type=int, default=60, help="Strikes per side of each option chain")
+    parser.add_argument('--expiries', type=int, default=8, help="Weekly expiries listed per ticker")
+    parser.add_argument('--output', help="Where to write the JSON results (default: RESULTS_DATA_DIR)")
+    parser.add_argument('--compare', help="Earlier benchmark JSON to check for regressions against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Allowed slowdown before a timing counts as a regression (default: 0.2 = 20%%)")
+    parser.add_argument('--min-seconds', type=float, default=0.01,
+                        help="Ignore baseline timings shorter than this when comparing")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    instrumentation.configure_logging()
+
+    for name, value in PINNED_CONFIG.items():
+        setattr(config, name, value)
+    output_dir = config.RESULTS_DATA_DIR or '.'
+
+    provider = SyntheticProvider(seed=args.seed, years=args.years, strikes=args.strikes, expiries=args.expiries)
+    scales = [int(scale) for scale in args.scales.split(',') if scale.strip()]
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'seed': args.seed,
+            'years': args.years,
+            'strikes': args.strikes,
+            'expiries': args.expiries,
+            'repeat': args.repeat,
+            'config': {name: getattr(config, name) for name in RECORDED_CONFIG}
+        },
+        'scales': {}
+    }
+
+    for ticker_count in scales:
+        logger.info(f"Benchmarking {ticker_count} tickers x {args.repeat} runs...")
+
+        # Per ticker progress messages would swamp the report
+        level = logger.level
+        logger.setLevel(max(level, logging.WARNING))
+        try:
+            results['scales'][str(ticker_count)] = benchmark_scale(provider, ticker_count, args.repeat)
+        finally:
+            logger.setLevel(level)
+
+    log_results(results)
+
+    output_path = args.output or os.path.join(output_dir, f"BENCHMARK_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Benchmark results written to {output_path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        regressions = find_regressions(baseline, results, args.threshold, args.min_seconds)
+        if regressions:
+            logger.error(f"-- {len(regressions)} REGRESSIONS OVER {args.threshold:.0%} vs {args.compare} --")
+            for scale, metric, old_wall, new_wall in regressions:
+                logger.error(f"{scale:>6} tickers  {metric:<28}{old_wall:>10.3f}s -> {new_wall:>10.3f}s "
+                             f"({new_wall / old_wall - 1:+.0%})")
+            return 1
+
+        logger.info(f"No regressions over {args.threshold:.0%} vs {args.compare}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
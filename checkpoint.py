@@ -0,0 +1,216 @@
+import glob
+import json
+import math
+import os
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import config
+from instrumentation import logger
+from stock_data_entry import RESULT_FIELDS, StockDataEntry
+
+MANIFEST_FILE = 'manifest.json'
+RESULTS_FILE = 'results.jsonl'
+FAILURES_FILE = 'failures.jsonl'
+
+# Settings a resumed run should be consistent with, recorded in the manifest
+MANIFEST_CONFIG = ['CSP_SAFETY_PCT', 'CASH_ON_HAND', 'DATA_PROVIDER', 'GREEKS_IV_SOURCE']
+
+
+class RunCheckpoint:
+    """
+    On-disk record of a universe run, so a run that dies part way through loses nothing and can be
+    resumed. Lives in its own RUN_<timestamp> directory under RESULTS_DATA_DIR:
+
+    manifest.json   the run's tickers and settings, progress counts and outstanding failures, rewritten as
+                    each ticker finishes
+    results.jsonl   one line per completed ticker, appended and flushed as soon as it finishes
+    failures.jsonl  one line per failed attempt with the reason
+
+    Parameters:
+    run_dir (str): Directory of the run.
+    """
+    def __init__(self, run_dir):
+        self.run_dir = run_dir
+        self.run_id = os.path.basename(os.path.normpath(run_dir))
+        self.manifest_path = os.path.join(run_dir, MANIFEST_FILE)
+        self.results_path = os.path.join(run_dir, RESULTS_FILE)
+        self.failures_path = os.path.join(run_dir, FAILURES_FILE)
+        self.manifest = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, tickers, results_dir=None):
+        # Start a new run for tickers
+        results_dir = results_dir or config.RESULTS_DATA_DIR
+        run_dir = os.path.join(results_dir, f"RUN_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}")
+        os.makedirs(run_dir)
+
+        checkpoint = cls(run_dir)
+        checkpoint.manifest = {
+            'run_id': checkpoint.run_id,
+            'started': _now(),
+            'updated': _now(),
+            'status': 'running',
+            'tickers': list(tickers),
+            'completed': 0,
+            'failed': 0,
+            'failures': {},
+            'config': {name: _json_value(getattr(config, name)) for name in MANIFEST_CONFIG}
+        }
+        checkpoint._write_manifest()
+        return checkpoint
+
+    @classmethod
+    def open(cls, run_id=None, results_dir=None):
+        """
+        Open an existing run to resume it.
+
+        Parameters:
+        run_id (str): Name of the RUN_ directory, or None for the most recent run.
+        results_dir (str): Directory the runs live in, RESULTS_DATA_DIR by default.
+
+        Returns:
+        RunCheckpoint: The run, with its manifest loaded.
+        """
+        results_dir = results_dir or config.RESULTS_DATA_DIR
+
+        if run_id is None:
+            run_dirs = sorted(glob.glob(os.path.join(results_dir, 'RUN_*')))
+            if not run_dirs:
+                raise FileNotFoundError(f"No runs to resume in {results_dir}")
+            run_dir = run_dirs[-1]
+        else:
+            run_dir = run_id if os.path.isdir(run_id) else os.path.join(results_dir, run_id)
+
+        checkpoint = cls(run_dir)
+        with open(checkpoint.manifest_path) as f:
+            checkpoint.manifest = json.load(f)
+
+        for path in (checkpoint.results_path, checkpoint.failures_path):
+            _truncate_partial_line(path)
+
+        for name, value in checkpoint.manifest['config'].items():
+            if _json_value(getattr(config, name)) != value:
+                logger.warning(f"{checkpoint.run_id}: {name} was {value} when the run started, now "
+                               f"{getattr(config, name)}")
+
+        return checkpoint
+
+    def completed_entries(self):
+        # Every ticker already in results.jsonl, rebuilt as Stock Data Entries (result fields only)
+        entries = {}
+        for record in _read_jsonl(self.results_path):
+            entries[record['ticker']] = entry_from_record(record)
+        return entries
+
+    def pending_tickers(self):
+        # Tickers not completed yet: never attempted, or failed last time and due a retry
+        completed = {record['ticker'] for record in _read_jsonl(self.results_path)}
+        return [ticker for ticker in self.manifest['tickers'] if ticker not in completed]
+
+    # The manifest is rewritten on every record (it is small), so a run that dies still shows its progress
+    def record_result(self, sde):
+        self._append(self.results_path, entry_to_record(sde))
+        with self._lock:
+            self.manifest['completed'] += 1
+            self.manifest['failures'].pop(sde.ticker, None)
+            self.manifest['failed'] = len(self.manifest['failures'])
+            self._write_manifest()
+
+    def record_failure(self, ticker, reason):
+        self._append(self.failures_path, {'ticker': ticker, 'time': _now(), 'reason': reason})
+        with self._lock:
+            self.manifest['failures'][ticker] = reason
+            self.manifest['failed'] = len(self.manifest['failures'])
+            self._write_manifest()
+
+    def finish(self):
+        # Counts are rebuilt from the files so they also cover earlier attempts of a resumed run
+        with self._lock:
+            self.manifest['completed'] = len(self.manifest['tickers']) - len(self.pending_tickers())
+            self.manifest['failed'] = len(self.manifest['failures'])
+            self.manifest['status'] = 'complete' if not self.manifest['failures'] else 'incomplete'
+            self._write_manifest()
+
+        logger.info(f"{self.run_id}: {self.manifest['completed']} completed, {self.manifest['failed']} failed "
+                    f"(checkpoint in {self.run_dir})")
+
+    def _append(self, path, record):
+        # One line per record, flushed straight away so a crash loses at most the ticker in flight
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            with open(path, 'a') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _write_manifest(self):
+        self.manifest['updated'] = _now()
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+
+def entry_to_record(sde):
+    # Result fields as plain JSON values: dates as ISO strings, missing values (None or NaN) as null
+    record = {}
+    for field, field_type in RESULT_FIELDS.items():
+        value = getattr(sde, field)
+        if value is None or (field_type != 'str' and pd.isna(value)):
+            record[field] = None
+        elif field_type == 'date':
+            record[field] = pd.Timestamp(value).date().isoformat()
+        else:
+            record[field] = _json_value(value)
+    return record
+
+
+def entry_from_record(record):
+    sde = StockDataEntry()
+    for field, field_type in RESULT_FIELDS.items():
+        value = record.get(field)
+        if value is not None and field_type == 'date':
+            value = pd.Timestamp(value)
+        setattr(sde, field, value)
+    return sde
+
+
+def _json_value(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def _read_jsonl(path):
+    if not os.path.exists(path):
+        return []
+
+    records = []
+    with open(path) as f:
+        for line in f:
+            # A run killed mid-write can leave a partial last line; that ticker is simply redone
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def _truncate_partial_line(path):
+    # Cut a line left half written by a killed run so the next append starts on a fresh line
+    if not os.path.exists(path):
+        return
+
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
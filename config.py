@@ -11,4 +11,113 @@ TICKERS = os.getenv("TICKERS", "AAPL,AMZN,GOOG,META,SPY").split(",")
 STOCK_DATA_DIR = os.getenv('STOCK_DATA_DIR')
 RESULTS_DATA_DIR = os.getenv('RESULTS_DATA_DIR')
 CASH_ON_HAND = np.float64(os.getenv('CASH_ON_HAND'))
+RESULTS_FORMATS = [f.strip().lower() for f in os.getenv('RESULTS_FORMATS', 'csv').split(',') if f.strip()]
 DOWNLOAD_TICKER_DATA_TO_CSV = os.getenv('DOWNLOAD_TICKER_DATA_TO_CSV', 'false').lower() in ['true', '1', 'yes']
+MAX_PAIN_TERM_STRUCTURE = os.getenv('MAX_PAIN_TERM_STRUCTURE', 'false').lower() in ['true', '1', 'yes']
+GREEKS_IV_SOURCE = os.getenv('GREEKS_IV_SOURCE', 'yfinance').lower()
+USE_HISTORY_CACHE = os.getenv('USE_HISTORY_CACHE', 'false').lower() in ['true', '1', 'yes']
+TA_INCREMENTAL = os.getenv('TA_INCREMENTAL', 'false').lower() in ['true', '1', 'yes']
+TA_VERIFY = os.getenv('TA_VERIFY', 'false').lower() in ['true', '1', 'yes']
+
+# Market data provider: yfinance, record (yfinance + save session to disk) or replay (serve a saved session)
+DATA_PROVIDER = os.getenv('DATA_PROVIDER', 'yfinance').lower()
+DATA_SESSION_DIR = os.getenv('DATA_SESSION_DIR', './recordedSessions')
+
+# Snapshot cache for expiries, option chains, the risk-free rate and spot prices (TTLs in seconds). Spot is only
+# fetched by the service's intraday option refresh; batch runs price against the last daily close.
+SNAPSHOT_CACHE = os.getenv('SNAPSHOT_CACHE', 'false').lower() in ['true', '1', 'yes']
+SNAPSHOT_CACHE_SIZE = int(os.getenv('SNAPSHOT_CACHE_SIZE', '4096'))
+SNAPSHOT_CACHE_DIR = os.getenv('SNAPSHOT_CACHE_DIR', '')
+SNAPSHOT_TTLS = {
+    'expiries': float(os.getenv('SNAPSHOT_TTL_EXPIRIES', '3600')),
+    'chain': float(os.getenv('SNAPSHOT_TTL_CHAIN', '300')),
+    'rate': float(os.getenv('SNAPSHOT_TTL_RATE', '3600')),
+    'spot': float(os.getenv('SNAPSHOT_TTL_SPOT', '60'))
+}
+
+# Logging and instrumentation: per stage timings and provider call sizes written as a trace
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+INSTRUMENT = os.getenv('INSTRUMENT', 'false').lower() in ['true', '1', 'yes']
+TRACE_FORMAT = os.getenv('TRACE_FORMAT', 'jsonl').lower()
+PROFILE = os.getenv('PROFILE', '').lower()
+
+# Stream each ticker's result to a RUN_<timestamp> directory as it completes, so `main.py --resume` can pick up
+# an interrupted run
+CHECKPOINT_RUNS = os.getenv('CHECKPOINT_RUNS', 'true').lower() in ['true', '1', 'yes']
+
+# Service mode (main.py --serve): local JSON API, option data refreshed every SERVICE_OPTIONS_INTERVAL seconds
+# during market hours (in SERVICE_MARKET_TZ) and the full analysis rerun after each close
+SERVICE_HOST = os.getenv('SERVICE_HOST', '127.0.0.1')
+SERVICE_PORT = int(os.getenv('SERVICE_PORT', '8765'))
+SERVICE_OPTIONS_INTERVAL = float(os.getenv('SERVICE_OPTIONS_INTERVAL', '300'))
+SERVICE_POLL_SECONDS = float(os.getenv('SERVICE_POLL_SECONDS', '30'))
+SERVICE_MARKET_TZ = os.getenv('SERVICE_MARKET_TZ', 'America/New_York')
+
+# Concurrent fetch settings
+MAX_CONCURRENT_TICKERS = int(os.getenv('MAX_CONCURRENT_TICKERS', '1'))
+FETCH_RATE_LIMIT = float(os.getenv('FETCH_RATE_LIMIT', '4'))
+FETCH_MAX_RETRIES = int(os.getenv('FETCH_MAX_RETRIES', '5'))
+HISTORY_BATCH_SIZE = int(os.getenv('HISTORY_BATCH_SIZE', '1'))
+
+# Independent analysis stages of one ticker (e.g. TA and metadata) run on this many threads
+STAGE_WORKERS = int(os.getenv('STAGE_WORKERS', '1'))
+
+# Filter on the history based result fields (see sde_prefilter), evaluated before option data is fetched; tickers
+# that fail it skip the option and profit stages and are marked pruned. Empty keeps every ticker. For example:
+# last_close_price > two_hundred_day_ma and 30 <= rsi <= 70 and tgt_strike * 100 <= CASH_ON_HAND and total_weeks >= 104
+PREFILTER = os.getenv('PREFILTER', '').strip()
+
+# Full chain CSP scanner settings
+SCAN_MODE = os.getenv('SCAN_MODE', 'false').lower() in ['true', '1', 'yes']
+SCAN_MIN_DTE = int(os.getenv('SCAN_MIN_DTE', '5'))
+SCAN_MAX_DTE = int(os.getenv('SCAN_MAX_DTE', '45'))
+SCAN_MIN_MONEYNESS = float(os.getenv('SCAN_MIN_MONEYNESS', '0.7'))
+SCAN_MAX_MONEYNESS = float(os.getenv('SCAN_MAX_MONEYNESS', '1.0'))
+SCAN_MIN_VOLUME = float(os.getenv('SCAN_MIN_VOLUME', '10'))
+SCAN_MIN_OPEN_INTEREST = float(os.getenv('SCAN_MIN_OPEN_INTEREST', '100'))
+SCAN_MAX_SPREAD_PCT = float(os.getenv('SCAN_MAX_SPREAD_PCT', 'inf'))
+SCAN_TOP_N = int(os.getenv('SCAN_TOP_N', '50'))
+SCAN_RANK_BY = os.getenv('SCAN_RANK_BY', 'annualized_yield')
+
+# Walk-forward backtest of the target strike rule (BACKTEST_WINDOW=0 uses every prior week, otherwise a rolling
+# window of that many weeks; BACKTEST_RATE is the risk free rate in percent for the premium proxy)
+BACKTEST_MODE = os.getenv('BACKTEST_MODE', 'false').lower() in ['true', '1', 'yes']
+BACKTEST_WINDOW = int(os.getenv('BACKTEST_WINDOW', '0'))
+BACKTEST_MIN_WEEKS = int(os.getenv('BACKTEST_MIN_WEEKS', '52'))
+BACKTEST_VOL_WEEKS = int(os.getenv('BACKTEST_VOL_WEEKS', '20'))
+BACKTEST_RATE = float(os.getenv('BACKTEST_RATE', '0'))
+
+# Parameter sweep: every combination of these values is evaluated per ticker and written to a SWEEP file.
+# Each list defaults to the single value of the normal run.
+SWEEP_MODE = os.getenv('SWEEP_MODE', 'false').lower() in ['true', '1', 'yes']
+SWEEP_SAFETY_PCTS = [np.float64(v) for v in os.getenv('SWEEP_SAFETY_PCTS', str(CSP_SAFETY_PCT)).split(',') if v.strip()]
+SWEEP_TIMEFRAMES = [int(v) for v in os.getenv('SWEEP_TIMEFRAMES', '5').split(',') if v.strip()]
+SWEEP_CASH_ON_HAND = [np.float64(v) for v in os.getenv('SWEEP_CASH_ON_HAND', str(CASH_ON_HAND)).split(',') if v.strip()]
+
+# Block bootstrap of the chance of assignment at the target strike and ASSIGNMENT_STRIKES 0.5% steps either side,
+# with an ASSIGNMENT_CI % confidence interval. ASSIGNMENT_VOL_SCALE rescales history to the current EWMA volatility.
+# Paths are drawn ASSIGNMENT_CHUNK_PATHS at a time with intermediate arrays kept under ASSIGNMENT_MAX_ELEMENTS.
+ASSIGNMENT_MODE = os.getenv('ASSIGNMENT_MODE', 'false').lower() in ['true', '1', 'yes']
+ASSIGNMENT_PATHS = int(os.getenv('ASSIGNMENT_PATHS', '20000'))
+ASSIGNMENT_BLOCK_WEEKS = int(os.getenv('ASSIGNMENT_BLOCK_WEEKS', '4'))
+ASSIGNMENT_STRIKES = int(os.getenv('ASSIGNMENT_STRIKES', '2'))
+ASSIGNMENT_CI = float(os.getenv('ASSIGNMENT_CI', '90'))
+ASSIGNMENT_VOL_SCALE = os.getenv('ASSIGNMENT_VOL_SCALE', 'false').lower() in ['true', '1', 'yes']
+ASSIGNMENT_VOL_LAMBDA = float(os.getenv('ASSIGNMENT_VOL_LAMBDA', '0.94'))
+ASSIGNMENT_SEED = int(os.getenv('ASSIGNMENT_SEED', '0'))
+ASSIGNMENT_CHUNK_PATHS = int(os.getenv('ASSIGNMENT_CHUNK_PATHS', '250'))
+ASSIGNMENT_MAX_ELEMENTS = int(os.getenv('ASSIGNMENT_MAX_ELEMENTS', '2000000'))
+
+# Size the target strike (and the assignment estimates) from overlapping returns over the trading days to the
+# chosen expiry instead of calendar-week returns. Horizons of 1 to HORIZON_MAX_DAYS trading days are computed up
+# front in one pass, longer ones (later expiries, SCAN_MAX_DTE, long sweep timeframes) when first needed.
+HORIZON_MODE = os.getenv('HORIZON_MODE', 'false').lower() in ['true', '1', 'yes']
+HORIZON_MAX_DAYS = int(os.getenv('HORIZON_MAX_DAYS', '15'))
+
+# Cross-sectional panel screen: every ticker's daily closes in one memory-mapped matrix, with the history based
+# result fields computed over column chunks of PANEL_CHUNK_SIZE tickers and written to a PANEL file
+PANEL_MODE = os.getenv('PANEL_MODE', 'false').lower() in ['true', '1', 'yes']
+PANEL_DIR = os.getenv('PANEL_DIR') or os.path.join(STOCK_DATA_DIR or '.', 'panel')
+PANEL_CHUNK_SIZE = int(os.getenv('PANEL_CHUNK_SIZE', '500'))
+# Recompute every ticker with the per ticker stages and fail the run if any panel field differs (slow, for checking)
+PANEL_VERIFY = os.getenv('PANEL_VERIFY', 'false').lower() in ['true', '1', 'yes']
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import data_providers
+import options_pricing
+import sde_csp_meta
+import sde_csp_options
+import horizon_returns
+import config
+
+SCAN_COLUMNS = ['ticker', 'expiry_date', 'days_to_expiry', 'strike', 'stock_price', 'moneyness', 'premium', 'bid',
+                'ask', 'spread_pct', 'volume', 'open_interest', 'implied_vol', 'delta', 'annualized_yield',
+                'pct_chance_assigned', 'max_contracts', 'total_premium']
+
+
+def scan_ticker_puts(sde):
+    """
+    Score every put inside the configured DTE and moneyness window for one ticker.
+
+    All expiries in the window are stacked into one DataFrame and every metric is computed as an array
+    operation over it, so scanning thousands of contracts costs little more than scanning one.
+
+    Parameters:
+    sde (StockDataEntry): An entry whose weekly history has already been analyzed.
+
+    Returns:
+    DataFrame: Candidate puts with SCAN_COLUMNS that pass the liquidity filters.
+    """
+    provider = data_providers.get_provider()
+    today = provider.get_session_date()
+
+    # Keep only the expiries inside the DTE window
+    expiry_dates = [expiry_date for expiry_date in provider.get_expiry_dates(sde.ticker)
+                    if config.SCAN_MIN_DTE <= (pd.Timestamp(expiry_date) - today).days <= config.SCAN_MAX_DTE]
+
+    if not expiry_dates:
+        return pd.DataFrame(columns=SCAN_COLUMNS)
+
+    stock_price = sde_csp_options.options_spot_price(sde)
+    current_rate = provider.get_risk_free_rate()
+
+    # Stack the put side of every expiry into one frame
+    puts = pd.concat([provider.get_option_chain(sde.ticker, expiry_date).puts.assign(expiry_date=expiry_date)
+                      for expiry_date in expiry_dates], ignore_index=True)
+    puts['days_to_expiry'] = (pd.to_datetime(puts['expiry_date']) - today).dt.days
+
+    # Moneyness window (strike as a fraction of the current price)
+    moneyness = puts['strike'].to_numpy(dtype=np.float64) / stock_price
+    puts = puts[(moneyness >= config.SCAN_MIN_MONEYNESS) & (moneyness <= config.SCAN_MAX_MONEYNESS)]
+
+    if puts.empty:
+        return pd.DataFrame(columns=SCAN_COLUMNS)
+
+    puts = options_pricing.add_chain_greeks(puts, stock_price, current_rate, puts['days_to_expiry'].to_numpy(),
+                                            option_type='put', iv_source=config.GREEKS_IV_SOURCE)
+
+    strikes = puts['strike'].to_numpy(dtype=np.float64)
+    days_to_expiry = puts['days_to_expiry'].to_numpy(dtype=np.float64)
+    bid = puts['bid'].to_numpy(dtype=np.float64)
+    ask = puts['ask'].to_numpy(dtype=np.float64)
+    premium = options_pricing.option_mid_prices(puts)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spread_pct = np.where((bid > 0) & (ask > 0), (ask - bid) / premium * 100, np.nan)
+        annualized_yield = premium / strikes * (365 / days_to_expiry) * 100
+
+    # Chance of assignment: how often the stock has historically closed a week below this strike, or in
+    # HORIZON_MODE how often it ended the trading days to the put's expiry below it
+    move_pcts = (strikes / stock_price - 1) * 100
+    if config.HORIZON_MODE:
+        pct_chance_assigned = np.empty(move_pcts.shape[0])
+        for expiry_date, rows in puts.groupby('expiry_date', sort=False).indices.items():
+            trading_days = horizon_returns.trading_days_to_expiry(sde.last_close_date, expiry_date)
+            pct_chance_assigned[rows] = sde.horizon_returns.pct_at_or_below(trading_days, move_pcts[rows])
+    else:
+        pct_chance_assigned = sde_csp_meta.calculate_pct_weeks_at_or_below(
+            sde.weekly_stats.returns_pct, move_pcts)
+
+    max_contracts = np.floor(config.CASH_ON_HAND / (strikes * 100))
+
+    candidates = pd.DataFrame({
+        'ticker': sde.ticker,
+        'expiry_date': puts['expiry_date'].to_numpy(),
+        'days_to_expiry': days_to_expiry.astype(np.int64),
+        'strike': strikes,
+        'stock_price': np.round(stock_price, 3),
+        'moneyness': np.round(strikes / stock_price, 4),
+        'premium': np.round(premium, 3),
+        'bid': bid,
+        'ask': ask,
+        'spread_pct': np.round(spread_pct, 2),
+        'volume': np.nan_to_num(puts['volume'].to_numpy(dtype=np.float64)),
+        'open_interest': np.nan_to_num(puts['openInterest'].to_numpy(dtype=np.float64)),
+        'implied_vol': puts['iv'].to_numpy(),
+        'delta': np.round(puts['delta'].to_numpy(), 3),
+        'annualized_yield': np.round(annualized_yield, 2),
+        'pct_chance_assigned': np.round(pct_chance_assigned, 2),
+        'max_contracts': max_contracts,
+        'total_premium': np.round(max_contracts * premium * 100, 2)
+    })
+
+    # Liquidity filters (a missing spread only passes when there is no spread limit)
+    liquid = ((candidates['volume'] >= config.SCAN_MIN_VOLUME) &
+              (candidates['open_interest'] >= config.SCAN_MIN_OPEN_INTEREST) &
+              (candidates['max_contracts'] >= 1) &
+              ((candidates['spread_pct'] <= config.SCAN_MAX_SPREAD_PCT) | np.isinf(config.SCAN_MAX_SPREAD_PCT)))
+
+    return candidates[liquid].reset_index(drop=True)
+
+
+def rank_candidates(sde_results, top_n=None, rank_by=None):
+    # Merge every ticker's candidates and keep the best top_n across the whole universe
+    top_n = config.SCAN_TOP_N if top_n is None else top_n
+    rank_by = config.SCAN_RANK_BY if rank_by is None else rank_by
+
+    scans = [result.df_scan for result in sde_results if result.df_scan is not None and not result.df_scan.empty]
+
+    if not scans:
+        return pd.DataFrame(columns=['rank'] + SCAN_COLUMNS)
+
+    ranked = pd.concat(scans, ignore_index=True)
+    ranked = ranked.sort_values(by=[rank_by, 'ticker', 'expiry_date', 'strike'],
+                                ascending=[False, True, True, True], kind='stable').head(top_n)
+    ranked.insert(0, 'rank', np.arange(1, len(ranked) + 1))
+
+    return ranked.reset_index(drop=True)
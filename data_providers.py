@@ -0,0 +1,410 @@
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+import pandas as pd
+import utilities as ut
+import config
+from snapshot_cache import SnapshotCache
+from instrumentation import logger, get_tracer
+from rate_limiter import limiter, get_shared_session
+
+# Same shape as the object yfinance returns from Ticker.option_chain
+OptionChain = namedtuple('OptionChain', ['calls', 'puts'])
+
+
+class MarketDataProvider:
+    """
+    Interface every market data source implements. The sde_* modules and the fetch pipeline only ever
+    talk to a provider, so data vendors can be swapped without touching the analysis code.
+    """
+    name = 'base'
+
+    def get_price_history(self, ticker, start=None):
+        """Daily OHLCV DataFrame indexed by a tz-naive 'Date', from start (or the full history)."""
+        raise NotImplementedError
+
+    def get_price_histories(self, tickers, start=None):
+        """
+        Price history for many tickers at once, as a dict of ticker -> DataFrame.
+        Tickers that could not be fetched are left out so callers can retry them one at a time.
+        """
+        histories = {}
+        for ticker in tickers:
+            try:
+                histories[ticker] = self.get_price_history(ticker, start=start)
+            except Exception as e:
+                logger.warning("%s: price history fetch failed - %s: %s", ticker, type(e).__name__, e)
+
+        return histories
+
+    def get_expiry_dates(self, ticker):
+        """List of option expiration dates as 'YYYY-MM-DD' strings, nearest first."""
+        raise NotImplementedError
+
+    def get_option_chain(self, ticker, expiry_date):
+        """OptionChain of calls and puts DataFrames for one expiration date."""
+        raise NotImplementedError
+
+    def get_last_price(self, ticker):
+        """Most recent traded price of the ticker."""
+        raise NotImplementedError
+
+    def get_risk_free_rate(self):
+        """Current 3-month Treasury bill rate, in percent."""
+        raise NotImplementedError
+
+    def get_session_date(self):
+        """The date the data is as of, used in place of 'today' for expiry math."""
+        return pd.Timestamp.today().normalize()
+
+
+class YFinanceProvider(MarketDataProvider):
+    name = 'yfinance'
+
+    def _ticker(self, ticker):
+        import yfinance as yf
+        return yf.Ticker(ticker, session=get_shared_session())
+
+    def get_price_history(self, ticker, start=None):
+        # yf.download keeps its results in module level state, so it is not safe to call from several
+        # threads at once. Ticker.history returns the same adjusted OHLCV data without that shared state.
+        ticker_data = self._ticker(ticker)
+
+        if start is None:
+            df = limiter.call(ticker_data.history, period="max", auto_adjust=True)
+        else:
+            df = limiter.call(ticker_data.history, start=start, auto_adjust=True)
+
+        return _normalize_history(df)
+
+    def get_price_histories(self, tickers, start=None):
+        # One yf.download request per chunk of tickers instead of one per symbol. yf.download is not
+        # thread safe, so this must only run while no other fetch threads are active.
+        import yfinance as yf
+
+        histories = {}
+        batch_size = max(1, config.HISTORY_BATCH_SIZE)
+
+        for chunk_start in range(0, len(tickers), batch_size):
+            chunk = list(tickers[chunk_start:chunk_start + batch_size])
+            period_kwargs = {'period': 'max'} if start is None else {'start': start}
+
+            try:
+                df = limiter.call(yf.download, chunk, group_by='ticker', auto_adjust=True, threads=True,
+                                  progress=False, session=get_shared_session(), **period_kwargs)
+            except Exception as e:
+                logger.warning("Bulk history download failed for %s tickers - %s: %s", len(chunk),
+                               type(e).__name__, e)
+                continue
+
+            if df is None or df.empty:
+                continue
+
+            # Split the column MultiIndex (ticker, field) into one frame per ticker. Every ticker shares
+            # the union of all dates, so rows from before a ticker listed are dropped again.
+            tickers_found = set(df.columns.get_level_values(0)) if isinstance(df.columns, pd.MultiIndex) else set()
+            for ticker in chunk:
+                if ticker not in tickers_found:
+                    continue
+
+                ticker_df = df[ticker].dropna(how='all')
+                if not ticker_df.empty:
+                    histories[ticker] = _normalize_history(ticker_df)
+
+        return histories
+
+    def get_expiry_dates(self, ticker):
+        ticker_data = self._ticker(ticker)
+        return list(limiter.call(lambda: ticker_data.options))
+
+    def get_option_chain(self, ticker, expiry_date):
+        options_chain = limiter.call(self._ticker(ticker).option_chain, expiry_date)
+        return OptionChain(options_chain.calls, options_chain.puts)
+
+    def get_last_price(self, ticker):
+        return float(limiter.call(self._ticker(ticker).history, period="1d")["Close"].iloc[0])
+
+    def get_risk_free_rate(self):
+        return self.get_last_price("^IRX")
+
+
+class RecordingProvider(MarketDataProvider):
+    """
+    Passes every call through to another provider and saves each response under session_dir, so the
+    session can be served back later by a ReplayProvider.
+    """
+    name = 'record'
+
+    def __init__(self, provider, session_dir):
+        self.provider = provider
+        self.session_dir = session_dir
+        os.makedirs(session_dir, exist_ok=True)
+
+        # Freeze the session date so replays do expiry math against the day the data was captured
+        self.session_date = provider.get_session_date()
+        _write_json(os.path.join(session_dir, 'session.json'), {'session_date': str(self.session_date.date())})
+
+    def get_price_history(self, ticker, start=None):
+        df = self.provider.get_price_history(ticker, start=start)
+        ut.write_frame_atomic(df, _history_path(self.session_dir, ticker, start))
+        return df
+
+    def get_price_histories(self, tickers, start=None):
+        histories = self.provider.get_price_histories(tickers, start=start)
+        for ticker, df in histories.items():
+            ut.write_frame_atomic(df, _history_path(self.session_dir, ticker, start))
+        return histories
+
+    def get_expiry_dates(self, ticker):
+        expiry_dates = self.provider.get_expiry_dates(ticker)
+        _write_json(_json_path(self.session_dir, 'expiries', ticker), expiry_dates)
+        return expiry_dates
+
+    def get_option_chain(self, ticker, expiry_date):
+        options_chain = self.provider.get_option_chain(ticker, expiry_date)
+        ut.write_frame_atomic(options_chain.calls, _chain_path(self.session_dir, ticker, expiry_date, 'calls'))
+        ut.write_frame_atomic(options_chain.puts, _chain_path(self.session_dir, ticker, expiry_date, 'puts'))
+        return options_chain
+
+    def get_last_price(self, ticker):
+        last_price = self.provider.get_last_price(ticker)
+        _write_json(_json_path(self.session_dir, 'last_price', ticker), last_price)
+        return last_price
+
+    def get_risk_free_rate(self):
+        rate = self.provider.get_risk_free_rate()
+        _write_json(_json_path(self.session_dir, 'rate', 'risk_free'), rate)
+        return rate
+
+    def get_session_date(self):
+        return self.session_date
+
+
+class ReplayProvider(MarketDataProvider):
+    """Serves a session captured by RecordingProvider back from disk without touching the network."""
+    name = 'replay'
+
+    def __init__(self, session_dir):
+        self.session_dir = session_dir
+
+        session_info = _read_json(os.path.join(session_dir, 'session.json'))
+        self.session_date = pd.Timestamp(session_info['session_date'])
+
+    def get_price_history(self, ticker, start=None):
+        df = ut.read_frame(_history_path(self.session_dir, ticker, start))
+        if df is not None:
+            return df
+
+        # Fall back to slicing the recorded full history when this exact request was not captured
+        df = ut.read_frame(_history_path(self.session_dir, ticker, None))
+        if df is None:
+            raise LookupError(f"No recorded price history for {ticker} in {self.session_dir}")
+
+        return df if start is None else df[df.index >= pd.Timestamp(start)]
+
+    def get_expiry_dates(self, ticker):
+        return _read_json(_json_path(self.session_dir, 'expiries', ticker))
+
+    def get_option_chain(self, ticker, expiry_date):
+        calls = ut.read_frame(_chain_path(self.session_dir, ticker, expiry_date, 'calls'))
+        puts = ut.read_frame(_chain_path(self.session_dir, ticker, expiry_date, 'puts'))
+
+        if calls is None or puts is None:
+            raise LookupError(f"No recorded option chain for {ticker} {expiry_date} in {self.session_dir}")
+
+        return OptionChain(calls, puts)
+
+    def get_last_price(self, ticker):
+        return _read_json(_json_path(self.session_dir, 'last_price', ticker))
+
+    def get_risk_free_rate(self):
+        return _read_json(_json_path(self.session_dir, 'rate', 'risk_free'))
+
+    def get_session_date(self):
+        return self.session_date
+
+
+class CachingProvider(MarketDataProvider):
+    """
+    Memoizes the snapshot calls of another provider (expiries, chains, risk-free rate and spot) with a
+    TTL per data type, so reruns only go back to the source for data that has actually expired.
+    Price history is left to the history cache.
+    """
+    name = 'cached'
+
+    def __init__(self, provider, cache, ttls):
+        self.provider = provider
+        self.cache = cache
+        self.ttls = ttls
+
+    def get_price_history(self, ticker, start=None):
+        return self.provider.get_price_history(ticker, start=start)
+
+    def get_price_histories(self, tickers, start=None):
+        return self.provider.get_price_histories(tickers, start=start)
+
+    def get_expiry_dates(self, ticker):
+        return self.cache.get_or_fetch('expiries', ticker, self.ttls['expiries'],
+                                       lambda: self.provider.get_expiry_dates(ticker))
+
+    def get_option_chain(self, ticker, expiry_date):
+        return self.cache.get_or_fetch('chain', f"{ticker}_{expiry_date}", self.ttls['chain'],
+                                       lambda: self.provider.get_option_chain(ticker, expiry_date))
+
+    def get_last_price(self, ticker):
+        return self.cache.get_or_fetch('spot', ticker, self.ttls['spot'],
+                                       lambda: self.provider.get_last_price(ticker))
+
+    def get_risk_free_rate(self):
+        return self.cache.get_or_fetch('rate', 'risk_free', self.ttls['rate'], self.provider.get_risk_free_rate)
+
+    def get_session_date(self):
+        return self.provider.get_session_date()
+
+
+class InstrumentedProvider(MarketDataProvider):
+    """Times every call to another provider and records how many rows and bytes it returned."""
+    name = 'instrumented'
+
+    def __init__(self, provider, tracer):
+        self.provider = provider
+        self.tracer = tracer
+
+    def _timed(self, method, ticker, fetch_fn):
+        start = time.perf_counter()
+        result = fetch_fn()
+        rows, nbytes = _payload_size(result)
+        self.tracer.record_fetch(self.provider.name, method, ticker, time.perf_counter() - start, rows, nbytes)
+        return result
+
+    def get_price_history(self, ticker, start=None):
+        return self._timed('get_price_history', ticker, lambda: self.provider.get_price_history(ticker, start=start))
+
+    def get_price_histories(self, tickers, start=None):
+        return self._timed('get_price_histories', None,
+                           lambda: self.provider.get_price_histories(tickers, start=start))
+
+    def get_expiry_dates(self, ticker):
+        return self._timed('get_expiry_dates', ticker, lambda: self.provider.get_expiry_dates(ticker))
+
+    def get_option_chain(self, ticker, expiry_date):
+        return self._timed('get_option_chain', ticker, lambda: self.provider.get_option_chain(ticker, expiry_date))
+
+    def get_last_price(self, ticker):
+        return self._timed('get_last_price', ticker, lambda: self.provider.get_last_price(ticker))
+
+    def get_risk_free_rate(self):
+        return self._timed('get_risk_free_rate', None, self.provider.get_risk_free_rate)
+
+    def get_session_date(self):
+        return self.provider.get_session_date()
+
+
+def _payload_size(result):
+    # (rows, bytes) of whatever a provider call returned
+    if isinstance(result, pd.DataFrame):
+        return len(result), int(result.memory_usage(deep=True).sum())
+    if isinstance(result, OptionChain):
+        sizes = [_payload_size(side) for side in result]
+        return sum(size[0] for size in sizes), sum(size[1] for size in sizes)
+    if isinstance(result, dict):
+        sizes = [_payload_size(value) for value in result.values()]
+        return sum(size[0] for size in sizes), sum(size[1] for size in sizes)
+    if isinstance(result, list):
+        return len(result), sum(len(str(value)) for value in result)
+    return 1, 8
+
+
+def _normalize_history(df):
+    # Daily OHLCV only, indexed by a tz-naive 'Date'
+    if df.empty:
+        return df
+
+    df = df[['Open', 'High', 'Low', 'Close', 'Volume']]
+    if df.index.tz is not None:
+        df.index = df.index.tz_localize(None)
+    df.index.name = 'Date'
+
+    return df
+
+
+def _history_path(session_dir, ticker, start):
+    name = ticker if start is None else f"{ticker}_{pd.Timestamp(start):%Y%m%d}"
+    return ut.frame_file_path(_sub_dir(session_dir, 'history'), name)
+
+
+def _chain_path(session_dir, ticker, expiry_date, side):
+    return ut.frame_file_path(_sub_dir(session_dir, 'chains'), f"{ticker}_{expiry_date}_{side}")
+
+
+def _json_path(session_dir, kind, key):
+    return os.path.join(_sub_dir(session_dir, kind), f"{key}.json")
+
+
+def _sub_dir(session_dir, kind):
+    path = os.path.join(session_dir, kind)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _write_json(path, data):
+    # Shared files like rate/risk_free.json are written by several ticker threads, so each gets its own temp file
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    if not os.path.exists(path):
+        raise LookupError(f"No recorded data at {path}")
+
+    with open(path) as f:
+        return json.load(f)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def build_provider(name, session_dir=None):
+    session_dir = session_dir or config.DATA_SESSION_DIR
+
+    if name == 'yfinance':
+        provider = YFinanceProvider()
+    elif name == 'record':
+        provider = RecordingProvider(YFinanceProvider(), session_dir)
+    elif name == 'replay':
+        provider = ReplayProvider(session_dir)
+    else:
+        raise ValueError(f"Unknown DATA_PROVIDER '{name}', expected one of: yfinance, record, replay")
+
+    # Instrument underneath the cache so only real fetches are counted
+    if get_tracer() is not None:
+        provider = InstrumentedProvider(provider, get_tracer())
+
+    if config.SNAPSHOT_CACHE:
+        cache = SnapshotCache(config.SNAPSHOT_CACHE_SIZE, config.SNAPSHOT_CACHE_DIR or None)
+        provider = CachingProvider(provider, cache, config.SNAPSHOT_TTLS)
+
+    return provider
+
+
+def get_provider():
+    # One provider is shared by every ticker in the run, built from DATA_PROVIDER on first use
+    global _provider
+
+    with _provider_lock:
+        if _provider is None:
+            _provider = build_provider(config.DATA_PROVIDER)
+
+    return _provider
+
+
+def set_provider(provider):
+    global _provider
+
+    with _provider_lock:
+        _provider = provider
@@ -0,0 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor
+import utilities as ut
+import history_cache
+import data_providers
+import config
+from instrumentation import logger, stage
+from stock_data_entry import StockDataEntry
+
+
+def prefetch_price_histories(tickers):
+    # Bulk download stage: fetch the histories of a batch of tickers in one provider call
+    provider = data_providers.get_provider()
+
+    with stage('prefetch_histories'):
+        if config.USE_HISTORY_CACHE:
+            histories = history_cache.load_price_histories(tickers, provider)
+        else:
+            histories = provider.get_price_histories(tickers)
+
+    # Empty or missing tickers are retried one at a time by analyze_ticker
+    return {ticker: df for ticker, df in histories.items() if not df.empty}
+
+
+def analyze_ticker(ticker, df=None, keep_frames=False):
+    provider = data_providers.get_provider()
+
+    with stage('fetch_history', ticker):
+        # Only fetched when run_universe did not already bulk download it
+        if df is None:
+            df = (history_cache.load_price_history(ticker, provider.get_price_history) if config.USE_HISTORY_CACHE
+                  else provider.get_price_history(ticker))
+
+    if df.empty:
+        logger.warning("NO Data Found for Ticker: %s", ticker)
+        return None
+
+    if config.DOWNLOAD_TICKER_DATA_TO_CSV:
+        ut.download_stock_data_csv(ticker, df)
+
+    # Resample data to weekly instead of daily
+    with stage('resample_weekly', ticker):
+        df_weekly = ut.resample_data_to_weekly(df)
+
+    # Calculate Weekly Analysis Data And get final results
+    final_ticker_entry = StockDataEntry()
+    final_ticker_entry.calculate_all_data_fields(ticker, df, df_weekly, memoize=keep_frames)
+
+    # Score every put in the scan window, not just the one nearest the target strike (pruned tickers are not
+    # worth their option chains here either)
+    if config.SCAN_MODE and not final_ticker_entry.pruned:
+        import csp_scanner
+        with stage('csp_scanner', ticker):
+            final_ticker_entry.df_scan = csp_scanner.scan_ticker_puts(final_ticker_entry)
+
+    # How the target strike rule would have done on this ticker's history
+    if config.BACKTEST_MODE:
+        import backtest
+        with stage('backtest', ticker):
+            final_ticker_entry.df_backtest = backtest.backtest_ticker(final_ticker_entry)
+
+    # Bootstrap distribution of the chance of assignment at and around the target strike
+    if config.ASSIGNMENT_MODE:
+        import assignment_bootstrap
+        with stage('assignment_bootstrap', ticker):
+            final_ticker_entry.df_assignment = assignment_bootstrap.assignment_ticker(final_ticker_entry)
+
+    # Every parameter combination, reusing the history, weekly stats, TA and option chains loaded above
+    if config.SWEEP_MODE and not final_ticker_entry.pruned:
+        import parameter_sweep
+        with stage('parameter_sweep', ticker):
+            final_ticker_entry.df_sweep = parameter_sweep.sweep_ticker(final_ticker_entry, config.SWEEP_SAFETY_PCTS,
+                                                                       config.SWEEP_TIMEFRAMES,
+                                                                       config.SWEEP_CASH_ON_HAND)
+
+    # Only the result fields are needed from here on, so let the price history go (unless the caller will
+    # refresh the entry later)
+    if not keep_frames:
+        final_ticker_entry.release_frames()
+
+    # Analyze Next Ticker
+    logger.info("%s: CSP Analysis Complete", ticker)
+    return final_ticker_entry
+
+
+def _analyze_ticker_safely(ticker, df=None, keep_frames=False):
+    # A single bad ticker should never take the rest of the run down with it. Returns the entry, or None
+    # and the reason it failed.
+    try:
+        with stage('ticker_total', ticker):
+            entry = analyze_ticker(ticker, df, keep_frames)
+    except Exception as e:
+        logger.error("%s: CSP Analysis FAILED - %s: %s", ticker, type(e).__name__, e)
+        return None, f"{type(e).__name__}: {e}"
+
+    if entry is None:
+        return None, "No price history found"
+    return entry, None
+
+
+def run_universe(tickers, max_workers=1, checkpoint=None, keep_frames=False):
+    """
+    Analyze every ticker and return the completed Stock Data Entries in the same order as tickers.
+
+    Parameters:
+    tickers (list): Ticker symbols to analyze.
+    max_workers (int): How many tickers are fetched and analyzed at once (1 runs sequentially).
+    checkpoint (RunCheckpoint): If given, each ticker's result or failure is written to it as it finishes.
+    keep_frames (bool): Keep each entry's price history and weekly stats instead of releasing them.
+
+    Returns:
+    list: StockDataEntry objects for the tickers that completed; failed or empty tickers are left out.
+    """
+    histories = {}
+
+    def analyze(ticker):
+        # Hand over the prefetched history and drop our reference so it can be freed once analyzed
+        entry, failure_reason = _analyze_ticker_safely(ticker, histories.pop(ticker, None), keep_frames)
+
+        if checkpoint is not None:
+            if entry is not None:
+                checkpoint.record_result(entry)
+            else:
+                checkpoint.record_failure(ticker, failure_reason)
+
+        return entry
+
+    # With bulk downloads, tickers go through in batches of HISTORY_BATCH_SIZE: a batch is analyzed (and its
+    # histories released) while the next one downloads, so at most two batches of history are held at a time
+    # and results are checkpointed from the first batch on
+    batch_size = config.HISTORY_BATCH_SIZE if config.HISTORY_BATCH_SIZE > 1 else max(len(tickers), 1)
+    batches = [tickers[start:start + batch_size] for start in range(0, len(tickers), batch_size)]
+
+    results = []
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch') as prefetcher, \
+            ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix='ticker') as executor:
+        next_histories = None
+        if config.HISTORY_BATCH_SIZE > 1 and batches:
+            next_histories = prefetcher.submit(prefetch_price_histories, batches[0])
+
+        for index, batch in enumerate(batches):
+            if next_histories is not None:
+                histories.update(next_histories.result())
+                next_histories = None
+                if index + 1 < len(batches):
+                    next_histories = prefetcher.submit(prefetch_price_histories, batches[index + 1])
+
+            if max_workers <= 1:
+                results.extend(analyze(ticker) for ticker in batch)
+            else:
+                # executor.map hands results back in submission order, so output is deterministic
+                results.extend(executor.map(analyze, batch))
+
+    return [result for result in results if result is not None]
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import utilities as ut
+import config
+from instrumentation import logger
+
+# Number of already cached bars that are fetched again on every update, used to spot split and
+# dividend adjustments that rewrite history
+OVERLAP_BARS = 5
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+
+
+def history_cache_path(ticker):
+    return ut.frame_file_path(config.STOCK_DATA_DIR, f"{ticker}_history")
+
+
+def load_price_history(ticker, fetch_fn):
+    """
+    Load a ticker's daily OHLCV history from the local cache, fetching only the bars it is missing.
+
+    Parameters:
+    ticker (str): The ticker symbol.
+    fetch_fn (callable): fetch_fn(ticker, start=None) returning the adjusted daily OHLCV DataFrame.
+
+    Returns:
+    DataFrame: The full daily history, identical to what a full download would return.
+    """
+    path = history_cache_path(ticker)
+    cached = ut.read_frame(path)
+
+    if cached is None or cached.empty:
+        return _refresh_full_history(ticker, fetch_fn, path)
+
+    # Re-request a few bars we already have so adjusted prices can be compared
+    new_bars = fetch_fn(ticker, start=_overlap_start(cached))
+
+    return _merge_new_bars(ticker, cached, new_bars, fetch_fn, path)
+
+
+def load_price_histories(tickers, provider):
+    """
+    Bulk version of load_price_history: cold tickers share one full history request and warm tickers
+    share one request for their recent bars, instead of one request per ticker.
+
+    Parameters:
+    tickers (list): Ticker symbols to load.
+    provider (MarketDataProvider): Provider whose get_price_histories does the bulk fetch.
+
+    Returns:
+    dict: Ticker -> full daily history. Tickers the bulk fetch missed are left out.
+    """
+    cached = {ticker: ut.read_frame(history_cache_path(ticker)) for ticker in tickers}
+    cold_tickers = [ticker for ticker in tickers if cached[ticker] is None or cached[ticker].empty]
+    warm_tickers = [ticker for ticker in tickers if ticker not in cold_tickers]
+
+    histories = {}
+
+    for ticker, df in provider.get_price_histories(cold_tickers).items():
+        if not df.empty:
+            ut.write_frame_atomic(df, history_cache_path(ticker))
+        histories[ticker] = df
+
+    if warm_tickers:
+        # One request from the earliest overlap start, then each ticker keeps only its own overlap
+        overlap_starts = {ticker: _overlap_start(cached[ticker]) for ticker in warm_tickers}
+        new_histories = provider.get_price_histories(warm_tickers, start=min(overlap_starts.values()))
+
+        for ticker, new_bars in new_histories.items():
+            new_bars = new_bars[new_bars.index >= overlap_starts[ticker]]
+            histories[ticker] = _merge_new_bars(ticker, cached[ticker], new_bars, provider.get_price_history,
+                                                history_cache_path(ticker))
+
+    return histories
+
+
+def _overlap_start(cached):
+    return cached.index[max(0, len(cached) - OVERLAP_BARS)]
+
+
+def _merge_new_bars(ticker, cached, new_bars, fetch_fn, path):
+    if new_bars.empty:
+        return cached
+
+    if history_was_adjusted(cached, new_bars):
+        logger.info("%s: cached history was adjusted (split or dividend), refreshing full history", ticker)
+        return _refresh_full_history(ticker, fetch_fn, path)
+
+    # The last cached bar may have been a partial session, so it is always replaced by the fresh copy
+    last_cached_date = cached.index[-1]
+    new_bars = new_bars[new_bars.index >= last_cached_date]
+    df = pd.concat([cached[cached.index < last_cached_date], new_bars])
+
+    ut.write_frame_atomic(df, path)
+    return df
+
+
+def history_was_adjusted(cached, new_bars):
+    # Compare every re-fetched bar except the last cached one, which may have still been trading
+    overlap_dates = cached.index[:-1].intersection(new_bars.index)
+
+    if overlap_dates.empty:
+        # No overlap means the cache is too far behind to be checked, so treat it as stale
+        return True
+
+    cached_prices = cached.loc[overlap_dates, PRICE_COLUMNS].to_numpy(dtype=float)
+    new_prices = new_bars.loc[overlap_dates, PRICE_COLUMNS].to_numpy(dtype=float)
+
+    return not np.allclose(cached_prices, new_prices, rtol=1e-6, equal_nan=True)
+
+
+def _refresh_full_history(ticker, fetch_fn, path):
+    df = fetch_fn(ticker)
+
+    if not df.empty:
+        ut.write_frame_atomic(df, path)
+
+    return df
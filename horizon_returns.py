@@ -0,0 +1,86 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import sde_csp_meta
+
+
+class HorizonReturns:
+    """
+    Overlapping forward returns over any horizon in trading days, from the daily closes.
+
+    Horizons of 1 to max_days come out of one strided pass: a sliding window view of max_days + 1 closes
+    starting at every bar, divided by its first close. Longer horizons are computed on their own when first
+    asked for, so a holding period is never cut short. Each horizon's sorted returns, and every target strike
+    solved from them, are then cached, so pricing several expiries of a ticker only costs the first sort of
+    each horizon.
+
+    Parameters:
+    closes (array): Daily closes, oldest first.
+    max_days (int): Longest horizon computed up front in the strided pass.
+    """
+    def __init__(self, closes, max_days):
+        self.closes = np.asarray(closes, dtype=np.float64)
+        self.max_days = max_days
+
+        # Column h - 1 holds the return over h trading days from each close, NaN within h bars of the end
+        padded = np.concatenate([self.closes, np.full(max_days, np.nan)])
+        windows = sliding_window_view(padded, max_days + 1)[:self.closes.shape[0]]
+        self.returns_pct = (windows[:, 1:] / windows[:, :1] - 1) * 100
+
+        self._sorted_returns = {}
+        self._targets = {}
+
+    def horizon(self, trading_days):
+        # Horizon used for a holding period: at least one day (an expiry on the last close date)
+        return int(max(trading_days, 1))
+
+    def returns(self, trading_days):
+        """
+        Returns in percent over a holding period, one per starting bar that has a close that many days later.
+
+        Parameters:
+        trading_days (int): Holding period in trading days.
+
+        Returns:
+        array: Overlapping returns in percent, oldest first.
+        """
+        horizon = self.horizon(trading_days)
+        if horizon > self.max_days:
+            return (self.closes[horizon:] / self.closes[:-horizon] - 1) * 100
+
+        column = self.returns_pct[:, horizon - 1]
+        return column[~np.isnan(column)]
+
+    def sorted_returns(self, trading_days):
+        horizon = self.horizon(trading_days)
+        if horizon not in self._sorted_returns:
+            self._sorted_returns[horizon] = np.sort(self.returns(horizon))
+        return self._sorted_returns[horizon]
+
+    def target(self, trading_days, safety_pct):
+        """
+        Target strike % and % chance assigned for a holding period, with the rule calculate_tgt_strike_pct_data
+        applies to weekly returns.
+
+        Parameters:
+        trading_days (int): Holding period in trading days.
+        safety_pct (float): Safety percentage.
+
+        Returns:
+        tuple: Target strike % and % chance assigned.
+        """
+        key = (self.horizon(trading_days), safety_pct)
+        if key not in self._targets:
+            self._targets[key] = sde_csp_meta.calculate_tgt_strike_pct_data(self.sorted_returns(trading_days),
+                                                                            safety_pct)
+        return self._targets[key]
+
+    def pct_at_or_below(self, trading_days, move_pcts):
+        # Historical % of holding periods that ended at or below each move %, the horizon's chance of assignment
+        sorted_returns = self.sorted_returns(trading_days)
+        return sde_csp_meta.calculate_pct_weeks_at_or_below(sorted_returns, move_pcts)
+
+
+def trading_days_to_expiry(last_close_date, expiry_date):
+    # Trading days a put sold at the last close is held: every weekday after it up to and including the expiry
+    # (exchange holidays are not tracked, so a holiday week counts one day too many)
+    return int(np.busday_count(np.datetime64(last_close_date, 'D') + 1, np.datetime64(expiry_date, 'D') + 1))
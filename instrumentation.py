@@ -0,0 +1,234 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+import config
+
+# Structured logger every module logs through instead of print. LOG_LEVEL=WARNING silences the
+# per-ticker progress messages. Per-ticker and DEBUG calls pass their values as %-style arguments, so a
+# message below the level is skipped without being formatted.
+logger = logging.getLogger('csp_options_analyzer')
+
+
+def configure_logging(level=None):
+    level = level or config.LOG_LEVEL
+
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+class Tracer:
+    """
+    Collects per stage, per ticker wall and CPU timings plus per provider call fetch sizes.
+
+    CPU time is the calling thread's own CPU time, so stages running on the thread pool are not
+    charged for each other's work.
+    """
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name, ticker=None):
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            self._add({
+                'type': 'stage',
+                'name': name,
+                'ticker': ticker,
+                'start': start_wall - self.origin,
+                'wall': time.perf_counter() - start_wall,
+                'cpu': time.thread_time() - start_cpu,
+                'thread': threading.current_thread().name
+            })
+
+    def record_fetch(self, provider, method, ticker, wall, rows, nbytes):
+        self._add({
+            'type': 'fetch',
+            'name': f"{provider}.{method}",
+            'ticker': ticker,
+            'start': time.perf_counter() - wall - self.origin,
+            'wall': wall,
+            'rows': rows,
+            'bytes': nbytes,
+            'thread': threading.current_thread().name
+        })
+
+    def _add(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def write_jsonl(self, path):
+        with open(path, 'w') as f:
+            for event in self.events:
+                f.write(json.dumps(event) + '\n')
+        return path
+
+    def write_chrome_trace(self, path):
+        # Chrome trace event format, viewable in chrome://tracing or Perfetto
+        thread_ids = {}
+        trace_events = []
+
+        for event in self.events:
+            tid = thread_ids.setdefault(event['thread'], len(thread_ids) + 1)
+            args = {key: value for key, value in event.items() if key not in ('name', 'start', 'wall', 'thread')}
+            trace_events.append({
+                'name': event['name'],
+                'cat': event['type'],
+                'ph': 'X',
+                'ts': event['start'] * 1e6,
+                'dur': event['wall'] * 1e6,
+                'pid': os.getpid(),
+                'tid': tid,
+                'args': args
+            })
+
+        for thread_name, tid in thread_ids.items():
+            trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+                                 'args': {'name': thread_name}})
+
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': trace_events}, f)
+        return path
+
+    def summary(self):
+        # Totals per stage and per provider call
+        stages = defaultdict(lambda: {'count': 0, 'wall': 0.0, 'cpu': 0.0})
+        fetches = defaultdict(lambda: {'count': 0, 'wall': 0.0, 'rows': 0, 'bytes': 0})
+
+        for event in self.events:
+            if event['type'] == 'stage':
+                totals = stages[event['name']]
+                totals['cpu'] += event['cpu']
+            else:
+                totals = fetches[event['name']]
+                totals['rows'] += event['rows']
+                totals['bytes'] += event['bytes']
+
+            totals['count'] += 1
+            totals['wall'] += event['wall']
+
+        return dict(stages), dict(fetches)
+
+    def log_summary(self):
+        stages, fetches = self.summary()
+
+        logger.info("-- STAGE TIMINGS --")
+        logger.info(f"{'stage':<28}{'count':>8}{'wall s':>12}{'cpu s':>12}{'mean ms':>12}")
+        for name, totals in sorted(stages.items(), key=lambda item: -item[1]['wall']):
+            mean_ms = totals['wall'] / totals['count'] * 1000
+            logger.info(f"{name:<28}{totals['count']:>8}{totals['wall']:>12.3f}{totals['cpu']:>12.3f}{mean_ms:>12.2f}")
+
+        if fetches:
+            logger.info("-- PROVIDER CALLS --")
+            logger.info(f"{'call':<40}{'count':>8}{'wall s':>12}{'rows':>12}{'MB':>10}")
+            for name, totals in sorted(fetches.items(), key=lambda item: -item[1]['wall']):
+                logger.info(f"{name:<40}{totals['count']:>8}{totals['wall']:>12.3f}{totals['rows']:>12}"
+                            f"{totals['bytes'] / 1e6:>10.2f}")
+
+
+_tracer = Tracer() if config.INSTRUMENT else None
+
+
+def stage(name, ticker=None):
+    # Times a block when INSTRUMENT is on, otherwise costs no more than entering a null context
+    if _tracer is None:
+        return contextlib.nullcontext()
+    return _tracer.stage(name, ticker)
+
+
+def get_tracer():
+    return _tracer
+
+
+def start_tracing():
+    # Install a fresh tracer whatever INSTRUMENT says, so a caller can time runs one at a time
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def write_trace(path_base):
+    # Write the collected trace in TRACE_FORMAT and log the summary table
+    if _tracer is None:
+        return None
+
+    if config.TRACE_FORMAT == 'chrome':
+        path = _tracer.write_chrome_trace(f"{path_base}.json")
+    else:
+        path = _tracer.write_jsonl(f"{path_base}.jsonl")
+
+    _tracer.log_summary()
+    logger.info(f"Trace written to {path}")
+    return path
+
+
+class Profiler:
+    """
+    Optional cProfile or tracemalloc capture around a whole run, selected with PROFILE.
+
+    cProfile only sees the thread that started it, so profile with MAX_CONCURRENT_TICKERS=1 to get the
+    full picture. tracemalloc tracks allocations from every thread.
+    """
+    def __init__(self, mode):
+        self.mode = mode
+        self._profile = None
+
+    def start(self):
+        if self.mode == 'cprofile':
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        elif self.mode == 'tracemalloc':
+            import tracemalloc
+            tracemalloc.start()
+        elif self.mode:
+            raise ValueError(f"Unknown PROFILE '{self.mode}', expected cprofile or tracemalloc")
+
+    def stop(self, path_base):
+        if self.mode == 'cprofile':
+            import pstats
+            self._profile.disable()
+
+            path = f"{path_base}.prof"
+            self._profile.dump_stats(path)
+            logger.info(f"-- CPROFILE (top 25 by cumulative time, full profile in {path}) --")
+
+            stream = _LogStream()
+            pstats.Stats(self._profile, stream=stream).sort_stats('cumulative').print_stats(25)
+            stream.flush()
+        elif self.mode == 'tracemalloc':
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            logger.info(f"-- TRACEMALLOC (current {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB) --")
+            for stat in snapshot.statistics('lineno')[:20]:
+                logger.info(str(stat))
+
+
+class _LogStream:
+    # File-like adapter so pstats output goes through the logger
+    def __init__(self):
+        self._buffer = ''
+
+    def write(self, text):
+        self._buffer += text
+
+    def flush(self):
+        for line in self._buffer.splitlines():
+            logger.info(line)
+        self._buffer = ''
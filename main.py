@@ -1,39 +1,114 @@
-import yfinance as yf
+import argparse
+
+# Arguments are parsed before anything heavy is imported, so --help and argument errors return at once
+parser = argparse.ArgumentParser(description="Cash secured put analysis over the TICKERS universe.")
+parser.add_argument('--resume', nargs='?', const='latest', metavar='RUN_ID',
+                    help="Resume an interrupted run (the latest one, or RUN_ID): completed tickers are skipped "
+                         "and failed ones retried")
+parser.add_argument('--serve', action='store_true',
+                    help="Run as a long lived service: keep results warm, refresh them on a schedule and serve "
+                         "them over a local JSON API")
+args = parser.parse_args()
+
+import os
+from datetime import datetime
 import utilities as ut
 import config
-from stock_data_entry import StockDataEntry
+import fetch_pipeline
+import data_providers
+import instrumentation
+from instrumentation import logger, stage
 
 
-# Create an empty DataFrame with the desired column names
-sde_results = []
+instrumentation.configure_logging()
 ut.create_data_dirs()
 
-# Loop over each ticker symbol
-for ticker in config.TICKERS:
-    df = yf.download(ticker)
+# A bad filter expression stops the run here rather than failing every ticker
+if config.PREFILTER:
+    import sde_prefilter
+    sde_prefilter.compile_filter(config.PREFILTER)
+
+if args.serve:
+    import service
+    service.serve()
+    raise SystemExit(0)
 
-    if not df.empty:
+run_timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+profiler = instrumentation.Profiler(config.PROFILE)
+profiler.start()
 
-        if config.DOWNLOAD_TICKER_DATA_TO_CSV:
-            output_file = ut.download_stock_data_csv(ticker, df)
+# The panel screen covers the history based fields of the whole universe at once, in place of the per ticker run
+if config.PANEL_MODE:
+    import panel_engine
+    with stage('panel_screen'):
+        panel = panel_engine.build_close_panel(config.TICKERS)
+        panel_df = panel_engine.compute_panel_fields(panel)
+        ut.write_results_table(panel_df, 'PANEL')
+        if config.PANEL_VERIFY:
+            panel_engine.verify_panel_fields(panel, panel_df)
+        if config.ASSIGNMENT_MODE:
+            ut.write_results_table(panel_engine.compute_panel_assignment(panel), 'PANEL_ASSIGNMENT')
 
-        # Resample data to weekly instead of daily
-        df_weekly = ut.resample_data_to_weekly(df)
+    logger.info(f"-- PANEL SCREEN COMPLETED: {len(panel.tickers)} TICKERS --")
+    profiler.stop(os.path.join(config.RESULTS_DATA_DIR, f"PROFILE_{run_timestamp}"))
+    instrumentation.write_trace(os.path.join(config.RESULTS_DATA_DIR, f"TRACE_{run_timestamp}"))
+    raise SystemExit(0)
 
-        # Calculate Weekly Analysis Data And get final results
-        final_ticker_entry = StockDataEntry()
-        final_ticker_entry.calculate_all_data_fields(ticker, df, df_weekly)
+# Each ticker's result is checkpointed as it completes; a resumed run only does what is left
+tickers = config.TICKERS
+checkpoint = None
+completed_entries = {}
 
-        # Add the Stock Data Entries to the final results array
-        sde_results.append(final_ticker_entry)
+if args.resume:
+    from checkpoint import RunCheckpoint
+    checkpoint = RunCheckpoint.open(None if args.resume == 'latest' else args.resume)
+    completed_entries = checkpoint.completed_entries()
+    tickers = checkpoint.pending_tickers()
+    logger.info(f"Resuming {checkpoint.run_id}: {len(completed_entries)} tickers already completed, "
+                f"{len(tickers)} to go")
+elif config.CHECKPOINT_RUNS:
+    from checkpoint import RunCheckpoint
+    checkpoint = RunCheckpoint.create(tickers)
 
-        # Analyze Next Ticker
-        print(f"{ticker}: CSP Analysis Complete\n\n")
-    else:
-        print(f"NO Data Found for Ticker: {ticker}")
+# Fetch and analyze every ticker, several at a time when MAX_CONCURRENT_TICKERS > 1
+with stage('run_universe'):
+    sde_results = fetch_pipeline.run_universe(tickers, max_workers=config.MAX_CONCURRENT_TICKERS,
+                                              checkpoint=checkpoint)
 
+if checkpoint is not None:
+    checkpoint.finish()
 
-print("-- ALL TICKERS: CSP ANALYSIS COMPLETED --")
+# Entries restored from the checkpoint only carry result fields, so they are left out of the max pain and
+# scan files, which need each ticker's working tables
+sde_results_all = list(completed_entries.values()) + sde_results
+
+logger.info("-- ALL TICKERS: CSP ANALYSIS COMPLETED --")
 
 # convert the array of stock data entries to a final dataframe and generate file
-ut.generate_results_file(sde_results)
\ No newline at end of file
+ut.generate_results_file(sde_results_all)
+
+if config.MAX_PAIN_TERM_STRUCTURE:
+    ut.generate_max_pain_file(sde_results)
+
+# The optional modes' modules are only imported when they are switched on
+if config.SCAN_MODE:
+    import csp_scanner
+    ut.write_results_table(csp_scanner.rank_candidates(sde_results), 'SCAN')
+
+if config.BACKTEST_MODE:
+    import backtest
+    ut.write_results_table(backtest.combine_backtests(sde_results), 'BACKTEST')
+
+if config.ASSIGNMENT_MODE:
+    import assignment_bootstrap
+    ut.write_results_table(assignment_bootstrap.combine_assignments(sde_results), 'ASSIGNMENT')
+
+if config.SWEEP_MODE:
+    import parameter_sweep
+    ut.write_results_table(parameter_sweep.combine_sweeps(sde_results), 'SWEEP')
+
+if config.SNAPSHOT_CACHE:
+    data_providers.get_provider().cache.log_stats()
+
+profiler.stop(os.path.join(config.RESULTS_DATA_DIR, f"PROFILE_{run_timestamp}"))
+instrumentation.write_trace(os.path.join(config.RESULTS_DATA_DIR, f"TRACE_{run_timestamp}"))
@@ -0,0 +1,229 @@
+import numpy as np
+
+# Every function here follows the mibian BS conventions the results have always been stored in:
+# interest rate and volatility in percent, days to expiry in calendar days over a 365 day year,
+# theta per day, vega per 1 vol point and rho per 1% move in rates.
+
+IV_MIN = 0.01
+IV_MAX = 500.0
+
+
+_scipy_ndtr = None
+
+
+def ndtr(x):
+    # Standard normal CDF. scipy.special is slow to import, so it is only loaded once a price is needed, and
+    # kept in a module global so the IV solver's iterations do not go through the import machinery again
+    global _scipy_ndtr
+    if _scipy_ndtr is None:
+        from scipy.special import ndtr as scipy_ndtr
+        _scipy_ndtr = scipy_ndtr
+    return _scipy_ndtr(x)
+
+
+def _norm_pdf(x):
+    return np.exp(-0.5 * x * x) / np.sqrt(2 * np.pi)
+
+
+def _d1_d2(underlying_price, strike_price, interest_rate, days_to_expiry, volatility):
+    rate = interest_rate / 100
+    years = days_to_expiry / 365
+    vol = volatility / 100
+
+    a = vol * np.sqrt(years)
+    d1 = (np.log(underlying_price / strike_price) + (rate + vol ** 2 / 2) * years) / a
+    d2 = d1 - a
+
+    return rate, years, vol, a, d1, d2
+
+
+def calculate_option_prices(underlying_price, strike_price, interest_rate, days_to_expiry, volatility,
+                            option_type='put'):
+    """
+    Black-Scholes price for every option at once.
+
+    Parameters:
+    underlying_price (float or array): Current price of the stock.
+    strike_price (float or array): Strike price of each option.
+    interest_rate (float or array): Risk free rate in percent.
+    days_to_expiry (float or array): Calendar days until expiration.
+    volatility (float or array): Volatility in percent.
+    option_type (str): 'put' or 'call'.
+
+    Returns:
+    array: Option prices.
+    """
+    underlying_price = np.asarray(underlying_price, dtype=np.float64)
+    strike_price = np.asarray(strike_price, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate, years, vol, a, d1, d2 = _d1_d2(underlying_price, strike_price,
+                                            np.asarray(interest_rate, dtype=np.float64),
+                                            np.asarray(days_to_expiry, dtype=np.float64),
+                                            np.asarray(volatility, dtype=np.float64))
+        discounted_strike = strike_price * np.exp(-rate * years)
+
+        if option_type == 'call':
+            return underlying_price * ndtr(d1) - discounted_strike * ndtr(d2)
+        return discounted_strike * ndtr(-d2) - underlying_price * ndtr(-d1)
+
+
+def calculate_greeks(underlying_price, strike_price, interest_rate, days_to_expiry, volatility, option_type='put'):
+    """
+    Black-Scholes Greeks for a whole option chain in one array operation.
+
+    Parameters:
+    underlying_price (float or array): Current price of the stock.
+    strike_price (float or array): Strike price of each option.
+    interest_rate (float or array): Risk free rate in percent.
+    days_to_expiry (float or array): Calendar days until expiration.
+    volatility (float or array): Volatility in percent.
+    option_type (str): 'put' or 'call'.
+
+    Returns:
+    dict: Arrays for 'price', 'delta', 'gamma', 'theta', 'vega' and 'rho', matching mibian.BS.
+    """
+    underlying_price = np.asarray(underlying_price, dtype=np.float64)
+    strike_price = np.asarray(strike_price, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate, years, vol, a, d1, d2 = _d1_d2(underlying_price, strike_price,
+                                            np.asarray(interest_rate, dtype=np.float64),
+                                            np.asarray(days_to_expiry, dtype=np.float64),
+                                            np.asarray(volatility, dtype=np.float64))
+        discount = np.exp(-rate * years)
+        pdf_d1 = _norm_pdf(d1)
+
+        gamma = pdf_d1 / (underlying_price * a)
+        vega = underlying_price * pdf_d1 * np.sqrt(years) / 100
+        time_decay = -underlying_price * pdf_d1 * vol / (2 * np.sqrt(years))
+
+        if option_type == 'call':
+            price = underlying_price * ndtr(d1) - strike_price * discount * ndtr(d2)
+            delta = ndtr(d1)
+            theta = (time_decay - rate * strike_price * discount * ndtr(d2)) / 365
+            rho = strike_price * years * discount * ndtr(d2) / 100
+        else:
+            price = strike_price * discount * ndtr(-d2) - underlying_price * ndtr(-d1)
+            delta = -ndtr(-d1)
+            theta = (time_decay + rate * strike_price * discount * ndtr(-d2)) / 365
+            rho = -strike_price * years * discount * ndtr(-d2) / 100
+
+    return {
+        'price': price,
+        'delta': delta,
+        'gamma': gamma,
+        'theta': theta,
+        'vega': vega,
+        'rho': rho
+    }
+
+
+def calculate_implied_volatility(option_price, underlying_price, strike_price, interest_rate, days_to_expiry,
+                                 option_type='put', tolerance=1e-6, max_iterations=100):
+    """
+    Solve implied volatility for every option at once with a bracketed Newton iteration.
+
+    Each option keeps a [low, high] volatility bracket. Newton steps that leave the bracket, or stall
+    on a tiny vega, fall back to bisection, so every option converges even deep in or out of the money.
+
+    Parameters:
+    option_price (float or array): Observed option price (bid/ask mid or last price).
+    underlying_price (float or array): Current price of the stock.
+    strike_price (float or array): Strike price of each option.
+    interest_rate (float or array): Risk free rate in percent.
+    days_to_expiry (float or array): Calendar days until expiration.
+    option_type (str): 'put' or 'call'.
+    tolerance (float): Price error the solver stops at.
+    max_iterations (int): Iteration cap.
+
+    Returns:
+    array: Implied volatility in percent, NaN where the price is outside the no-arbitrage bounds.
+    """
+    option_price, underlying_price, strike_price, interest_rate, days_to_expiry = np.broadcast_arrays(
+        *(np.asarray(value, dtype=np.float64) for value in
+          (option_price, underlying_price, strike_price, interest_rate, days_to_expiry)))
+
+    low = np.full(option_price.shape, IV_MIN)
+    high = np.full(option_price.shape, IV_MAX)
+    vol = np.full(option_price.shape, 30.0)
+
+    # Prices the model can't reach at either end of the bracket have no implied volatility
+    price_low = calculate_option_prices(underlying_price, strike_price, interest_rate, days_to_expiry, low,
+                                        option_type)
+    price_high = calculate_option_prices(underlying_price, strike_price, interest_rate, days_to_expiry, high,
+                                         option_type)
+    solvable = (option_price > price_low) & (option_price < price_high) & (days_to_expiry > 0)
+
+    active = solvable.copy()
+    for _ in range(max_iterations):
+        if not active.any():
+            break
+
+        greeks = calculate_greeks(underlying_price[active], strike_price[active], interest_rate[active],
+                                  days_to_expiry[active], vol[active], option_type)
+        error = greeks['price'] - option_price[active]
+        converged = np.abs(error) < tolerance
+
+        # Tighten the bracket around the root
+        vol_active = vol[active]
+        high[active] = np.where(error > 0, vol_active, high[active])
+        low[active] = np.where(error <= 0, vol_active, low[active])
+
+        # vega is per 1 vol point, which is exactly the unit vol is carried in. Deep out of the money vega can be
+        # tiny enough for the step to overflow; those lanes fall outside the bracket and bisect instead
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            newton_vol = vol_active - error / greeks['vega']
+
+        in_bracket = (newton_vol > low[active]) & (newton_vol < high[active]) & np.isfinite(newton_vol)
+        next_vol = np.where(in_bracket, newton_vol, (low[active] + high[active]) / 2)
+        vol[active] = np.where(converged, vol_active, next_vol)
+
+        # Options that have converged drop out of the next iteration
+        active_idx = np.flatnonzero(active)
+        active[active_idx[converged]] = False
+
+    return np.where(solvable, vol, np.nan)
+
+
+def option_mid_prices(options):
+    # Bid/ask mid where both sides are quoted, otherwise the last traded price
+    bid = options['bid'].to_numpy(dtype=np.float64)
+    ask = options['ask'].to_numpy(dtype=np.float64)
+    last_price = options['lastPrice'].to_numpy(dtype=np.float64)
+
+    quoted = (bid > 0) & (ask > 0)
+    return np.where(quoted, (bid + ask) / 2, last_price)
+
+
+def add_chain_greeks(options, underlying_price, interest_rate, days_to_expiry, option_type='put', iv_source='yfinance'):
+    """
+    Return a copy of an option chain DataFrame with implied vol (percent) and Greeks columns added.
+
+    Parameters:
+    options (DataFrame): Calls or puts as returned by the data provider.
+    underlying_price (float): Current price of the stock.
+    interest_rate (float): Risk free rate in percent.
+    days_to_expiry (float or array): Calendar days until expiration, per row when the chain spans expiries.
+    option_type (str): 'put' or 'call'.
+    iv_source (str): 'yfinance' to use the chain's impliedVolatility, 'solve' to solve it from mid/last price.
+
+    Returns:
+    DataFrame: The chain with 'iv', 'delta', 'gamma', 'theta', 'vega' and 'rho' columns.
+    """
+    options = options.copy()
+    strikes = options['strike'].to_numpy(dtype=np.float64)
+
+    if iv_source == 'solve':
+        iv = np.round(calculate_implied_volatility(option_mid_prices(options), underlying_price, strikes,
+                                                   interest_rate, days_to_expiry, option_type), 3)
+    else:
+        iv = np.round(options['impliedVolatility'].to_numpy(dtype=np.float64) * 100, 3)
+
+    greeks = calculate_greeks(underlying_price, strikes, interest_rate, days_to_expiry, iv, option_type)
+
+    options['iv'] = iv
+    for greek in ('delta', 'gamma', 'theta', 'vega', 'rho'):
+        options[greek] = greeks[greek]
+
+    return options
@@ -0,0 +1,465 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import utilities as ut
+import config
+import data_providers
+import history_cache
+import sde_csp_meta
+from instrumentation import logger, stage
+
+# Every result field that only depends on the price history: metadata, TA, target CSP metadata and indicators
+PANEL_FIELDS = ['data_start_date', 'data_end_date', 'total_weeks', 'avg_weekly_return', 'lowest_move_date',
+                'lowest_move_close', 'lowest_move_pct', 'last_close_date', 'last_close_price',
+                'two_hundred_day_ma', 'fifty_day_ma', 'rsi', 'macd_line', 'macd_signal', 'macd_histogram',
+                'bollinger_upper', 'bollinger_lower', 'bollinger_middle',
+                'csp_safety_pct', 'tgt_strike_pct', 'tgt_strike_pct_hist_run_max', 'tgt_strike_pct_hist_run_min',
+                'tgt_strike_pct_hist_run_avg', 'pct_chance_assigned', 'tgt_strike',
+                'ind_tgt_strike_pct', 'ind_tgt_strike_pct_occurs', 'ind_tgt_strike_pct_current_run']
+
+PANEL_CLOSES_FILE = 'panel_closes.f64'
+PANEL_DATES_FILE = 'panel_dates.npy'
+PANEL_INDEX_FILE = 'panel_index.json'
+
+# Scratch files holding each ticker's dates and closes back to back until the shared calendar is known
+SCRATCH_CLOSES_FILE = 'scratch_closes.f64'
+SCRATCH_DATES_FILE = 'scratch_dates.i8'
+
+
+class ClosePanel:
+    """
+    Daily closes of a whole universe as one dates x tickers float64 matrix, memory-mapped from disk.
+
+    The matrix is stored column-major, so each ticker's history is contiguous and column chunks can be
+    read without touching the rest of the file. Dates a ticker did not trade (before listing, after
+    delisting or in a gap) are NaN.
+
+    Parameters:
+    panel_dir (str): Directory the panel was built in.
+    """
+    def __init__(self, panel_dir):
+        with open(os.path.join(panel_dir, PANEL_INDEX_FILE)) as f:
+            index = json.load(f)
+
+        self.panel_dir = panel_dir
+        self.tickers = index['tickers']
+        self.dates = np.load(os.path.join(panel_dir, PANEL_DATES_FILE))
+        self.closes = np.memmap(os.path.join(panel_dir, PANEL_CLOSES_FILE), dtype=np.float64, mode='r',
+                                shape=(self.dates.shape[0], len(self.tickers)), order='F')
+
+
+def build_close_panel(tickers, panel_dir=None, chunk_size=None):
+    """
+    Fetch every ticker's daily history and align the closes into a memory-mapped panel on disk.
+
+    Histories are fetched chunk_size tickers at a time and their closes spooled to scratch files, so only
+    one chunk of DataFrames and the shared calendar are ever held in memory.
+
+    Parameters:
+    tickers (list): Ticker symbols.
+    panel_dir (str): Where to write the panel (default PANEL_DIR).
+    chunk_size (int): Tickers fetched at a time (default PANEL_CHUNK_SIZE).
+
+    Returns:
+    ClosePanel: The panel, for the tickers that had any history.
+    """
+    panel_dir = panel_dir or config.PANEL_DIR
+    chunk_size = chunk_size or config.PANEL_CHUNK_SIZE
+    os.makedirs(panel_dir, exist_ok=True)
+
+    provider = data_providers.get_provider()
+    scratch_closes_path = os.path.join(panel_dir, SCRATCH_CLOSES_FILE)
+    scratch_dates_path = os.path.join(panel_dir, SCRATCH_DATES_FILE)
+
+    segments = {}
+    calendar = np.empty(0, dtype=np.int64)
+    offset = 0
+
+    with open(scratch_closes_path, 'wb') as closes_file, open(scratch_dates_path, 'wb') as dates_file:
+        for start in range(0, len(tickers), chunk_size):
+            chunk = tickers[start:start + chunk_size]
+
+            with stage('panel_fetch'):
+                if config.USE_HISTORY_CACHE:
+                    histories = history_cache.load_price_histories(chunk, provider)
+                else:
+                    histories = provider.get_price_histories(chunk)
+
+            chunk_dates = [calendar]
+            for ticker in chunk:
+                df = histories.get(ticker)
+                if df is None or df.empty:
+                    logger.warning("NO Data Found for Ticker: %s", ticker)
+                    continue
+
+                dates = df.index.to_numpy(dtype='datetime64[ns]').view(np.int64)
+                df['Close'].to_numpy(dtype=np.float64).tofile(closes_file)
+                dates.tofile(dates_file)
+
+                segments[ticker] = (offset, dates.shape[0])
+                offset += dates.shape[0]
+                chunk_dates.append(dates)
+
+            calendar = np.unique(np.concatenate(chunk_dates))
+            del histories
+
+    # Scatter each ticker's closes into its column of the shared calendar
+    panel_tickers = [ticker for ticker in tickers if ticker in segments]
+    closes = np.memmap(os.path.join(panel_dir, PANEL_CLOSES_FILE), dtype=np.float64, mode='w+',
+                       shape=(calendar.shape[0], max(1, len(panel_tickers))), order='F')
+    closes[:] = np.nan
+
+    if offset:
+        scratch_closes = np.memmap(scratch_closes_path, dtype=np.float64, mode='r', shape=(offset,))
+        scratch_dates = np.memmap(scratch_dates_path, dtype=np.int64, mode='r', shape=(offset,))
+
+        for column, ticker in enumerate(panel_tickers):
+            segment_start, length = segments[ticker]
+            segment = slice(segment_start, segment_start + length)
+            closes[np.searchsorted(calendar, scratch_dates[segment]), column] = scratch_closes[segment]
+
+        del scratch_closes, scratch_dates
+
+    closes.flush()
+    del closes
+    os.remove(scratch_closes_path)
+    os.remove(scratch_dates_path)
+
+    np.save(os.path.join(panel_dir, PANEL_DATES_FILE), calendar.view('datetime64[ns]'))
+    with open(os.path.join(panel_dir, PANEL_INDEX_FILE), 'w') as f:
+        json.dump({'tickers': panel_tickers}, f)
+
+    return ClosePanel(panel_dir)
+
+
+def compute_panel_fields(panel, safety_pct=None, chunk_size=None):
+    """
+    Every history-based result field for every ticker of the panel, computed with axis operations over
+    column chunks of the matrix. Values are identical to what the StockDataEntry stages produce (TA as in
+    the full recompute, not the incremental TA state).
+
+    Parameters:
+    panel (ClosePanel): The close panel.
+    safety_pct (float): Safety percentage (default CSP_SAFETY_PCT).
+    chunk_size (int): Tickers processed at a time, bounding memory use (default PANEL_CHUNK_SIZE).
+
+    Returns:
+    DataFrame: One row per ticker with 'ticker' and PANEL_FIELDS. Tickers without a target strike are left
+    out, as they fail in the per ticker pipeline.
+    """
+    safety_pct = config.CSP_SAFETY_PCT if safety_pct is None else safety_pct
+    chunk_size = chunk_size or config.PANEL_CHUNK_SIZE
+
+    chunks = []
+    for start in range(0, len(panel.tickers), chunk_size):
+        with stage('panel_chunk'):
+            # Reading the chunk copies just these columns out of the mapped file
+            closes = np.array(panel.closes[:, start:start + chunk_size])
+            fields, _ = _history_fields(panel.dates, closes, safety_pct)
+            fields.update(_ta_fields(closes))
+
+        fields['ticker'] = np.asarray(panel.tickers[start:start + chunk_size], dtype=object)
+        chunks.append(pd.DataFrame(fields))
+
+    if not chunks:
+        return pd.DataFrame(columns=['ticker'] + PANEL_FIELDS)
+
+    panel_df = pd.concat(chunks, ignore_index=True)[['ticker'] + PANEL_FIELDS]
+
+    # Without a target strike, or without any run above it to size the indicator window, the per ticker
+    # pipeline fails the ticker
+    no_target = panel_df['tgt_strike_pct'].isna() | panel_df['tgt_strike_pct_hist_run_avg'].isna()
+    for ticker in panel_df.loc[no_target, 'ticker']:
+        logger.warning("%s: Could not calculate a weekly move %% that happens below the threshold", ticker)
+    panel_df = panel_df[~no_target].reset_index(drop=True)
+
+    # Same value types as the StockDataEntry fields
+    for field in ('data_start_date', 'data_end_date', 'lowest_move_date', 'last_close_date'):
+        panel_df[field] = panel_df[field].dt.date
+    for field in ('total_weeks', 'tgt_strike_pct_hist_run_max', 'tgt_strike_pct_hist_run_min',
+                  'ind_tgt_strike_pct_occurs', 'ind_tgt_strike_pct_current_run'):
+        panel_df[field] = panel_df[field].astype('Int64')
+    panel_df['ind_tgt_strike_pct'] = panel_df['ind_tgt_strike_pct'].astype('boolean')
+
+    return panel_df
+
+
+def verify_panel_fields(panel, panel_df, safety_pct=None):
+    """
+    Recompute every ticker's fields with the StockDataEntry stages and raise if any differs from the panel
+    (or a ticker is kept by one path and failed by the other), the check that both paths agree exactly.
+
+    Parameters:
+    panel (ClosePanel): The close panel.
+    panel_df (DataFrame): compute_panel_fields of the panel.
+    safety_pct (float): Safety percentage the panel was computed with (default CSP_SAFETY_PCT).
+    """
+    import sde_meta
+    import sde_ta
+    import sde_indicators
+    import stage_graph
+    from stock_data_entry import StockDataEntry
+
+    safety_pct = config.CSP_SAFETY_PCT if safety_pct is None else safety_pct
+    panel_rows = panel_df.set_index('ticker')
+    mismatches = []
+
+    for column, ticker in enumerate(panel.tickers):
+        closes = np.array(panel.closes[:, column])
+        traded = ~np.isnan(closes)
+        if not traded.any():
+            continue
+
+        sde = StockDataEntry()
+        sde.ticker = ticker
+        sde.df_daily = pd.DataFrame({'Close': closes[traded]},
+                                    index=pd.DatetimeIndex(panel.dates[traded], name='Date'))
+        sde.df_weekly = ut.resample_data_to_weekly(sde.df_daily)
+
+        try:
+            stage_graph.set_weekly_stats(sde)
+            sde_meta.set_sde_metadata(sde)
+            for field, value in sde_ta.calculate_ta_values(sde.df_daily[['Close']]).items():
+                setattr(sde, field, value)
+            sde_csp_meta.set_sde_target_csp_metadata(sde, safety_pct)
+            sde_indicators.set_ind_tgt_strike_pct(sde)
+        except (ValueError, IndexError):
+            if ticker in panel_rows.index:
+                mismatches.append(f"{ticker}: fails per ticker but is in the panel")
+            continue
+
+        if ticker not in panel_rows.index:
+            mismatches.append(f"{ticker}: left out of the panel but succeeds per ticker")
+            continue
+
+        for field in PANEL_FIELDS:
+            stage_value, panel_value = getattr(sde, field), panel_rows.at[ticker, field]
+            if pd.isna(stage_value) or pd.isna(panel_value):
+                same = pd.isna(stage_value) and pd.isna(panel_value)
+            else:
+                same = stage_value == panel_value
+            if not same:
+                mismatches.append(f"{ticker} {field}: panel {panel_value} != per ticker {stage_value}")
+
+    if mismatches:
+        raise ValueError(f"Panel fields do not match the per ticker stages ({len(mismatches)} differences) - "
+                         + "; ".join(mismatches[:20]))
+
+
+def compute_panel_assignment(panel, safety_pct=None, chunk_size=None):
+    """
+    Bootstrap chance of assignment at and around every ticker's target strike, with each column chunk's
+    tickers run through assignment_bootstrap as one batch. Rows are the same as the per ticker
+    ASSIGNMENT table.
+
+    Parameters:
+    panel (ClosePanel): The close panel.
+    safety_pct (float): Safety percentage (default CSP_SAFETY_PCT).
+    chunk_size (int): Tickers processed at a time (default PANEL_CHUNK_SIZE).
+
+    Returns:
+    DataFrame: ASSIGNMENT_COLUMNS rows for every ticker with a target strike.
+    """
+    import assignment_bootstrap
+
+    safety_pct = config.CSP_SAFETY_PCT if safety_pct is None else safety_pct
+    chunk_size = chunk_size or config.PANEL_CHUNK_SIZE
+
+    tables = []
+    for start in range(0, len(panel.tickers), chunk_size):
+        with stage('panel_assignment_chunk'):
+            closes = np.array(panel.closes[:, start:start + chunk_size])
+            fields, returns_pct = _history_fields(panel.dates, closes, safety_pct)
+
+            # Same tickers as the PANEL table
+            kept = np.flatnonzero(~np.isnan(fields['tgt_strike_pct']) &
+                                  ~np.isnan(fields['tgt_strike_pct_hist_run_avg']))
+            if not kept.size:
+                continue
+
+            offsets, strike_pcts = assignment_bootstrap.assignment_thresholds(fields['tgt_strike_pct'][kept, None])
+            mean, ci_low, ci_high = assignment_bootstrap.bootstrap_assignment(returns_pct[:, kept], strike_pcts)
+
+            for position, column in enumerate(kept):
+                tables.append(assignment_bootstrap.assignment_table(
+                    panel.tickers[start + column], offsets, strike_pcts[position], fields['last_close_price'][column],
+                    returns_pct[:, column], fields['total_weeks'][column], mean[position], ci_low[position],
+                    ci_high[position]))
+
+    if not tables:
+        return pd.DataFrame(columns=assignment_bootstrap.ASSIGNMENT_COLUMNS)
+
+    return pd.concat(tables, ignore_index=True)
+
+
+def _history_fields(dates, closes, safety_pct):
+    # Metadata, target CSP metadata and indicator fields for a (dates x tickers) chunk of closes, and the
+    # weekly returns in percent (weeks x tickers) they come from
+    rows, tickers = closes.shape
+    columns = np.arange(tickers)
+    valid = ~np.isnan(closes)
+
+    # Each ticker's history runs from its first to its last close
+    first_row = valid.argmax(axis=0)
+    last_row = rows - 1 - valid[::-1].argmax(axis=0)
+
+    # -- Weekly resample (weeks ending Sunday, last close of each week) --
+    days = dates.astype('datetime64[D]')
+    week_labels_of_dates = days + (6 - (days.astype(np.int64) + 3) % 7)
+    week_labels = np.arange(week_labels_of_dates[0], week_labels_of_dates[-1] + 7, 7)
+    week_of_date = ((week_labels_of_dates - week_labels[0]) // 7).astype(np.int64)
+
+    week_numbers = np.arange(week_labels.shape[0])
+    week_start_row = np.searchsorted(week_of_date, week_numbers, side='left')
+    week_end_row = np.searchsorted(week_of_date, week_numbers, side='right') - 1
+
+    # Row of the latest close at or before each date, per ticker; a week has a close when the latest close
+    # as of its last date falls inside it
+    last_valid_row = np.maximum.accumulate(np.where(valid, np.arange(rows)[:, None], -1), axis=0)
+    week_close_row = last_valid_row[np.maximum(week_end_row, 0)]
+    has_close = (week_end_row[:, None] >= 0) & (week_close_row >= week_start_row[:, None])
+    weekly_closes = np.where(has_close, np.take_along_axis(closes, np.maximum(week_close_row, 0), axis=0), np.nan)
+
+    first_week = week_of_date[first_row]
+    last_week = week_of_date[last_row]
+    total_weeks = last_week - first_week + 1
+
+    # -- Weekly returns, as WeeklyStats computes them --
+    returns = np.full(weekly_closes.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[1:] = weekly_closes[1:] / weekly_closes[:-1] - 1
+    returns_pct = returns * 100
+    has_return = ~np.isnan(returns_pct)
+
+    # Mean over each ticker's valid returns, summed in the same order as WeeklyStats for identical rounding
+    mean_return_pct = np.array([returns_pct[has_return[:, column], column].sum() / has_return[:, column].sum()
+                                if has_return[:, column].any() else np.nan for column in columns])
+
+    lowest_week = np.where(has_return, returns_pct, np.inf).argmin(axis=0)
+
+    last_close_price = np.round(closes[last_row, columns], 2)
+
+    fields = {
+        'data_start_date': week_labels[first_week].astype('datetime64[ns]'),
+        'data_end_date': week_labels[last_week].astype('datetime64[ns]'),
+        'total_weeks': total_weeks,
+        'avg_weekly_return': np.round(mean_return_pct, 2),
+        'lowest_move_date': week_labels[lowest_week].astype('datetime64[ns]'),
+        'lowest_move_close': np.round(weekly_closes[lowest_week, columns], 2),
+        'lowest_move_pct': np.round(returns_pct[lowest_week, columns], 3),
+        'last_close_date': days[last_row].astype('datetime64[ns]'),
+        'last_close_price': last_close_price
+    }
+
+    # -- Target strike %: the order statistic rule of calculate_tgt_strike_pct_grid --
+    sorted_returns = np.sort(returns_pct, axis=0)
+    return_counts = has_return.sum(axis=0)
+
+    # Most weeks at or below a threshold that keeps its % of weeks under the safety %, shared with the per
+    # ticker calculation so floating point boundaries agree
+    max_weeks_below = sde_csp_meta.max_weeks_below(total_weeks, safety_pct)
+
+    statistic_row = np.clip(max_weeks_below, 0, sorted_returns.shape[0] - 1)
+    order_statistic = sorted_returns[statistic_row, columns]
+    tgt_strike_pct = sde_csp_meta.order_statistic_tgt_strike_pct(order_statistic, max_weeks_below, return_counts)
+
+    # Thresholds only run down to the truncated worst move
+    found = (max_weeks_below >= 0) & (return_counts > 0) & (tgt_strike_pct > np.trunc(sorted_returns[0]))
+    tgt_strike_pct = np.where(found, tgt_strike_pct, np.nan)
+
+    weeks_at_or_below = (sorted_returns <= tgt_strike_pct).sum(axis=0)
+    pct_chance_assigned = np.where(found, np.round(weeks_at_or_below / total_weeks * 100, 2), np.nan)
+
+    tgt_strike = sde_csp_meta.strike_on_grid(last_close_price, tgt_strike_pct)
+
+    # -- Runs of consecutive weeks at or above the target move, as ThresholdStats finds them --
+    with np.errstate(invalid='ignore'):
+        above = returns >= tgt_strike_pct / 100
+    padding = np.zeros((1, tickers), dtype=np.int8)
+    flips = np.diff(np.concatenate([padding, above.astype(np.int8), padding]), axis=0)
+
+    run_columns, run_starts = np.nonzero((flips == 1).T)
+    _, run_ends = np.nonzero((flips == -1).T)
+    run_lengths = run_ends - run_starts
+
+    run_counts = np.bincount(run_columns, minlength=tickers)
+    run_max = np.full(tickers, -1, dtype=np.int64)
+    run_min = np.full(tickers, np.iinfo(np.int64).max, dtype=np.int64)
+    np.maximum.at(run_max, run_columns, run_lengths)
+    np.minimum.at(run_min, run_columns, run_lengths)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        run_avg = np.round(np.bincount(run_columns, weights=run_lengths, minlength=tickers) / run_counts, 2)
+
+    has_runs = run_counts > 0
+    fields.update({
+        'csp_safety_pct': np.full(tickers, safety_pct, dtype=np.float64),
+        'tgt_strike_pct': tgt_strike_pct,
+        'tgt_strike_pct_hist_run_max': np.where(has_runs, run_max, np.nan),
+        'tgt_strike_pct_hist_run_min': np.where(has_runs, run_min, np.nan),
+        'tgt_strike_pct_hist_run_avg': np.where(has_runs, run_avg, np.nan),
+        'pct_chance_assigned': pct_chance_assigned,
+        'tgt_strike': tgt_strike
+    })
+
+    # -- Indicators: closes below the target within the last average run, and weeks since the last one --
+    with np.errstate(invalid='ignore'):
+        below = np.round(returns_pct, 2) < tgt_strike_pct
+    below_count = np.cumsum(below, axis=0)
+
+    avg_run_weeks = np.round(np.nan_to_num(run_avg)).astype(np.int64)
+    returns_in_window = np.minimum(avg_run_weeks - 1, total_weeks)
+    window_start_row = last_week - returns_in_window
+    recent_below = below_count[last_week, columns] - np.where(
+        window_start_row >= 0, below_count[np.clip(window_start_row, 0, last_week), columns], 0)
+    recent_below = np.where(returns_in_window > 0, recent_below, 0)
+
+    last_below_week = np.where(below, np.arange(below.shape[0])[:, None], -1).max(axis=0)
+    days_since = (week_labels[last_week] - week_labels[np.maximum(last_below_week, 0)]).astype(np.int64)
+    weeks_since_last_below = np.where(last_below_week >= 0, (days_since / 7).astype(np.int64), -1)
+
+    fields.update({
+        'ind_tgt_strike_pct': recent_below > 0,
+        'ind_tgt_strike_pct_occurs': recent_below,
+        'ind_tgt_strike_pct_current_run': weeks_since_last_below
+    })
+
+    return fields, returns_pct
+
+
+def _ta_fields(closes):
+    # Latest TA values, with the same pandas calls as sde_ta.calculate_ta_values run on every column at once.
+    # Each ticker's closes are first packed down to the bottom of the matrix so its rolling windows and
+    # EWMs see exactly the rows its own history has, with NaN padding only in front of it.
+    valid = ~np.isnan(closes)
+    packed_order = np.argsort(valid, axis=0, kind='stable')
+    df = pd.DataFrame(np.take_along_axis(closes, packed_order, axis=0))
+
+    # RSI (Wilder's smoothing). The padding's gains and losses are 0, which leaves the averages at exactly 0
+    # until the ticker's own first bar, as starting there would
+    delta = df.diff(1)
+    gain = delta.where(delta > 0, 0)
+    loss = -delta.where(delta < 0, 0)
+    avg_gain = gain.ewm(com=14 - 1, adjust=False).mean().iloc[-1]
+    avg_loss = loss.ewm(com=14 - 1, adjust=False).mean().iloc[-1]
+    rsi = 100 - (100 / (1 + avg_gain / avg_loss))
+
+    # MACD
+    macd_line = df.ewm(span=12, adjust=False).mean() - df.ewm(span=26, adjust=False).mean()
+    signal_line = macd_line.ewm(span=9, adjust=False).mean()
+
+    # Bollinger bands
+    sma = df.rolling(window=20).mean().iloc[-1]
+    std_dev = df.rolling(window=20).std(ddof=0).iloc[-1]
+
+    return {
+        'two_hundred_day_ma': np.round(df.rolling(window=200).mean().iloc[-1].to_numpy(), 2),
+        'fifty_day_ma': np.round(df.rolling(window=50).mean().iloc[-1].to_numpy(), 2),
+        'rsi': np.round(rsi.to_numpy(), 2),
+        'macd_line': np.round(macd_line.iloc[-1].to_numpy(), 3),
+        'macd_signal': np.round(signal_line.iloc[-1].to_numpy(), 3),
+        'macd_histogram': np.round((macd_line.iloc[-1] - signal_line.iloc[-1]).to_numpy(), 3),
+        'bollinger_upper': np.round((sma + 2 * std_dev).to_numpy(), 2),
+        'bollinger_lower': np.round((sma - 2 * std_dev).to_numpy(), 2),
+        'bollinger_middle': np.round(sma.to_numpy(), 2)
+    }
@@ -0,0 +1,93 @@
+import pandas as pd
+import data_providers
+import sde_csp_meta
+import sde_csp_options
+import sde_profit
+import sde_indicators
+from instrumentation import logger
+from stock_data_entry import StockDataEntry, RESULT_FIELDS
+
+# Parameters every sweep row is keyed by, followed by the usual result fields
+SWEEP_KEY_COLUMNS = ['csp_safety_pct', 'timeframe', 'cash_on_hand']
+SWEEP_COLUMNS = SWEEP_KEY_COLUMNS + [field for field in RESULT_FIELDS if field not in SWEEP_KEY_COLUMNS]
+
+
+def sweep_ticker(sde, safety_pcts, timeframes, cash_amounts):
+    """
+    Evaluate every (safety %, timeframe, cash on hand) combination for one analyzed ticker.
+
+    Only the stages that depend on a parameter are rerun, innermost loop cheapest: the target strike and
+    indicators once per safety %, the option fields once per (safety %, timeframe) and the profit once per
+    grid point. History, weekly stats and TA come from the entry, and the chains, max pain, rate and Greeks come
+    from the option stage's TickerOptions, so nothing it already fetched is fetched again.
+
+    Parameters:
+    sde (StockDataEntry): An entry whose weekly stats and daily history are still loaded.
+    safety_pcts (list): CSP_SAFETY_PCT values.
+    timeframes (list): Minimum days to expiry for set_sde_target_csp_options_data.
+    cash_amounts (list): CASH_ON_HAND values.
+
+    Returns:
+    DataFrame: One row per grid point with SWEEP_COLUMNS.
+    """
+    provider = data_providers.get_provider()
+    ticker_options = sde.ticker_options
+    if ticker_options is None:
+        ticker_options = sde_csp_options.TickerOptions(sde.ticker, provider.get_expiry_dates(sde.ticker))
+    today = provider.get_session_date()
+
+    # Expiry for each timeframe, then the puts of each distinct expiry, loaded once
+    selected_expiries = {timeframe: sde_csp_options.select_expiry_date(ticker_options.expiration_dates, today,
+                                                                       timeframe)
+                         for timeframe in timeframes}
+    expiry_puts = {expiry_date: ticker_options.expiry_puts(sde, expiry_date)
+                   for expiry_date in set(selected_expiries.values()) if expiry_date is not None}
+
+    rows = []
+    for safety_pct in safety_pcts:
+        entry = _copy_entry(sde)
+
+        try:
+            sde_csp_meta.set_sde_target_csp_metadata(entry, safety_pct)
+            sde_indicators.set_ind_tgt_strike_pct(entry)
+        except ValueError as e:
+            logger.warning("%s: no target strike at safety %s%% - %s", sde.ticker, safety_pct, e)
+            continue
+
+        for timeframe in timeframes:
+            if selected_expiries[timeframe] is None:
+                logger.warning("%s: No expiration date found that is %s or more days out.", sde.ticker,
+                               timeframe)
+                continue
+
+            sde_csp_options.apply_put_option(entry, expiry_puts[selected_expiries[timeframe]])
+
+            for cash_on_hand in cash_amounts:
+                sde_profit.set_sde_profit_data(entry, cash_on_hand)
+                rows.append({**entry.to_dict(), 'timeframe': timeframe})
+
+    return pd.DataFrame(rows, columns=SWEEP_COLUMNS)
+
+
+def _copy_entry(sde):
+    # Result fields plus the weekly stats and horizon returns the csp stages read; those (and their per-threshold
+    # and per-horizon caches) are shared rather than copied
+    entry = StockDataEntry()
+    for field in RESULT_FIELDS:
+        setattr(entry, field, getattr(sde, field))
+    entry.df_daily = sde.df_daily
+    entry.spot_price = sde.spot_price
+    entry.weekly_stats = sde.weekly_stats
+    entry.horizon_returns = sde.horizon_returns
+    return entry
+
+
+def combine_sweeps(sde_results):
+    # Long table of every ticker's grid, keyed by the parameter tuple
+    sweeps = [result.df_sweep for result in sde_results if result.df_sweep is not None]
+
+    if not sweeps:
+        return pd.DataFrame(columns=SWEEP_COLUMNS)
+
+    sweep_df = pd.concat(sweeps, ignore_index=True)
+    return sweep_df.sort_values(SWEEP_KEY_COLUMNS + ['ticker'], kind='stable', ignore_index=True)
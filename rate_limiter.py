@@ -0,0 +1,107 @@
+import threading
+import time
+import config
+
+
+class AdaptiveRateLimiter:
+    """
+    Rate limiter shared by every fetch thread.
+
+    Calls are spaced at least 1 / rate seconds apart. When the data source throttles us the rate is
+    cut by backoff_factor, and every successful call slowly recovers it by recovery_factor.
+
+    Parameters:
+    max_calls_per_sec (float): The fastest rate calls are ever allowed to go out at.
+    min_calls_per_sec (float): The floor the rate is never backed off below.
+    backoff_factor (float): How much the rate is divided by when we get throttled.
+    recovery_factor (float): How much the rate is multiplied by after each successful call.
+    max_retries (int): How many times a throttled or dropped call is retried before giving up.
+    """
+    def __init__(self, max_calls_per_sec, min_calls_per_sec=0.2, backoff_factor=2.0, recovery_factor=1.05,
+                 max_retries=5):
+        self.max_calls_per_sec = max_calls_per_sec
+        self.min_calls_per_sec = min_calls_per_sec
+        self.backoff_factor = backoff_factor
+        self.recovery_factor = recovery_factor
+        self.max_retries = max_retries
+
+        self.calls_per_sec = max_calls_per_sec
+        self._next_call_time = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Reserve the next free slot while holding the lock, then sleep outside of it
+        with self._lock:
+            now = time.monotonic()
+            call_time = max(now, self._next_call_time)
+            self._next_call_time = call_time + 1 / self.calls_per_sec
+
+        delay = call_time - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def on_success(self):
+        with self._lock:
+            self.calls_per_sec = min(self.max_calls_per_sec, self.calls_per_sec * self.recovery_factor)
+
+    def on_throttle(self):
+        with self._lock:
+            self.calls_per_sec = max(self.min_calls_per_sec, self.calls_per_sec / self.backoff_factor)
+
+    def call(self, fn, *args, **kwargs):
+        # Run fn under the limiter, retrying with exponential backoff on throttling or dropped connections
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable_error(e):
+                    raise
+
+                self.on_throttle()
+                time.sleep(min(60, 2 ** attempt))
+                continue
+
+            self.on_success()
+            return result
+
+
+def is_retryable_error(error):
+    # yfinance raises YFRateLimitError when throttled, other paths surface a raw HTTP 429
+    if type(error).__name__ == 'YFRateLimitError':
+        return True
+
+    message = str(error)
+    if '429' in message or 'Too Many Requests' in message:
+        return True
+
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_shared_session():
+    """
+    Return the single pooled HTTP session used for every market data request in this run.
+
+    Recent yfinance versions only accept curl_cffi sessions, so None is returned when curl_cffi is not
+    installed and yfinance falls back to its own internal session.
+    """
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            try:
+                from curl_cffi import requests as curl_requests
+            except ImportError:
+                return None
+
+            _session = curl_requests.Session(impersonate="chrome")
+
+    return _session
+
+
+# Limiter shared by every module that calls out to the market data source
+limiter = AdaptiveRateLimiter(config.FETCH_RATE_LIMIT, max_retries=config.FETCH_MAX_RETRIES)
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from stock_data_entry import RESULT_FIELDS
+from instrumentation import logger
+
+# Storage dtype of each result type while it sits in the buffer. Ints and bools are held as floats so a
+# missing value can be NaN, and become nullable Int64/boolean columns on the way out.
+BUFFER_DTYPES = {
+    'str': object,
+    'date': 'datetime64[D]',
+    'int': np.float64,
+    'float': np.float64,
+    'bool': np.float64
+}
+
+OUTPUT_DTYPES = {
+    'int': 'Int64',
+    'bool': 'boolean'
+}
+
+
+class ResultsBuffer:
+    """
+    Columnar results sink: one preallocated typed array per result field, filled a row at a time.
+
+    Parameters:
+    capacity (int): Rows to preallocate; the buffer doubles in size if more rows are appended.
+    """
+    def __init__(self, capacity=64):
+        self.size = 0
+        self.columns = {field: self._empty_column(field_type, max(1, capacity))
+                        for field, field_type in RESULT_FIELDS.items()}
+
+    @staticmethod
+    def _empty_column(field_type, capacity):
+        dtype = BUFFER_DTYPES[field_type]
+
+        if field_type == 'date':
+            return np.full(capacity, np.datetime64('NaT'), dtype=dtype)
+        if field_type == 'str':
+            return np.full(capacity, None, dtype=dtype)
+        return np.full(capacity, np.nan, dtype=dtype)
+
+    def _grow(self):
+        for field, field_type in RESULT_FIELDS.items():
+            column = self._empty_column(field_type, self.columns[field].shape[0] * 2)
+            column[:self.size] = self.columns[field][:self.size]
+            self.columns[field] = column
+
+    def append(self, sde):
+        if self.size == self.columns['ticker'].shape[0]:
+            self._grow()
+
+        for field in RESULT_FIELDS:
+            value = getattr(sde, field)
+            if value is not None:
+                self.columns[field][self.size] = value
+
+        self.size += 1
+
+    def extend(self, sde_results):
+        for sde in sde_results:
+            self.append(sde)
+
+    def to_dataframe(self):
+        data = {}
+        for field, field_type in RESULT_FIELDS.items():
+            column = self.columns[field][:self.size]
+            data[field] = pd.array(column, dtype=OUTPUT_DTYPES[field_type]) if field_type in OUTPUT_DTYPES else column
+
+        return pd.DataFrame(data)
+
+
+def write_results(df, path_base, formats):
+    """
+    Write a results table in every requested format.
+
+    Parameters:
+    df (DataFrame): The results table.
+    path_base (str): Output path without an extension.
+    formats (list): Any of 'csv', 'parquet' and 'arrow' (Arrow IPC / Feather).
+
+    Returns:
+    list: Paths of the files written.
+    """
+    # Imported here, utilities imports this module
+    import utilities as ut
+
+    written = []
+
+    for output_format in formats:
+        # Parquet and Arrow need an optional engine; skip the format rather than lose the run's results
+        if output_format == 'parquet' and not ut.parquet_available():
+            logger.warning("Skipping the parquet results file, neither pyarrow nor fastparquet is installed")
+            continue
+        if output_format == 'arrow' and not ut.arrow_available():
+            logger.warning("Skipping the arrow results file, pyarrow is not installed")
+            continue
+
+        if output_format == 'csv':
+            path = f"{path_base}.csv"
+            df.to_csv(path, index=False)
+        elif output_format == 'parquet':
+            path = f"{path_base}.parquet"
+            df.to_parquet(path, index=False)
+        elif output_format == 'arrow':
+            path = f"{path_base}.arrow"
+            df.to_feather(path)
+        else:
+            raise ValueError(f"Unknown results format '{output_format}', expected csv, parquet or arrow")
+
+        written.append(path)
+
+    # Never finish a run without a results file
+    if not written:
+        logger.warning("No requested results format could be written, writing csv instead")
+        path = f"{path_base}.csv"
+        df.to_csv(path, index=False)
+        written.append(path)
+
+    return written
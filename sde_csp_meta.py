@@ -2,58 +2,167 @@ import config
 import numpy as np
 import math
 
-def set_sde_target_csp_metadata(sde):
-    sde.csp_safety_pct = config.CSP_SAFETY_PCT
-    sde.tgt_strike_pct, sde.pct_chance_assigned = calculate_tgt_strike_pct_data(sde.df_weekly)
-    sde.tgt_strike_pct_hist_run_max, sde.tgt_strike_pct_hist_run_min, \
-        sde.tgt_strike_pct_hist_run_avg = calculate_tgt_strike_pct_runs(sde.df_weekly, sde.tgt_strike_pct)
+def set_sde_target_csp_metadata(sde, safety_pct=None):
+    stats = sde.weekly_stats
 
-    # Calculate "Target Strike"
-    csp_strike_precise = sde.last_close_price * ((100 + sde.tgt_strike_pct) / 100) * 2
-    sde.tgt_strike = math.floor(csp_strike_precise) / 2
-
-
-def calculate_tgt_strike_pct_data(df_weekly):
-    lowest_weekly_move_int = int(df_weekly['Weekly Return'].min())
-
-    for num in np.arange(-.5, lowest_weekly_move_int, -0.5):
-
-        # Find the weeks with a weekly return less than or equal to the negative threshold
-        total_negative_movement_weeks = df_weekly[df_weekly['Weekly Return'] <= num]
-
-        # Calculate Total number of weeks with a return less than the negative threshold
-        total_weeks = df_weekly.shape[0]
-        total_negative_movement_weeks = total_negative_movement_weeks.shape[0]
-        percent_occurred = total_negative_movement_weeks / total_weeks * 100
+    sde.csp_safety_pct = config.CSP_SAFETY_PCT if safety_pct is None else safety_pct
+    sde.tgt_strike_pct, sde.pct_chance_assigned = calculate_tgt_strike_pct_data(stats.returns_pct, sde.csp_safety_pct)
 
-        # Save off Results Data for Recommended Strike
-        if percent_occurred < config.CSP_SAFETY_PCT:
-            percent_occurred = np.round(percent_occurred, 2)
-            return num, percent_occurred
+    threshold_stats = stats.threshold_stats(sde.tgt_strike_pct)
+    sde.tgt_strike_pct_hist_run_max = threshold_stats.run_max
+    sde.tgt_strike_pct_hist_run_min = threshold_stats.run_min
+    sde.tgt_strike_pct_hist_run_avg = threshold_stats.run_avg
 
-    print("Could not calculate a weekly move % that happens below the threshold")
-    return "ERROR"
-
-def calculate_tgt_strike_pct_runs(df_weekly, tgt_strike_pct):
-    # Calculate the percentage change in Close price from the previous week
-    df_weekly['pct_change'] = df_weekly['Close'].pct_change()
-
-    # Flag weeks when the stock closed above the tgt_strike_pct move
-    df_weekly['above_tgt_pct_move'] = df_weekly['pct_change'] >= tgt_strike_pct / 100
-
-    # Identify consecutive runs of 'above_tgt_pct_move'
-    # Create a column that marks the start of a new run by comparing it to the previous row
-    df_weekly['run_change'] = df_weekly['above_tgt_pct_move'].ne(df_weekly['above_tgt_pct_move'].shift()).cumsum()
-
-    # Filter out only the groups where the stock was above the tgt_strike_pct move
-    positive_runs = df_weekly[df_weekly['above_tgt_pct_move']]
+    # Calculate "Target Strike"
+    sde.tgt_strike = strike_on_grid(sde.last_close_price, sde.tgt_strike_pct)
 
-    # Group by run_change and count the length of each run
-    run_lengths = positive_runs.groupby('run_change').size()
 
-    # Calculate statistics
-    longest_run = run_lengths.max()
-    shortest_run = run_lengths.min()
-    average_run = np.round(run_lengths.mean(), 2)
+def strike_on_grid(price, strike_pct):
+    """
+    Strike for a move of strike_pct from price, rounded down to the $0.50 grid.
+
+    Parameters:
+    price (float or array): Price the move is taken from.
+    strike_pct (float or array): Move in percent.
 
-    return longest_run, shortest_run, average_run
\ No newline at end of file
+    Returns:
+    float or array: The strike; a float for scalar inputs.
+    """
+    if np.ndim(price) == 0 and np.ndim(strike_pct) == 0:
+        return math.floor(price * ((100 + strike_pct) / 100) * 2) / 2
+    return np.floor(price * ((100 + strike_pct) / 100) * 2) / 2
+
+
+def calculate_tgt_strike_pct_data(weekly_returns, safety_pct=None, total_weeks=None):
+    if safety_pct is None:
+        safety_pct = config.CSP_SAFETY_PCT
+
+    tgt_strike_pcts, pct_chances_assigned = calculate_tgt_strike_pct_grid(weekly_returns, [safety_pct],
+                                                                          total_weeks=total_weeks)
+
+    if np.isnan(tgt_strike_pcts[0]):
+        raise ValueError("Could not calculate a weekly move % that happens below the threshold")
+
+    return tgt_strike_pcts[0], pct_chances_assigned[0]
+
+
+def calculate_tgt_strike_pct_grid(weekly_returns, safety_pcts, total_weeks=None):
+    """
+    Find the target strike % for any number of safety percentages with a single sort of the weekly returns.
+
+    Candidate thresholds step down from -0.5% in 0.5% increments to the worst weekly move. The target
+    strike % is the first threshold where the share of weeks closing at or below it drops under the
+    safety percentage.
+
+    Parameters:
+    weekly_returns (array): Weekly returns in percent, NaN for weeks without a return.
+    safety_pcts (array): Safety percentages to solve for.
+    total_weeks (int): Number of weeks the occurrence % is measured against (default len(weekly_returns)).
+
+    Returns:
+    tuple: Arrays of target strike % and % chance assigned (rounded to 2), NaN where no threshold qualifies.
+    """
+    weekly_returns = np.asarray(weekly_returns, dtype=np.float64)
+    safety_pcts = np.atleast_1d(np.asarray(safety_pcts, dtype=np.float64))
+
+    if total_weeks is None:
+        total_weeks = weekly_returns.shape[0]
+
+    # Weeks without a return never count as a move below any threshold
+    sorted_returns = np.sort(weekly_returns[~np.isnan(weekly_returns)])
+    lowest_weekly_move_int = int(sorted_returns[0]) if sorted_returns.size else 0
+
+    # Number of weeks at or below each threshold, then the % of all weeks that represents
+    thresholds = np.arange(-.5, lowest_weekly_move_int, -0.5)
+    total_negative_movement_weeks = np.searchsorted(sorted_returns, thresholds, side='right')
+    percent_occurred = total_negative_movement_weeks / total_weeks * 100
+
+    # The week counts never increase as the threshold drops, so the first threshold under each safety % is
+    # the first whose count is at most max_weeks_below, found with a binary search on their negation
+    first_below = np.searchsorted(-total_negative_movement_weeks, -max_weeks_below(total_weeks, safety_pcts),
+                                  side='left')
+    found = first_below < thresholds.shape[0]
+
+    tgt_strike_pcts = np.full(safety_pcts.shape, np.nan)
+    pct_chances_assigned = np.full(safety_pcts.shape, np.nan)
+    tgt_strike_pcts[found] = thresholds[first_below[found]]
+    pct_chances_assigned[found] = np.round(percent_occurred[first_below[found]], 2)
+
+    return tgt_strike_pcts, pct_chances_assigned
+
+
+def max_weeks_below(total_weeks, safety_pcts):
+    """
+    Most weeks at or below a threshold that still leaves its % of weeks (weeks / total_weeks * 100) under the
+    safety %. Every target strike calculation (calculate_tgt_strike_pct_grid, the backtest's walk forward and
+    the panel screen) reads its threshold from this count, so they agree exactly even on floating point
+    boundaries.
+
+    Parameters:
+    total_weeks (int or array): Number of weeks the % is measured against.
+    safety_pcts (float or array): Safety percentages.
+
+    Returns:
+    array: The counts (int64, broadcast over both inputs), -1 where even no week is under the safety %.
+    """
+    total_weeks, safety_pcts = np.broadcast_arrays(np.asarray(total_weeks, dtype=np.int64),
+                                                   np.asarray(safety_pcts, dtype=np.float64))
+
+    # Start from the exact-arithmetic answer and step to where the floating point expression flips
+    count = np.ceil(safety_pcts * total_weeks / 100).astype(np.int64) - 1
+    while True:
+        step_up = (count + 1) / total_weeks * 100 < safety_pcts
+        if not step_up.any():
+            break
+        count = count + step_up
+    while True:
+        step_down = (count >= 0) & (count / total_weeks * 100 >= safety_pcts)
+        if not step_down.any():
+            break
+        count = count - step_down
+    return count
+
+
+def order_statistic_tgt_strike_pct(order_statistic, weeks_below, return_counts):
+    """
+    Target strike % read from the sorted returns: the highest threshold on the -0.5% grid below the
+    (weeks_below)-th smallest return, or -0.5% when the safety % allows more weeks than there are returns.
+    The caller still checks the threshold is above the truncated worst move.
+
+    Parameters:
+    order_statistic (float or array): The (weeks_below)-th smallest return in percent (any value when
+        weeks_below >= return_counts).
+    weeks_below (int or array): max_weeks_below for the returns.
+    return_counts (int or array): Number of returns.
+
+    Returns:
+    array: Target strike %.
+    """
+    with np.errstate(invalid='ignore'):
+        steps = np.where(weeks_below >= return_counts, 1,
+                         np.maximum(1, np.floor(-2 * np.nan_to_num(order_statistic)) + 1))
+    return -0.5 * steps
+
+
+def calculate_pct_weeks_at_or_below(weekly_returns, move_pcts, total_weeks=None):
+    """
+    Historical % of weeks that closed at or below each move %, the empirical chance of assignment for a
+    strike that far from the current price.
+
+    Parameters:
+    weekly_returns (array): Weekly returns in percent, NaN for weeks without a return.
+    move_pcts (array): Moves from the current price in percent (negative for strikes below it).
+    total_weeks (int): Number of weeks the % is measured against (default len(weekly_returns)).
+
+    Returns:
+    array: % of weeks at or below each move, same semantics as pct_chance_assigned.
+    """
+    weekly_returns = np.asarray(weekly_returns, dtype=np.float64)
+
+    if total_weeks is None:
+        total_weeks = weekly_returns.shape[0]
+
+    sorted_returns = np.sort(weekly_returns[~np.isnan(weekly_returns)])
+    weeks_at_or_below = np.searchsorted(sorted_returns, np.asarray(move_pcts, dtype=np.float64), side='right')
+
+    return weeks_at_or_below / total_weeks * 100
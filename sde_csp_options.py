@@ -1,110 +1,288 @@
-import yfinance as yf
+from collections import namedtuple
 import numpy as np
 import pandas as pd
-import mibian
+import data_providers
+import options_pricing
+import config
+import horizon_returns
+import sde_csp_meta
+from instrumentation import logger, stage
+
+# Everything the put option fields are picked from for one expiry: independent of the target strike, so it can
+# be loaded once and reused for several target strikes
+ExpiryPuts = namedtuple('ExpiryPuts', ['expiry_date', 'days_to_expiry', 'max_pain', 'df_max_pain_term', 'puts'])
+
+
+class TickerOptions:
+    """
+    One ticker's option data for a run. Each chain, the risk-free rate and the max pain term structure are
+    fetched or calculated at most once, and so are the puts of each expiry, however many timeframes and
+    target strikes resolve to it. The option stage keeps it on the entry so the parameter sweep reuses it.
+
+    Parameters:
+    ticker (str): The ticker.
+    expiration_dates (list): Every listed expiry.
+    """
+    def __init__(self, ticker, expiration_dates):
+        self.ticker = ticker
+        self.expiration_dates = list(expiration_dates)
+        self._chains = {}
+        self._risk_free_rate = None
+        self._max_pain_term = None
+        self._expiry_puts = {}
+
+    def chain(self, expiry_date):
+        if expiry_date not in self._chains:
+            self._chains[expiry_date] = data_providers.get_provider().get_option_chain(self.ticker, expiry_date)
+        return self._chains[expiry_date]
+
+    def risk_free_rate(self):
+        if self._risk_free_rate is None:
+            self._risk_free_rate = data_providers.get_provider().get_risk_free_rate()
+        return self._risk_free_rate
+
+    def max_pain_term(self):
+        # Max pain for every listed expiry, batched into a single pass
+        if self._max_pain_term is None:
+            option_chains = {expiration_date: self.chain(expiration_date)
+                             for expiration_date in self.expiration_dates}
+            with stage('set_max_pain', self.ticker):
+                self._max_pain_term = calculate_max_pain_term_structure(option_chains)
+        return self._max_pain_term
+
+    def expiry_puts(self, sde, expiry_date):
+        if expiry_date not in self._expiry_puts:
+            self._expiry_puts[expiry_date] = load_expiry_puts(sde, expiry_date, self)
+        return self._expiry_puts[expiry_date]
+
 
 def set_sde_target_csp_options_data(sde, timeframe=5):
     # Fetch the ticker data
-    ticker_data = yf.Ticker(sde.ticker)
-
-    # Get the current stock price
-    stock_price = np.round(ticker_data.history(period="1d")["Close"].iloc[0], 3)
+    provider = data_providers.get_provider()
 
     # Get options expiration dates
-    options_expiration_dates = ticker_data.options
+    sde.ticker_options = TickerOptions(sde.ticker, provider.get_expiry_dates(sde.ticker))
 
-    # Find the expiration date that is at least 6 calendar days from today
-    today = pd.Timestamp.today().normalize()
+    # Find the first expiration date at least timeframe calendar days from today
+    option_selected_expiry_date = select_expiry_date(sde.ticker_options.expiration_dates,
+                                                     provider.get_session_date(), timeframe)
+
+    if option_selected_expiry_date:
+        apply_put_option(sde, sde.ticker_options.expiry_puts(sde, option_selected_expiry_date))
+    else:
+        logger.warning("%s: No expiration date found that is %s or more days out.", sde.ticker, timeframe)
+
+
+def select_expiry_date(options_expiration_dates, today, timeframe):
     x_days_out = today + pd.Timedelta(days=timeframe)
 
-    # Find the first expiration date that is 7 or more days away
-    option_selected_expiry_date = None
     for expiration_date in options_expiration_dates:
         if pd.Timestamp(expiration_date) >= x_days_out:
-            option_selected_expiry_date = expiration_date
-            break
+            return expiration_date
+    return None
 
-    if option_selected_expiry_date:
 
-        # Fetch the options chain for the selected expiration date
-        options_chain = ticker_data.option_chain(option_selected_expiry_date)
+def options_spot_price(sde):
+    # The live spot when one was fetched (intraday refreshes), otherwise the last daily bar, which already is the
+    # latest price for a run on fresh history
+    return sde.df_daily['Close'].iloc[-1] if sde.spot_price is None else sde.spot_price
 
-        #calculate Max Pain for the Expiration Date
-        sde.max_pain = set_max_pain(options_chain)
 
-        # Calculate CSP Options Data
-        puts = options_chain.puts
-        put_option = puts[puts['strike'] == sde.tgt_strike]
+def load_expiry_puts(sde, option_selected_expiry_date, ticker_options):
+    """
+    Calculate the max pain of one expiry and the Greeks of every put in its chain.
 
-        # If no exact match, find the closest strike price
-        if put_option.empty:
-            available_strikes = puts['strike'].values
-            closest_strike = min(available_strikes, key=lambda x: abs(x - sde.tgt_strike))
+    Parameters:
+    sde (StockDataEntry): Entry whose daily history is still loaded.
+    option_selected_expiry_date (str): Expiry to load.
+    ticker_options (TickerOptions): The ticker's chains, rate and max pain term structure.
 
-            put_option = puts[puts['strike'] == closest_strike]
+    Returns:
+    ExpiryPuts: The expiry's puts with Greeks and its max pain.
+    """
+    provider = data_providers.get_provider()
+    today = provider.get_session_date()
+
+    # Get the current stock price
+    stock_price = np.round(options_spot_price(sde), 3)
+
+    # Fetch the options chain for the selected expiration date
+    options_chain = ticker_options.chain(option_selected_expiry_date)
+
+    #calculate Max Pain for the Expiration Date
+    df_max_pain_term = None
+    if config.MAX_PAIN_TERM_STRUCTURE:
+        df_max_pain_term = ticker_options.max_pain_term()
+        max_pain = df_max_pain_term.loc[df_max_pain_term['expiry_date'] == option_selected_expiry_date,
+                                        'max_pain'].iloc[0]
+    else:
+        with stage('set_max_pain', sde.ticker):
+            max_pain = set_max_pain(options_chain)
 
-        # Get the first matching option (there should be only one, but just in case)
-        put_option = put_option.iloc[0]
+    # Get the current 3-month Treasury bill rate
+    current_rate = ticker_options.risk_free_rate()
+    days_to_expiry = (pd.to_datetime(option_selected_expiry_date) - today).days
 
-        # Extract relevant data from the option
-        sde.csp_strike_used = put_option["strike"]
-        sde.csp_expiry_date = option_selected_expiry_date
-        sde.csp_days_to_expiry = (pd.to_datetime(option_selected_expiry_date) - today).days
-        sde.csp_last_price = put_option['lastPrice']
-        sde.csp_volume = put_option["volume"]
-        sde.csp_open_interest = put_option["openInterest"]
-        sde.csp_implied_vol = np.round(put_option['impliedVolatility'] * 100, 3)  # mibian expects percentage
+    # Calculate Greeks for the whole put chain in one pass
+    with stage('chain_greeks', sde.ticker):
+        puts = options_pricing.add_chain_greeks(options_chain.puts, stock_price, current_rate, days_to_expiry,
+                                                option_type='put', iv_source=config.GREEKS_IV_SOURCE)
 
-        # Get the current 3-month Treasury bill rate
-        tbill = yf.Ticker("^IRX")
-        tbill_data = tbill.history(period="1d")
-        current_rate = tbill_data["Close"].iloc[0]
+    return ExpiryPuts(option_selected_expiry_date, days_to_expiry, max_pain, df_max_pain_term, puts)
 
-        # Use mibian to calculate Greeks
-        bs = mibian.BS([stock_price, sde.csp_strike_used, current_rate, sde.csp_days_to_expiry],
-                        volatility=sde.csp_implied_vol, putPrice=sde.csp_last_price)
 
-        # Save off values to dictionary
-        sde.csp_delta = np.round(bs.putDelta, 3)
-        sde.csp_theta = np.round(bs.putTheta, 3)
-        sde.csp_gamma = np.round(bs.gamma, 3)
-        sde.csp_vega = np.round(bs.vega, 3)
-        sde.csp_rho = np.round(bs.putRho, 3)
+def apply_put_option(sde, expiry_puts):
+    # Set the CSP options fields from the put nearest the entry's target strike
+    puts = expiry_puts.puts
+    sde.max_pain = expiry_puts.max_pain
+    if expiry_puts.df_max_pain_term is not None:
+        sde.df_max_pain_term = expiry_puts.df_max_pain_term
 
+    # In HORIZON_MODE the target is sized for this expiry's holding period instead of a calendar week
+    if config.HORIZON_MODE:
+        tgt_strike = set_horizon_target(sde, expiry_puts.expiry_date)
     else:
-        print("No expiration date found that is 7 or more days out.")
+        tgt_strike = sde.tgt_strike
+        sde.csp_horizon_days = sde.csp_horizon_tgt_strike_pct = np.nan
+        sde.csp_horizon_pct_chance_assigned = sde.csp_horizon_tgt_strike = np.nan
+
+    # Calculate CSP Options Data
+    put_option = puts[puts['strike'] == tgt_strike]
+
+    # If no exact match, find the closest strike price
+    if put_option.empty:
+        available_strikes = puts['strike'].values
+        closest_strike = min(available_strikes, key=lambda x: abs(x - tgt_strike))
+
+        put_option = puts[puts['strike'] == closest_strike]
+
+    # Get the first matching option (there should be only one, but just in case)
+    put_option = put_option.iloc[0]
+
+    # Extract relevant data from the option
+    sde.csp_strike_used = put_option["strike"]
+    sde.csp_expiry_date = expiry_puts.expiry_date
+    sde.csp_days_to_expiry = expiry_puts.days_to_expiry
+    sde.csp_last_price = put_option['lastPrice']
+    sde.csp_volume = put_option["volume"]
+    sde.csp_open_interest = put_option["openInterest"]
+    sde.csp_implied_vol = put_option['iv']  # percentage, as mibian expected
+
+    # Save off values to dictionary
+    sde.csp_delta = np.round(put_option['delta'], 3)
+    sde.csp_theta = np.round(put_option['theta'], 3)
+    sde.csp_gamma = np.round(put_option['gamma'], 3)
+    sde.csp_vega = np.round(put_option['vega'], 3)
+    sde.csp_rho = np.round(put_option['rho'], 3)
+
+
+def set_horizon_target(sde, expiry_date):
+    """
+    Target strike % and % chance assigned from the returns over the trading days between the last close and
+    the expiry, with the entry's safety %. The distributions are cached on the entry's horizon returns, so
+    every further expiry of the ticker only costs a lookup.
+
+    Parameters:
+    sde (StockDataEntry): Entry with horizon returns, csp_safety_pct and the last close set.
+    expiry_date (str): Expiry the put is sold for.
+
+    Returns:
+    float: The horizon's target strike.
+    """
+    horizons = sde.horizon_returns
+    sde.csp_horizon_days = horizons.horizon(horizon_returns.trading_days_to_expiry(sde.last_close_date, expiry_date))
+    sde.csp_horizon_tgt_strike_pct, sde.csp_horizon_pct_chance_assigned = horizons.target(sde.csp_horizon_days,
+                                                                                          sde.csp_safety_pct)
+
+    sde.csp_horizon_tgt_strike = sde_csp_meta.strike_on_grid(sde.last_close_price, sde.csp_horizon_tgt_strike_pct)
+    return sde.csp_horizon_tgt_strike
 
 """
 Calculates the max pain price for a given option chain.
-option_chain: DataFrame containing ['strike', 'openInterest', 'type']
+option_chain: OptionChain with calls and puts DataFrames containing ['strike', 'openInterest']
 """
 def set_max_pain(options_chain):
-    calls = options_chain.calls[['strike', 'openInterest']].copy()
-    calls['type'] = 'call'
-    puts = options_chain.puts[['strike', 'openInterest']].copy()
-    puts['type'] = 'put'
+    max_pain_term = calculate_max_pain_term_structure({None: options_chain})
+    return max_pain_term['max_pain'].iloc[0]
+
+
+def calculate_max_pain_term_structure(option_chains):
+    """
+    Calculate max pain for every expiration date in one vectorized pass.
+
+    For a candidate settlement price S, call writers owe sum((S - k) * oi) over calls struck below S and
+    put writers owe sum((k - S) * oi) over puts struck above S. Both are rebuilt from cumulative open
+    interest sums over the sorted strikes, so each expiry costs O(K log K) instead of O(K^2).
+
+    Parameters:
+    option_chains (dict): Expiration date -> OptionChain for that date.
+
+    Returns:
+    DataFrame: One row per expiration date with ['expiry_date', 'max_pain'], in the order given.
+    """
+    expiry_dates = list(option_chains.keys())
+
+    # Stack every contract of every expiry into flat arrays, tagged with the index of its expiry
+    groups, strikes, call_oi, put_oi = [], [], [], []
+    for group, expiry_date in enumerate(expiry_dates):
+        for side, is_call in ((option_chains[expiry_date].calls, True), (option_chains[expiry_date].puts, False)):
+            side_strikes = side['strike'].to_numpy(dtype=np.float64)
+            side_oi = np.nan_to_num(side['openInterest'].to_numpy(dtype=np.float64))
+            zeros = np.zeros(side_strikes.shape[0])
+
+            groups.append(np.full(side_strikes.shape[0], group))
+            strikes.append(side_strikes)
+            call_oi.append(side_oi if is_call else zeros)
+            put_oi.append(zeros if is_call else side_oi)
+
+    # Expiries without contracts get no max pain; with none at all there is nothing to reduce
+    max_pain = np.full(len(expiry_dates), np.nan)
+    if not sum(group_rows.shape[0] for group_rows in groups):
+        return pd.DataFrame({'expiry_date': expiry_dates, 'max_pain': max_pain})
+
+    groups = np.concatenate(groups)
+    strikes = np.concatenate(strikes)
+    call_oi = np.concatenate(call_oi)
+    put_oi = np.concatenate(put_oi)
+
+    # Collapse to one row per (expiry, strike), sorted by expiry then strike
+    keys = np.stack([groups, strikes], axis=1)
+    unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    groups = unique_keys[:, 0].astype(np.int64)
+    strikes = unique_keys[:, 1]
+    call_oi = np.bincount(inverse, weights=call_oi, minlength=unique_keys.shape[0])
+    put_oi = np.bincount(inverse, weights=put_oi, minlength=unique_keys.shape[0])
+
+    # Cumulative sums restarted at the first row of every expiry
+    group_starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    group_ends = np.r_[group_starts[1:], groups.shape[0]]
 
-    # Merge calls and puts
-    option_chain = pd.concat([calls, puts])
+    def grouped_cumsum(values):
+        cumsum = np.cumsum(values)
+        offsets = np.r_[0, cumsum[group_starts[1:] - 1]]
+        return cumsum - np.repeat(offsets, group_ends - group_starts)
 
-    # Calculate max pain for this expiration
+    def grouped_total(values):
+        return np.repeat(np.add.reduceat(values, group_starts), group_ends - group_starts)
 
-    strikes = option_chain['strike'].unique()
-    total_pain = []
+    # Loss to call writers: calls at or below the strike
+    cum_call_oi = grouped_cumsum(call_oi)
+    cum_call_value = grouped_cumsum(call_oi * strikes)
+    call_loss = strikes * cum_call_oi - cum_call_value
 
-    for strike in strikes:
-        # Calculate total loss for calls
-        call_loss = ((strike - option_chain[option_chain['type'] == 'call']['strike']).clip(lower=0) *
-                     option_chain[option_chain['type'] == 'call']['openInterest']).sum()
+    # Loss to put writers: puts above the strike (everything not at or below it)
+    above_put_oi = grouped_total(put_oi) - grouped_cumsum(put_oi)
+    above_put_value = grouped_total(put_oi * strikes) - grouped_cumsum(put_oi * strikes)
+    put_loss = above_put_value - strikes * above_put_oi
 
-        # Calculate total loss for puts
-        put_loss = ((option_chain[option_chain['type'] == 'put']['strike'] - strike).clip(lower=0) *
-                    option_chain[option_chain['type'] == 'put']['openInterest']).sum()
+    total_pain = call_loss + put_loss
 
-        # Total loss at this strike
-        total_pain.append((strike, call_loss + put_loss))
+    # Lowest pain per expiry, ties going to the lowest strike
+    order = np.lexsort((total_pain, groups))
+    _, first_in_group = np.unique(groups[order], return_index=True)
+    max_pain_rows = order[first_in_group]
 
-    # Find the strike price with the lowest total pain
-    max_pain_price = min(total_pain, key=lambda x: x[1])[0]
+    max_pain[groups[max_pain_rows]] = np.round(strikes[max_pain_rows], 2)
 
-    return np.round(max_pain_price, 2)
\ No newline at end of file
+    return pd.DataFrame({'expiry_date': expiry_dates, 'max_pain': max_pain})
@@ -0,0 +1,169 @@
+import ast
+import datetime
+import functools
+import math
+import operator
+import config
+from instrumentation import logger
+
+# Fields the filter expression can use: everything the history based stages (sde_meta, sde_ta, sde_csp_meta)
+# have set by the time it runs
+FILTER_FIELDS = ('data_start_date', 'data_end_date', 'total_weeks', 'avg_weekly_return', 'lowest_move_date',
+                 'lowest_move_close', 'lowest_move_pct', 'last_close_date', 'last_close_price',
+                 'two_hundred_day_ma', 'fifty_day_ma', 'rsi', 'macd_line', 'macd_signal', 'macd_histogram',
+                 'bollinger_upper', 'bollinger_lower', 'bollinger_middle',
+                 'csp_safety_pct', 'tgt_strike_pct', 'tgt_strike_pct_hist_run_max', 'tgt_strike_pct_hist_run_min',
+                 'tgt_strike_pct_hist_run_avg', 'pct_chance_assigned', 'tgt_strike')
+
+# Fields holding dates: they can only be compared with each other or with an ISO date string, e.g.
+# data_start_date <= '2016-01-01'
+DATE_FIELDS = ('data_start_date', 'data_end_date', 'lowest_move_date', 'last_close_date')
+
+# Settings the expression can use by name, e.g. tgt_strike * 100 <= CASH_ON_HAND
+FILTER_SETTINGS = ('CASH_ON_HAND',)
+
+FILTER_FUNCTIONS = {'abs': abs, 'min': min, 'max': max, 'round': round}
+
+_BINARY_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+                     ast.Div: operator.truediv, ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+                     ast.Pow: operator.pow}
+_UNARY_OPERATORS = {ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Not: operator.not_}
+_COMPARE_OPERATORS = {ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le,
+                      ast.Gt: operator.gt, ast.GtE: operator.ge}
+_ALLOWED_NODES = (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call,
+                  ast.Name, ast.Load, ast.Constant, *_BINARY_OPERATORS, *_UNARY_OPERATORS, *_COMPARE_OPERATORS)
+
+
+# PRE-FILTER: Drop tickers on sight before the option chain is fetched, e.g. a close below the 200 day MA, an RSI
+# extreme, a strike too large for CASH_ON_HAND or too little history. Pruned entries skip the option and profit
+# stages and are kept in the results with pruned = True.
+def set_sde_prefilter(sde):
+    if not config.PREFILTER:
+        sde.pruned = False
+        return
+
+    names = {field: getattr(sde, field) for field in FILTER_FIELDS}
+    names.update({setting: getattr(config, setting) for setting in FILTER_SETTINGS})
+
+    try:
+        sde.pruned = not _evaluate(compile_filter(config.PREFILTER), names)
+    except _MissingValue:
+        sde.pruned = True
+
+    if sde.pruned:
+        logger.info("%s: pruned by PREFILTER, skipping option data", sde.ticker)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_filter(expression):
+    """
+    Parse a filter expression and check it only uses what a filter may: field and setting names, number
+    constants, arithmetic, comparisons, and/or/not and the FILTER_FUNCTIONS. Nothing is ever passed to eval.
+    Date fields are checked to only be compared with dates, ISO date strings becoming dates, so a filter that
+    would fail on every ticker is rejected here.
+
+    Parameters:
+    expression (str): The filter, e.g. "last_close_price > two_hundred_day_ma and 30 <= rsi <= 70".
+
+    Returns:
+    ast.AST: The parsed expression, for _evaluate.
+    """
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"PREFILTER is not a valid expression: {e.msg}") from None
+
+    allowed_names = set(FILTER_FIELDS) | set(FILTER_SETTINGS)
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"PREFILTER cannot use {type(node).__name__}")
+
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FILTER_FUNCTIONS or node.keywords:
+                raise ValueError(f"PREFILTER can only call {', '.join(FILTER_FUNCTIONS)} ({ast.unparse(node)})")
+        elif isinstance(node, ast.Name) and node.id not in allowed_names and node.id not in FILTER_FUNCTIONS:
+            raise ValueError(f"PREFILTER uses unknown name '{node.id}'")
+
+    _check_kind(tree.body)
+    return tree.body
+
+
+def _check_kind(node):
+    # 'date' or 'number' (bools count as numbers) of a checked node; raises ValueError on mixing them
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, str):
+            try:
+                node.value = datetime.date.fromisoformat(node.value)
+            except ValueError:
+                raise ValueError(f"PREFILTER strings must be dates like '2016-01-01' ({ast.unparse(node)})") from None
+            return 'date'
+        if not isinstance(node.value, (int, float)):
+            raise ValueError(f"PREFILTER cannot use the constant {ast.unparse(node)}")
+        return 'number'
+
+    if isinstance(node, ast.Name):
+        return 'date' if node.id in DATE_FIELDS else 'number'
+
+    if isinstance(node, ast.Compare):
+        kinds = [_check_kind(operand) for operand in [node.left] + node.comparators]
+        if len(set(kinds)) > 1:
+            raise ValueError(f"PREFILTER compares a date with a number ({ast.unparse(node)})")
+        return 'number'
+
+    # Arithmetic, and/or/not and function calls only take numbers
+    operands = {ast.BoolOp: lambda: node.values, ast.UnaryOp: lambda: [node.operand],
+                ast.BinOp: lambda: [node.left, node.right], ast.Call: lambda: node.args}[type(node)]()
+    for operand in operands:
+        if _check_kind(operand) != 'number':
+            raise ValueError(f"PREFILTER dates can only be compared ({ast.unparse(node)})")
+    return 'number'
+
+
+class _MissingValue(Exception):
+    """Raised while evaluating a filter that reads a missing (None or NaN) value; the ticker fails the filter."""
+
+
+def _checked(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        raise _MissingValue
+    return value
+
+
+def _evaluate(node, names):
+    # Walk the checked tree. A missing value anywhere, read from a field or produced by the arithmetic, raises
+    # _MissingValue rather than being compared, so a ticker lacking a value fails the filter however it is written
+    if isinstance(node, ast.Constant):
+        return node.value
+
+    if isinstance(node, ast.Name):
+        return _checked(names[node.id])
+
+    if isinstance(node, ast.BoolOp):
+        # Short circuits like Python's and/or
+        for value in node.values:
+            result = bool(_evaluate(value, names))
+            if result == isinstance(node.op, ast.Or):
+                return result
+        return result
+
+    if isinstance(node, ast.UnaryOp):
+        return _UNARY_OPERATORS[type(node.op)](_evaluate(node.operand, names))
+
+    if isinstance(node, ast.BinOp):
+        try:
+            return _checked(_BINARY_OPERATORS[type(node.op)](_evaluate(node.left, names),
+                                                             _evaluate(node.right, names)))
+        except ZeroDivisionError:
+            raise _MissingValue from None
+
+    if isinstance(node, ast.Compare):
+        left = _evaluate(node.left, names)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _evaluate(comparator, names)
+            if not _COMPARE_OPERATORS[type(op)](left, right):
+                return False
+            left = right
+        return True
+
+    # ast.Call, already checked to be one of FILTER_FUNCTIONS
+    return _checked(FILTER_FUNCTIONS[node.func.id](*(_evaluate(arg, names) for arg in node.args)))
@@ -1,28 +1,51 @@
 import numpy as np
+import config
+import ta_state
 
 def set_sde_ta_data(sde):
+    if config.TA_INCREMENTAL:
+        # Advance the saved indicator state by the new bars only
+        ta_values = ta_state.calculate_ta_values_incremental(sde.ticker, sde.df_daily)
+
+        if config.TA_VERIFY:
+            full_values = calculate_ta_values(sde.df_daily[['Close']].copy())
+            ta_state.verify_ta_values(sde.ticker, ta_values, full_values)
+    else:
+        # Work on a Close-only view so the indicator columns are not added to the shared daily history
+        ta_values = calculate_ta_values(sde.df_daily[['Close']])
+
+    for field, value in ta_values.items():
+        setattr(sde, field, value)
+
+
+def calculate_ta_values(df):
+    # Full recompute of every indicator over the whole daily history
+    ta_values = {}
+
     # Calculate 200 Day MA
-    sde.df_daily['200_MA'] = sde.df_daily['Close'].rolling(window=200).mean()
-    sde.two_hundred_day_ma = np.round(sde.df_daily['200_MA'].iloc[-1], 2)
+    df['200_MA'] = df['Close'].rolling(window=200).mean()
+    ta_values['two_hundred_day_ma'] = np.round(df['200_MA'].iloc[-1], 2)
 
     # Calculate 50 Day MA
-    sde.df_daily['50_MA'] = sde.df_daily['Close'].rolling(window=50).mean()
-    sde.fifty_day_ma = np.round(sde.df_daily['50_MA'].iloc[-1], 2)
+    df['50_MA'] = df['Close'].rolling(window=50).mean()
+    ta_values['fifty_day_ma'] = np.round(df['50_MA'].iloc[-1], 2)
 
     # Calculate RSI
-    sde.rsi = calculate_rsi(sde.df_daily)
+    ta_values['rsi'] = calculate_rsi(df)
 
     # Calculate MACD
-    macd_data = calculate_macd(sde.df_daily)
-    sde.macd_line = macd_data['MACD_Line']
-    sde.macd_signal = macd_data['Signal_Line']
-    sde.macd_histogram = macd_data['MACD_Histogram']
+    macd_data = calculate_macd(df)
+    ta_values['macd_line'] = macd_data['MACD_Line']
+    ta_values['macd_signal'] = macd_data['Signal_Line']
+    ta_values['macd_histogram'] = macd_data['MACD_Histogram']
 
     # Calculate Bollinger Bands
-    bollinger_data = calculate_bollinger_bands(sde.df_daily)
-    sde.bollinger_upper = bollinger_data['Upper_Band']
-    sde.bollinger_lower = bollinger_data['Lower_Band']
-    sde.bollinger_middle = bollinger_data['Middle_Band']
+    bollinger_data = calculate_bollinger_bands(df)
+    ta_values['bollinger_upper'] = bollinger_data['Upper_Band']
+    ta_values['bollinger_lower'] = bollinger_data['Lower_Band']
+    ta_values['bollinger_middle'] = bollinger_data['Middle_Band']
+
+    return ta_values
 
 
 # Calculate the RSI (Relative Strength Index) with a 14-day window
@@ -0,0 +1,262 @@
+import json
+import threading
+from datetime import datetime, time as dt_time, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from zoneinfo import ZoneInfo
+import config
+import fetch_pipeline
+import data_providers
+from checkpoint import entry_to_record
+from instrumentation import logger
+from stock_data_entry import StockDataEntry
+
+MARKET_OPEN = dt_time(9, 30)
+MARKET_CLOSE = dt_time(16, 0)
+
+
+class AnalysisService:
+    """
+    Keeps every ticker's analyzed entry, with its price history and weekly stats, warm in memory and
+    refreshes it on a schedule: option data every SERVICE_OPTIONS_INTERVAL seconds while the market is
+    open, and the full analysis (history, weekly stats, TA and options) once after each close.
+
+    Parameters:
+    tickers (list): The universe to serve.
+    """
+    def __init__(self, tickers):
+        self.tickers = list(tickers)
+        self.entries = {}
+        self.failures = {}
+        self.last_history_refresh = None
+        self.last_options_refresh = None
+
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pending_entries = None
+
+    # -- Refresh jobs --
+
+    def refresh_history(self):
+        # Full analysis of every ticker; entries are collected through record_result and swapped in at the end
+        with self._refresh_lock:
+            logger.info("Service: refreshing price history and full analysis")
+            self._pending_entries = {}
+            fetch_pipeline.run_universe(self.tickers, max_workers=config.MAX_CONCURRENT_TICKERS, checkpoint=self,
+                                        keep_frames=True)
+
+            with self._lock:
+                self.entries.update(self._pending_entries)
+                self.last_history_refresh = _now()
+            self._pending_entries = None
+
+    def refresh_options(self):
+        # Recalculate every entry against a new option snapshot; the stage memo restores everything that only
+        # depends on the unchanged history, so just the option and profit stages run again
+        with self._refresh_lock:
+            logger.info("Service: refreshing option snapshots")
+            option_snapshot = _now().isoformat()
+            with self._lock:
+                entries = list(self.entries.values())
+
+            for entry in entries:
+                refreshed = _copy_entry(entry)
+                try:
+                    # The stored history ends at the last close, so the options are priced against a live spot
+                    spot_price = data_providers.get_provider().get_last_price(entry.ticker)
+                    refreshed.calculate_all_data_fields(entry.ticker, entry.df_daily, entry.df_weekly,
+                                                        option_snapshot=option_snapshot, memoize=True,
+                                                        spot_price=spot_price)
+                    if config.SCAN_MODE and not refreshed.pruned:
+                        import csp_scanner
+                        refreshed.df_scan = csp_scanner.scan_ticker_puts(refreshed)
+                except Exception as e:
+                    logger.error("%s: option refresh FAILED - %s: %s", entry.ticker, type(e).__name__, e)
+                    self.record_failure(entry.ticker, f"{type(e).__name__}: {e}")
+                    continue
+
+                with self._lock:
+                    self.entries[entry.ticker] = refreshed
+                    self.failures.pop(entry.ticker, None)
+
+            with self._lock:
+                self.last_options_refresh = _now()
+
+    # Called by run_universe as each ticker finishes, the same way it reports to a RunCheckpoint
+    def record_result(self, sde):
+        with self._lock:
+            self._pending_entries[sde.ticker] = sde
+            self.failures.pop(sde.ticker, None)
+
+    def record_failure(self, ticker, reason):
+        with self._lock:
+            self.failures[ticker] = reason
+
+    # -- Scheduling --
+
+    def history_due(self, now=None):
+        # Once per close: due when the last refresh happened before the most recent close
+        now = now or _now()
+        return self.last_history_refresh is None or self.last_history_refresh < last_market_close(now)
+
+    def options_due(self, now=None):
+        now = now or _now()
+        if not is_market_open(now):
+            return False
+        if self.last_options_refresh is None:
+            return True
+        return (now - self.last_options_refresh).total_seconds() >= config.SERVICE_OPTIONS_INTERVAL
+
+    def run_scheduler(self):
+        while not self._stop.is_set():
+            try:
+                if self.history_due():
+                    self.refresh_history()
+                elif self.options_due():
+                    self.refresh_options()
+            except Exception as e:
+                logger.error(f"Service: scheduled refresh FAILED - {type(e).__name__}: {e}")
+
+            self._stop.wait(config.SERVICE_POLL_SECONDS)
+
+    def stop(self):
+        self._stop.set()
+
+    # -- Queries --
+
+    def status(self):
+        with self._lock:
+            return {
+                'tickers': len(self.tickers),
+                'analyzed': len(self.entries),
+                'failures': dict(self.failures),
+                'market_open': is_market_open(_now()),
+                'last_history_refresh': _isoformat(self.last_history_refresh),
+                'last_options_refresh': _isoformat(self.last_options_refresh)
+            }
+
+    def results(self):
+        with self._lock:
+            entries = sorted(self.entries.values(), key=lambda entry: entry.ticker)
+        return [entry_to_record(entry) for entry in entries]
+
+    def ticker_detail(self, ticker):
+        with self._lock:
+            entry = self.entries.get(ticker)
+            failure = self.failures.get(ticker)
+
+        if entry is None:
+            return None if failure is None else {'ticker': ticker, 'failure': failure}
+
+        detail = {'result': entry_to_record(entry), 'failure': failure}
+        if entry.df_scan is not None:
+            detail['scan'] = json.loads(entry.df_scan.to_json(orient='records', date_format='iso'))
+        return detail
+
+
+def _copy_entry(sde):
+    # The memo is copied too, so a failed refresh leaves the original entry's memo as it was
+    entry = StockDataEntry()
+    for field in StockDataEntry.__slots__:
+        setattr(entry, field, getattr(sde, field))
+    entry.stage_memo = dict(sde.stage_memo or {})
+    return entry
+
+
+def _now():
+    return datetime.now(ZoneInfo(config.SERVICE_MARKET_TZ))
+
+
+def _isoformat(timestamp):
+    return None if timestamp is None else timestamp.isoformat(timespec='seconds')
+
+
+def is_market_open(now):
+    # Regular session on weekdays; exchange holidays are not tracked, a refresh then just sees unchanged data
+    return now.weekday() < 5 and MARKET_OPEN <= now.time() < MARKET_CLOSE
+
+
+def last_market_close(now):
+    # Most recent weekday close at or before now
+    close = now.replace(hour=MARKET_CLOSE.hour, minute=MARKET_CLOSE.minute, second=0, microsecond=0)
+    if now < close:
+        close -= timedelta(days=1)
+    while close.weekday() >= 5:
+        close -= timedelta(days=1)
+    return close
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    Local JSON API:
+
+    GET  /health                 liveness check
+    GET  /status                 refresh times, counts and failing tickers
+    GET  /results                latest result row of every ticker
+    GET  /results/<TICKER>       one ticker's result row, failure reason and scan candidates
+    POST /refresh/options        refresh option data now
+    POST /refresh/history        rerun the full analysis now
+    """
+    service = None
+
+    def do_GET(self):
+        path = self.path.rstrip('/')
+
+        if path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif path == '/status':
+            self._send_json(200, self.service.status())
+        elif path == '/results':
+            self._send_json(200, {'results': self.service.results()})
+        elif path.startswith('/results/'):
+            detail = self.service.ticker_detail(path.split('/', 2)[2].upper())
+            if detail is None:
+                self._send_json(404, {'error': 'unknown ticker'})
+            else:
+                self._send_json(200, detail)
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        jobs = {'/refresh/options': self.service.refresh_options, '/refresh/history': self.service.refresh_history}
+        job = jobs.get(self.path.rstrip('/'))
+
+        if job is None:
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        threading.Thread(target=job, name='manual-refresh', daemon=True).start()
+        self._send_json(202, {'status': 'refresh started'})
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("Service: %s " + format, self.address_string(), *args)
+
+
+def serve(tickers=None):
+    """
+    Run the service until interrupted: an initial full analysis, the refresh scheduler in the background
+    and the JSON API on SERVICE_HOST:SERVICE_PORT.
+    """
+    service = AnalysisService(tickers or config.TICKERS)
+    ServiceRequestHandler.service = service
+
+    server = ThreadingHTTPServer((config.SERVICE_HOST, config.SERVICE_PORT), ServiceRequestHandler)
+    scheduler = threading.Thread(target=service.run_scheduler, name='scheduler', daemon=True)
+    scheduler.start()
+
+    logger.info(f"Service: listening on http://{config.SERVICE_HOST}:{config.SERVICE_PORT}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
@@ -0,0 +1,140 @@
+import os
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from instrumentation import logger
+
+
+class SnapshotCache:
+    """
+    Thread safe in-memory LRU cache with a TTL per entry and optional on-disk persistence.
+
+    Entries are grouped by kind (expiries, chain, rate, ...) so hit/miss counts can be reported per
+    data type. When persist_dir is set every fetched value is also pickled there, so an intraday rerun
+    in a new process starts warm for anything that has not expired yet.
+
+    Parameters:
+    max_entries (int): Entries kept in memory before the least recently used one is evicted.
+    persist_dir (str): Directory to persist entries in, or None to keep them in memory only.
+    lock_stripes (int): Size of the fixed pool of fetch locks the keys are hashed onto.
+    """
+    def __init__(self, max_entries=2048, persist_dir=None, lock_stripes=64):
+        self.max_entries = max_entries
+        self.persist_dir = persist_dir
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # A fixed pool of striped locks rather than one per key, so the locks do not grow with every key ever
+        # fetched. Two keys on the same stripe only wait for each other, fetch_fn never calls back into the cache.
+        self._key_locks = [threading.Lock() for _ in range(max(1, lock_stripes))]
+
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    def get_or_fetch(self, kind, key, ttl, fetch_fn):
+        cache_key = (kind, key)
+
+        value, found = self._get(cache_key)
+        if found:
+            self._count(self.hits, kind)
+            return value
+
+        # Only one thread fetches a given key, the rest wait and then read what it stored
+        with self._key_lock(cache_key):
+            value, found = self._get(cache_key)
+            if found:
+                self._count(self.hits, kind)
+                return value
+
+            persisted = self._load(cache_key)
+            if persisted is not None:
+                expires_at, value = persisted
+                self._count(self.hits, kind)
+                self._put(cache_key, value, expires_at)
+                return value
+
+            self._count(self.misses, kind)
+            value = fetch_fn()
+            expires_at = time.time() + ttl
+            self._put(cache_key, value, expires_at)
+            self._persist(cache_key, value, expires_at)
+
+            return value
+
+    def _key_lock(self, cache_key):
+        return self._key_locks[hash(cache_key) % len(self._key_locks)]
+
+    def _count(self, counter, kind):
+        with self._lock:
+            counter[kind] += 1
+
+    def _get(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+
+            if entry is None:
+                return None, False
+
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[cache_key]
+                return None, False
+
+            self._entries.move_to_end(cache_key)
+            return value, True
+
+    def _put(self, cache_key, value, expires_at):
+        with self._lock:
+            self._entries[cache_key] = (expires_at, value)
+            self._entries.move_to_end(cache_key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _entry_path(self, cache_key):
+        kind, key = cache_key
+        safe_key = re.sub(r'[^A-Za-z0-9_.-]', '_', str(key))
+        return os.path.join(self.persist_dir, kind, f"{safe_key}.pkl")
+
+    def _persist(self, cache_key, value, expires_at):
+        if not self.persist_dir:
+            return
+
+        path = self._entry_path(cache_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((expires_at, value), f)
+        os.replace(tmp_path, path)
+
+    def _load(self, cache_key):
+        # Returns (expires_at, value) for a persisted entry that has not expired yet, otherwise None
+        if not self.persist_dir:
+            return None
+
+        path = self._entry_path(cache_key)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, 'rb') as f:
+            expires_at, value = pickle.load(f)
+
+        if expires_at <= time.time():
+            return None
+
+        return expires_at, value
+
+    def stats(self):
+        with self._lock:
+            kinds = sorted(set(self.hits) | set(self.misses))
+            return {kind: {'hits': self.hits[kind], 'misses': self.misses[kind]} for kind in kinds}
+
+    def log_stats(self):
+        logger.info("-- SNAPSHOT CACHE --")
+        for kind, counts in self.stats().items():
+            total = counts['hits'] + counts['misses']
+            hit_rate = counts['hits'] / total * 100 if total else 0
+            logger.info(f"{kind:<12} hits: {counts['hits']:>6}  misses: {counts['misses']:>6}  hit rate: {hit_rate:.1f}%")
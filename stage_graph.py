@@ -0,0 +1,208 @@
+import hashlib
+import itertools
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import config
+import sde_meta
+import sde_ta
+import sde_csp_meta
+import sde_prefilter
+import sde_csp_options
+import sde_indicators
+import sde_profit
+from weekly_stats import WeeklyStats
+from horizon_returns import HorizonReturns
+from instrumentation import stage
+
+
+def set_weekly_stats(sde):
+    # Weekly returns and the statistics every stage shares, computed once from the close array
+    sde.weekly_stats = WeeklyStats(sde.df_weekly['Date'].to_numpy(), sde.df_weekly['Close'].to_numpy())
+
+
+def set_horizon_returns(sde):
+    # Forward return distributions over 1 to HORIZON_MAX_DAYS trading days, only built in HORIZON_MODE
+    sde.horizon_returns = None
+    if config.HORIZON_MODE:
+        sde.horizon_returns = HorizonReturns(sde.df_daily['Close'].to_numpy(), config.HORIZON_MAX_DAYS)
+
+
+# One analysis stage: the setter to run, the entry fields it reads and writes, and the config settings that
+# change its result. Inputs not produced by another stage are either set on the entry before the graph runs
+# (ticker, df_daily, df_weekly, spot_price) or external, passed in per run (option_snapshot).
+Stage = namedtuple('Stage', ['name', 'fn', 'inputs', 'outputs', 'settings'])
+
+STAGES = [
+    Stage('weekly_stats', set_weekly_stats,
+          inputs=('df_weekly',),
+          outputs=('weekly_stats',),
+          settings=()),
+    Stage('horizon_returns', set_horizon_returns,
+          inputs=('df_daily',),
+          outputs=('horizon_returns',),
+          settings=('HORIZON_MODE', 'HORIZON_MAX_DAYS')),
+    Stage('sde_meta', sde_meta.set_sde_metadata,
+          inputs=('df_daily', 'df_weekly', 'weekly_stats'),
+          outputs=('data_start_date', 'data_end_date', 'total_weeks', 'avg_weekly_return', 'lowest_move_date',
+                   'lowest_move_close', 'lowest_move_pct', 'last_close_date', 'last_close_price'),
+          settings=()),
+    Stage('sde_ta', sde_ta.set_sde_ta_data,
+          inputs=('ticker', 'df_daily'),
+          outputs=('two_hundred_day_ma', 'fifty_day_ma', 'rsi', 'macd_line', 'macd_signal', 'macd_histogram',
+                   'bollinger_upper', 'bollinger_lower', 'bollinger_middle'),
+          settings=('TA_INCREMENTAL',)),
+    Stage('sde_csp_meta', sde_csp_meta.set_sde_target_csp_metadata,
+          inputs=('weekly_stats', 'last_close_price'),
+          outputs=('csp_safety_pct', 'tgt_strike_pct', 'pct_chance_assigned', 'tgt_strike_pct_hist_run_max',
+                   'tgt_strike_pct_hist_run_min', 'tgt_strike_pct_hist_run_avg', 'tgt_strike'),
+          settings=('CSP_SAFETY_PCT',)),
+    Stage('sde_prefilter', sde_prefilter.set_sde_prefilter,
+          inputs=sde_prefilter.FILTER_FIELDS,
+          outputs=('pruned',),
+          settings=('PREFILTER',) + sde_prefilter.FILTER_SETTINGS),
+    Stage('sde_csp_options', sde_csp_options.set_sde_target_csp_options_data,
+          inputs=('ticker', 'df_daily', 'spot_price', 'tgt_strike', 'pruned', 'horizon_returns', 'csp_safety_pct',
+                  'last_close_date', 'last_close_price', 'option_snapshot'),
+          outputs=('ticker_options', 'csp_strike_used', 'csp_expiry_date', 'csp_days_to_expiry', 'max_pain',
+                   'df_max_pain_term', 'csp_last_price', 'csp_volume', 'csp_open_interest', 'csp_implied_vol',
+                   'csp_delta', 'csp_theta', 'csp_gamma', 'csp_vega', 'csp_rho', 'csp_horizon_days',
+                   'csp_horizon_tgt_strike_pct', 'csp_horizon_pct_chance_assigned', 'csp_horizon_tgt_strike'),
+          settings=('MAX_PAIN_TERM_STRUCTURE', 'GREEKS_IV_SOURCE', 'HORIZON_MODE')),
+    Stage('sde_profit', sde_profit.set_sde_profit_data,
+          inputs=('pruned', 'csp_strike_used', 'csp_last_price'),
+          outputs=('cash_on_hand', 'max_contracts', 'potential_profit'),
+          settings=('CASH_ON_HAND',)),
+    Stage('sde_indicators', sde_indicators.set_ind_tgt_strike_pct,
+          inputs=('weekly_stats', 'tgt_strike_pct', 'tgt_strike_pct_hist_run_avg'),
+          outputs=('ind_tgt_strike_pct', 'ind_tgt_strike_pct_occurs', 'ind_tgt_strike_pct_current_run'),
+          settings=())
+]
+
+# Stages skipped for entries the pre-filter pruned; their outputs are left unset
+PRUNABLE_STAGES = ('sde_csp_options', 'sde_profit')
+PRUNABLE_FIELDS = tuple(field for current in STAGES if current.name in PRUNABLE_STAGES for field in current.outputs)
+
+
+def stage_levels(stages=STAGES):
+    """
+    Group the stages into levels: every stage only reads fields written by stages in earlier levels, so the
+    stages within a level are independent of each other and can run at the same time.
+
+    Returns:
+    list: Lists of stages, in dependency order.
+    """
+    producers = {output: current.name for current in stages for output in current.outputs}
+    depends_on = {current.name: {producers[field] for field in current.inputs if field in producers}
+                  for current in stages}
+
+    levels, placed = [], set()
+    while len(placed) < len(stages):
+        level = [current for current in stages
+                 if current.name not in placed and depends_on[current.name] <= placed]
+        if not level:
+            raise ValueError("Stage graph has a cycle")
+        levels.append(level)
+        placed.update(current.name for current in level)
+
+    return levels
+
+
+STAGE_LEVELS = stage_levels()
+
+# Distinct token for every run that does not say which option snapshot it uses, so the option stage reruns
+_fresh_snapshots = itertools.count()
+
+
+def run_stages(sde, option_snapshot=None, memoize=False, max_workers=1):
+    """
+    Run every stage on an entry level by level.
+
+    With memoize, each stage's outputs are kept on the entry under a hash of its inputs and settings, and a
+    later run on the same entry restores them instead of recomputing when that hash has not changed. Only
+    the stages downstream of a changed input run again: new daily bars rerun everything, a new option
+    snapshot only reruns the option and profit stages. Entries the pre-filter prunes skip the option and
+    profit stages altogether.
+
+    Parameters:
+    sde (StockDataEntry): Entry with ticker, df_daily and df_weekly set.
+    option_snapshot: Identifies the option data this run should see (e.g. the refresh time). None always
+        refreshes the option stage.
+    memoize (bool): Reuse outputs of stages whose inputs did not change since the last run on this entry.
+    max_workers (int): Stages of the same level run concurrently when > 1.
+    """
+    if option_snapshot is None:
+        option_snapshot = ('fresh', next(_fresh_snapshots))
+    externals = {'option_snapshot': option_snapshot}
+
+    if memoize and sde.stage_memo is None:
+        sde.stage_memo = {}
+    fingerprints = {}
+
+    def run(current):
+        if sde.pruned and current.name in PRUNABLE_STAGES:
+            for field in current.outputs:
+                setattr(sde, field, None)
+            return
+
+        if memoize:
+            key = _stage_key(sde, current, externals, fingerprints)
+            memo = sde.stage_memo.get(current.name)
+            if memo is not None and memo[0] == key:
+                for field, value in memo[1].items():
+                    setattr(sde, field, value)
+                return
+
+        with stage(current.name, sde.ticker):
+            current.fn(sde)
+
+        if memoize:
+            sde.stage_memo[current.name] = (key, {field: getattr(sde, field) for field in current.outputs})
+
+    for level in STAGE_LEVELS:
+        if max_workers > 1 and len(level) > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(level)), thread_name_prefix='stage') as executor:
+                # list() so an exception in any stage is raised here
+                list(executor.map(run, level))
+        else:
+            for current in level:
+                run(current)
+
+
+def _stage_key(sde, current, externals, fingerprints):
+    # Hash of everything the stage reads; fingerprints of big inputs are shared between stages of one run
+    digest = hashlib.blake2b(current.name.encode(), digest_size=16)
+
+    for field in current.inputs:
+        if field in externals:
+            digest.update(repr(externals[field]).encode())
+            continue
+
+        # Fields produced by earlier stages are settled by the time this stage runs, so caching is safe
+        if field not in fingerprints:
+            fingerprints[field] = _fingerprint(getattr(sde, field))
+        digest.update(fingerprints[field])
+
+    for setting in current.settings:
+        digest.update(repr(getattr(config, setting)).encode())
+
+    return digest.digest()
+
+
+def _fingerprint(value):
+    if isinstance(value, pd.DataFrame):
+        digest = hashlib.blake2b(repr(list(value.columns)).encode(), digest_size=16)
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        return digest.digest()
+    if isinstance(value, WeeklyStats):
+        digest = hashlib.blake2b(value.dates.tobytes(), digest_size=16)
+        digest.update(value.closes.tobytes())
+        return digest.digest()
+    if isinstance(value, HorizonReturns):
+        digest = hashlib.blake2b(value.closes.tobytes(), digest_size=16)
+        digest.update(repr(value.max_days).encode())
+        return digest.digest()
+    if isinstance(value, np.ndarray):
+        return hashlib.blake2b(value.tobytes(), digest_size=16).digest()
+    return repr(value).encode()
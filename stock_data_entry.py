@@ -1,120 +1,131 @@
-import numpy as np
-import pandas as pd
-import sde_meta
-import sde_ta
-import sde_csp_meta
-import sde_csp_options
-import sde_indicators
-import sde_profit
+import config
+import stage_graph
+
+
+# Result fields and the type each one is stored as in the results table
+RESULT_FIELDS = {
+    # METADATA FIELDS
+    'ticker': 'str',
+    'data_start_date': 'date',
+    'data_end_date': 'date',
+    'total_weeks': 'int',
+    'avg_weekly_return': 'float',
+    'lowest_move_date': 'date',
+    'lowest_move_close': 'float',
+    'lowest_move_pct': 'float',
+    'last_close_date': 'date',
+    'last_close_price': 'float',
+
+    # TA DATA FIELDS
+    'two_hundred_day_ma': 'float',
+    'fifty_day_ma': 'float',
+    'rsi': 'float',
+    'macd_line': 'float',
+    'macd_signal': 'float',
+    'macd_histogram': 'float',
+    'bollinger_upper': 'float',
+    'bollinger_lower': 'float',
+    'bollinger_middle': 'float',
+
+    # TARGET CSP METADATA
+    'csp_safety_pct': 'float',
+    'tgt_strike_pct': 'float',
+    'tgt_strike_pct_hist_run_max': 'int',
+    'tgt_strike_pct_hist_run_min': 'int',
+    'tgt_strike_pct_hist_run_avg': 'float',
+    'pct_chance_assigned': 'float',
+    'tgt_strike': 'float',
+
+    # TARGET CSP OPTIONS DATA
+    'csp_strike_used': 'float',
+    'csp_expiry_date': 'date',
+    'csp_days_to_expiry': 'int',
+    'max_pain': 'float',
+    'csp_last_price': 'float',
+    'csp_volume': 'float',
+    'csp_open_interest': 'int',
+    'csp_implied_vol': 'float',
+    'csp_delta': 'float',
+    'csp_theta': 'float',
+    'csp_gamma': 'float',
+    'csp_vega': 'float',
+    'csp_rho': 'float',
+
+    # HORIZON MATCHED TARGET (HORIZON_MODE): target sized from returns over the trading days to the expiry
+    'csp_horizon_days': 'int',
+    'csp_horizon_tgt_strike_pct': 'float',
+    'csp_horizon_pct_chance_assigned': 'float',
+    'csp_horizon_tgt_strike': 'float',
+
+    # POTENTIAL PROFIT FIELDS
+    'cash_on_hand': 'float',
+    'max_contracts': 'float',
+    'potential_profit': 'float',
+
+    # SPECIAL INDICATORS FIELDS
+    'ind_tgt_strike_pct': 'bool',
+    'ind_tgt_strike_pct_occurs': 'int',
+    'ind_tgt_strike_pct_current_run': 'int',
+
+    # PRE-FILTER STATUS (pruned entries have no option or profit fields)
+    'pruned': 'bool'
+}
+
+# Working data used while a ticker is analyzed. The price history and weekly stats are the heavy ones and
+# are released once the ticker is done; the small per-ticker output tables are kept for their result files.
+FRAME_FIELDS = ('df_daily', 'df_weekly', 'weekly_stats', 'horizon_returns', 'ticker_options', 'df_max_pain_term',
+                'df_scan', 'df_backtest', 'df_sweep', 'df_assignment')
+HEAVY_FRAME_FIELDS = ('df_daily', 'df_weekly', 'weekly_stats', 'horizon_returns', 'ticker_options')
+
+# Outputs of each stage under the hash of its inputs, so recalculating an entry only reruns what changed
+STATE_FIELDS = ('stage_memo',)
+
+# Live price the options are priced against, fetched by the service's intraday refresh; None uses the last close
+INPUT_FIELDS = ('spot_price',)
 
 
 class StockDataEntry:
-    def __init__(self):
+    # Fixed slots instead of a per-instance __dict__ keeps each finished entry small
+    __slots__ = FRAME_FIELDS + STATE_FIELDS + INPUT_FIELDS + tuple(RESULT_FIELDS)
 
-        # METADATA FIELDS
-        self.df_daily = None
-        self.df_weekly = None
-        self.ticker = None
-        self.data_start_date = None
-        self.data_end_date = None
-        self.total_weeks = None
-        self.avg_weekly_return = None
-        self.lowest_move_date = None
-        self.lowest_move_close = None
-        self.lowest_move_pct = None
-        self.last_close_date = None
-        self.last_close_price = None
-
-        # TA DATA FIELDS
-        self.two_hundred_day_ma = None
-        self.fifty_day_ma = None
-        self.rsi = None
-        self.macd_line = None
-        self.macd_signal = None
-        self.macd_histogram = None
-        self.bollinger_upper = None
-        self.bollinger_lower = None
-        self.bollinger_middle = None
-
-        # TARGET CSP METADATA
-        self.csp_safety_pct = None
-        self.tgt_strike_pct = None
-        self.tgt_strike_pct_hist_run_max = None
-        self.tgt_strike_pct_hist_run_min = None
-        self.tgt_strike_pct_hist_run_avg = None
-        self.pct_chance_assigned = None
-        self.tgt_strike = None
-
-        # TARGET CSP OPTIONS DATA
-        self.csp_strike_used = None
-        self.csp_expiry_date = None
-        self.csp_days_to_expiry = None
-        self.max_pain = None
-        self.csp_last_price = None
-        self.csp_volume = None
-        self.csp_open_interest = None
-        self.csp_implied_vol = None
-        self.csp_delta = None
-        self.csp_theta = None
-        self.csp_gamma = None
-        self.csp_vega = None
-        self.csp_rho = None
-
-        # POTENTIAL PROFIT FIELDS
-        self.cash_on_hand = None
-        self.max_contracts = None
-        self.potential_profit = None
-
-        # SPECIAL INDICATORS FIELDS
-        self.ind_tgt_strike_pct = None
-        self.ind_tgt_strike_pct_occurs = None
-        self.ind_tgt_strike_pct_current_run = None
-
-    @classmethod
-    def new_dataframe(cls):
-        # Create an instance of the class
-        instance = cls()
-
-        # Get all instance attributes but exclude 'df_' prefixed attributes and dunder attributes
-        columns = [
-            k for k, v in instance.__dict__.items()
-            if not k.startswith('df_') and not k.startswith('__') and not callable(v) and k != 'new_dataframe'
-        ]
-
-        # Create an empty DataFrame with the filtered columns (attribute names)
-        df = pd.DataFrame(columns=columns)
-
-        return df
+    def __init__(self):
+        for field in self.__slots__:
+            setattr(self, field, None)
 
     def to_dict(self):
-        # Include attributes that don't start with '__' and don't start with 'df_'
-        return {k: v for k, v in self.__dict__.items() if not k.startswith('__') and not k.startswith('df_')}
+        # Result fields only, the 'df_' working frames are never part of the results
+        return {field: getattr(self, field) for field in RESULT_FIELDS}
+
+    def release_frames(self):
+        # Drop the full price history once every field has been calculated
+        for field in HEAVY_FRAME_FIELDS:
+            setattr(self, field, None)
 
     def _validate_fields(self):
-        # Loop through the instance's dictionary to check if any field is None
-        for field, value in self.__dict__.items():
-            if value is None:
+        # Loop through the result fields to check if any field is None ('df_' working frames are optional, and
+        # pruned entries never get option or profit fields)
+        skipped = stage_graph.PRUNABLE_FIELDS if self.pruned else ()
+        for field in RESULT_FIELDS:
+            if field not in skipped and getattr(self, field) is None:
                 raise ValueError(f"The field '{field}' is not set.")
 
     # Calculate all fields for the new Stock Data Entry
-    def calculate_all_data_fields(self, ticker, df, df_weekly):
+    def calculate_all_data_fields(self, ticker, df, df_weekly, option_snapshot=None, memoize=False, spot_price=None):
 
         self.ticker = ticker
         self.df_daily = df
 
-        df_weekly['Weekly Return'] = df_weekly['Close'].pct_change(fill_method=None) * 100
         self.df_weekly = df_weekly
+        self.spot_price = spot_price
 
         # ---------------------------------------------
         # -- CALCULATE ALL DATA FIELDS FOR THE ENTRY --
         # ---------------------------------------------
 
-        sde_meta.set_sde_metadata(self)
-        sde_ta.set_sde_ta_data(self)
-        sde_csp_meta.set_sde_target_csp_metadata(self)
-        sde_csp_options.set_sde_target_csp_options_data(self)
-        sde_profit.set_sde_profit_data(self)
-        sde_indicators.set_ind_tgt_strike_pct(self)
+        # Stages run in dependency order (see stage_graph.STAGES); called again on the same entry with
+        # memoize, only the stages whose inputs changed are recomputed
+        stage_graph.run_stages(self, option_snapshot=option_snapshot, memoize=memoize,
+                               max_workers=config.STAGE_WORKERS)
 
         # Perform safety check to ensure all fields are set
-        self._validate_fields()
\ No newline at end of file
+        self._validate_fields()
@@ -0,0 +1,145 @@
+import zlib
+import numpy as np
+import pandas as pd
+import options_pricing
+from data_providers import MarketDataProvider, OptionChain
+
+
+class SyntheticProvider(MarketDataProvider):
+    """
+    Offline provider serving seeded, reproducible market data: geometric Brownian motion daily OHLCV
+    histories and Black-Scholes priced option chains with a volatility skew.
+
+    Every ticker and every (ticker, expiry) chain gets its own generator derived from the seed and the
+    symbol, so data is the same whatever order or thread it is requested from. Only each ticker's last
+    price is kept between calls, so pricing its chains does not regenerate the history every time.
+
+    Parameters:
+    seed (int): Base seed for all generated data.
+    years (float): Years of daily history per ticker.
+    strikes (int): Strikes per side of each option chain.
+    expiries (int): Weekly expiration dates listed per ticker.
+    session_date (str): Date the data is as of; history ends on the last business day before it.
+    """
+    name = 'synthetic'
+
+    def __init__(self, seed=0, years=20, strikes=60, expiries=8, session_date='2026-10-17'):
+        self.seed = seed
+        self.years = years
+        self.strikes = strikes
+        self.expiries = expiries
+        self.session_date = pd.Timestamp(session_date).normalize()
+        self.risk_free_rate = 4.0
+        self._last_prices = {}
+
+        last_bar = self.session_date - pd.offsets.BDay(1)
+        self.dates = pd.bdate_range(end=last_bar, periods=int(years * 252), name='Date')
+
+    def _rng(self, *keys):
+        # crc32 rather than hash() so the data does not change with PYTHONHASHSEED
+        key = zlib.crc32('|'.join(str(k) for k in keys).encode())
+        return np.random.default_rng([self.seed, key])
+
+    def _ticker_params(self, ticker):
+        rng = self._rng('params', ticker)
+        return {
+            'start_price': rng.uniform(5, 500),
+            'drift': rng.uniform(-0.05, 0.25),
+            'volatility': rng.uniform(0.15, 0.80)
+        }
+
+    def get_price_history(self, ticker, start=None):
+        params = self._ticker_params(ticker)
+        rng = self._rng('history', ticker)
+        bars = self.dates.shape[0]
+
+        daily_vol = params['volatility'] / np.sqrt(252)
+        log_returns = rng.normal((params['drift'] - params['volatility'] ** 2 / 2) / 252, daily_vol, bars)
+        close = params['start_price'] * np.exp(np.cumsum(log_returns))
+
+        # Open near the previous close, high and low bracketing both
+        open_ = np.r_[params['start_price'], close[:-1]] * np.exp(rng.normal(0, daily_vol / 4, bars))
+        high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, daily_vol / 2, bars)))
+        low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, daily_vol / 2, bars)))
+        volume = rng.lognormal(np.log(2e6), 0.5, bars).astype(np.int64)
+
+        df = pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume},
+                          index=self.dates)
+
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        return df
+
+    def get_expiry_dates(self, ticker):
+        first_friday = self.session_date + pd.offsets.Week(weekday=4)
+        return [str(date.date()) for date in pd.date_range(first_friday, periods=self.expiries, freq='W-FRI')]
+
+    def get_option_chain(self, ticker, expiry_date):
+        spot = self.get_last_price(ticker)
+        volatility = self._ticker_params(ticker)['volatility'] * 100
+        days_to_expiry = max((pd.Timestamp(expiry_date) - self.session_date).days, 1)
+        rng = self._rng('chain', ticker, expiry_date)
+
+        # Strikes on a round increment spanning roughly +-40% of spot
+        increment = _strike_increment(spot * 0.8 / self.strikes)
+        center = np.round(spot / increment) * increment
+        strikes = center + increment * (np.arange(self.strikes) - self.strikes // 2)
+        strikes = strikes[strikes > 0]
+
+        # Skew: implied vol rises as the strike falls below spot
+        moneyness = np.log(strikes / spot)
+        implied_vol = np.maximum(volatility * (1 - 0.8 * moneyness) + rng.normal(0, 1, strikes.shape[0]), 5)
+
+        calls = self._chain_side(ticker, expiry_date, 'C', strikes, spot, implied_vol, days_to_expiry, rng)
+        puts = self._chain_side(ticker, expiry_date, 'P', strikes, spot, implied_vol, days_to_expiry, rng)
+        return OptionChain(calls, puts)
+
+    def _chain_side(self, ticker, expiry_date, right, strikes, spot, implied_vol, days_to_expiry, rng):
+        option_type = 'call' if right == 'C' else 'put'
+        fair = options_pricing.calculate_option_prices(spot, strikes, self.risk_free_rate, days_to_expiry,
+                                                       implied_vol, option_type=option_type)
+        fair = np.maximum(np.round(fair, 2), 0.01)
+
+        # Spreads widen and activity falls off away from the money
+        distance = np.abs(np.log(strikes / spot))
+        half_spread = np.maximum(np.round(fair * (0.02 + distance / 4), 2), 0.01)
+        activity = np.exp(-8 * distance)
+
+        contract_date = pd.Timestamp(expiry_date).strftime('%y%m%d')
+        return pd.DataFrame({
+            'contractSymbol': [f"{ticker}{contract_date}{right}{int(strike * 1000):08d}" for strike in strikes],
+            'strike': strikes,
+            'lastPrice': np.round(fair * np.exp(rng.normal(0, 0.03, strikes.shape[0])), 2),
+            'bid': np.maximum(fair - half_spread, 0.0),
+            'ask': fair + half_spread,
+            'volume': np.round(rng.poisson(2000 * activity)).astype(np.float64),
+            'openInterest': rng.poisson(20000 * activity),
+            'impliedVolatility': implied_vol / 100,
+            'inTheMoney': strikes < spot if right == 'C' else strikes > spot
+        })
+
+    def get_last_price(self, ticker):
+        # Every chain is priced off the spot; generated once per ticker so the benchmark's option stage timings
+        # do not include regenerating the history
+        if ticker not in self._last_prices:
+            self._last_prices[ticker] = float(self.get_price_history(ticker)['Close'].iloc[-1])
+        return self._last_prices[ticker]
+
+    def get_risk_free_rate(self):
+        return self.risk_free_rate
+
+    def get_session_date(self):
+        return self.session_date
+
+
+def _strike_increment(raw_increment):
+    # Round a raw spacing up to the nearest listed strike increment
+    for increment in (0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0):
+        if raw_increment <= increment:
+            return increment
+    return 100.0
+
+
+def synthetic_tickers(count):
+    # Stable, distinct symbols: SYN0000, SYN0001, ...
+    return [f"SYN{i:04d}" for i in range(count)]
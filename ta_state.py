@@ -0,0 +1,245 @@
+import copy
+import os
+import pickle
+from collections import deque
+import numpy as np
+import config
+
+# Rounding applied to each TA field, same as the full recompute in sde_ta
+TA_FIELD_DECIMALS = {
+    'two_hundred_day_ma': 2,
+    'fifty_day_ma': 2,
+    'rsi': 2,
+    'macd_line': 3,
+    'macd_signal': 3,
+    'macd_histogram': 3,
+    'bollinger_upper': 2,
+    'bollinger_lower': 2,
+    'bollinger_middle': 2
+}
+
+
+class EmaState:
+    # Matches pandas ewm(adjust=False): the first value seeds the average
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, x):
+        if self.value is None:
+            self.value = np.float64(x)
+        else:
+            self.value = (1 - self.alpha) * self.value + self.alpha * x
+        return self.value
+
+
+class WilderRsiState:
+    # Wilder's RSI, gains and losses smoothed with ewm(com=window - 1, adjust=False)
+    def __init__(self, window=14):
+        self.prev_close = None
+        self.avg_gain = EmaState(1 / window)
+        self.avg_loss = EmaState(1 / window)
+
+    def update(self, close):
+        # The first bar has no change, which the full recompute counts as a gain and loss of 0
+        delta = 0.0 if self.prev_close is None else close - self.prev_close
+        self.prev_close = close
+
+        self.avg_gain.update(max(delta, 0.0))
+        self.avg_loss.update(max(-delta, 0.0))
+
+    @property
+    def value(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rs = np.float64(self.avg_gain.value) / np.float64(self.avg_loss.value)
+            return 100 - (100 / (1 + rs))
+
+
+class MacdState:
+    def __init__(self, short_window=12, long_window=26, signal_window=9):
+        self.short_ema = EmaState(2 / (short_window + 1))
+        self.long_ema = EmaState(2 / (long_window + 1))
+        self.signal_ema = EmaState(2 / (signal_window + 1))
+
+    def update(self, close):
+        macd_line = self.short_ema.update(close) - self.long_ema.update(close)
+        self.signal_ema.update(macd_line)
+
+    @property
+    def macd_line(self):
+        return self.short_ema.value - self.long_ema.value
+
+    @property
+    def signal_line(self):
+        return self.signal_ema.value
+
+
+class RollingWindowState:
+    # Ring buffer of the last window closes with a running sum and sum of squares
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def update(self, x):
+        if len(self.values) == self.window:
+            oldest = self.values[0]
+            self.total -= oldest
+            self.total_sq -= oldest * oldest
+
+        self.values.append(x)
+        self.total += x
+        self.total_sq += x * x
+
+    def resync(self):
+        # Recompute the running sums from the buffer so rounding drift never builds up across runs
+        values = np.fromiter(self.values, dtype=np.float64)
+        self.total = values.sum()
+        self.total_sq = (values * values).sum()
+
+    @property
+    def mean(self):
+        if len(self.values) < self.window:
+            return np.nan
+        return self.total / self.window
+
+    @property
+    def std(self):
+        # Population standard deviation (ddof=0), as the Bollinger bands use
+        if len(self.values) < self.window:
+            return np.nan
+        mean = self.total / self.window
+        return np.sqrt(max(self.total_sq / self.window - mean * mean, 0.0))
+
+
+class TaState:
+    """
+    Everything needed to advance a ticker's technical indicators by new bars only.
+
+    The state only ever holds completed bars: the most recent bar of a run may still be trading, so it
+    is applied to a throw-away copy when producing values and re-applied for real on the next run.
+    """
+    def __init__(self):
+        self.last_date = None
+        self.last_close = None
+        self.bars_seen = 0
+
+        self.ma_200 = RollingWindowState(200)
+        self.ma_50 = RollingWindowState(50)
+        self.bollinger = RollingWindowState(20)
+        self.rsi = WilderRsiState(14)
+        self.macd = MacdState(12, 26, 9)
+
+    def update(self, date, close):
+        close = float(close)
+
+        self.ma_200.update(close)
+        self.ma_50.update(close)
+        self.bollinger.update(close)
+        self.rsi.update(close)
+        self.macd.update(close)
+
+        self.last_date = date
+        self.last_close = close
+        self.bars_seen += 1
+
+    def resync(self):
+        for window_state in (self.ma_200, self.ma_50, self.bollinger):
+            window_state.resync()
+
+    def ta_values(self):
+        middle = self.bollinger.mean
+        std = self.bollinger.std
+        macd_line = self.macd.macd_line
+        signal_line = self.macd.signal_line
+
+        values = {
+            'two_hundred_day_ma': self.ma_200.mean,
+            'fifty_day_ma': self.ma_50.mean,
+            'rsi': self.rsi.value,
+            'macd_line': macd_line,
+            'macd_signal': signal_line,
+            'macd_histogram': macd_line - signal_line,
+            'bollinger_upper': middle + 2 * std,
+            'bollinger_lower': middle - 2 * std,
+            'bollinger_middle': middle
+        }
+
+        return {field: np.round(value, TA_FIELD_DECIMALS[field]) for field, value in values.items()}
+
+
+def ta_state_path(ticker):
+    return os.path.join(config.STOCK_DATA_DIR, f"{ticker}_ta_state.pkl")
+
+
+def load_ta_state(ticker):
+    path = ta_state_path(ticker)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_ta_state(ticker, state):
+    path = ta_state_path(ticker)
+    tmp_path = f"{path}.tmp"
+
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def calculate_ta_values_incremental(ticker, df):
+    """
+    Latest TA values for a ticker, advancing the saved indicator state by only the bars it has not seen.
+
+    Parameters:
+    ticker (str): The ticker symbol.
+    df (DataFrame): Full daily history with a 'Close' column.
+
+    Returns:
+    dict: The TA fields of StockDataEntry, rounded like the full recompute.
+    """
+    closes = df['Close']
+    state = load_ta_state(ticker)
+
+    # Start over when the history no longer contains the last bar we saw at the same price, which
+    # means it was split or dividend adjusted (or rebuilt) since the state was saved
+    if state is not None:
+        if state.last_date not in closes.index or not np.isclose(closes.loc[state.last_date], state.last_close,
+                                                                 rtol=1e-9):
+            state = None
+
+    if state is None:
+        state = TaState()
+        completed_bars = closes.iloc[:-1]
+    else:
+        completed_bars = closes.iloc[:-1][closes.index[:-1] > state.last_date]
+
+    for date, close in completed_bars.items():
+        state.update(date, close)
+
+    if len(completed_bars):
+        state.resync()
+        save_ta_state(ticker, state)
+
+    # Apply the latest, possibly still trading, bar to a copy only
+    latest_state = copy.deepcopy(state)
+    latest_state.update(closes.index[-1], closes.iloc[-1])
+
+    return latest_state.ta_values()
+
+
+def verify_ta_values(ticker, incremental_values, full_values):
+    # The incremental values may only differ from the full recompute by floating point noise, which
+    # can move a value by at most one unit in its last rounded decimal
+    mismatches = []
+    for field, decimals in TA_FIELD_DECIMALS.items():
+        if not np.isclose(incremental_values[field], full_values[field], rtol=0, atol=1.01 * 10 ** -decimals,
+                          equal_nan=True):
+            mismatches.append(f"{field}: incremental {incremental_values[field]} != full {full_values[field]}")
+
+    if mismatches:
+        raise ValueError(f"{ticker}: incremental TA state does not match full recompute - " + "; ".join(mismatches))
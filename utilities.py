@@ -3,7 +3,8 @@ import pandas as pd
 import numpy as np
 import config
 from datetime import datetime
-from stock_data_entry import StockDataEntry
+from instrumentation import logger, stage
+from results_sink import ResultsBuffer, write_results
 
 
 def create_data_dirs():
@@ -17,7 +18,7 @@ def create_data_dirs():
 
 
 def download_stock_data_csv(ticker, data):
-    print(f"Saving data for {ticker}...")
+    logger.info("Saving data for %s...", ticker)
 
     output_file_name = f'{ticker}{config.STOCK_DATA_FILE_ENDING}'
     full_path = os.path.join(config.STOCK_DATA_DIR, output_file_name)
@@ -27,6 +28,53 @@ def download_stock_data_csv(ticker, data):
     return full_path
 
 
+def parquet_available():
+    # Parquet needs pyarrow (or fastparquet); fall back to pickle when neither is installed
+    for engine in ('pyarrow', 'fastparquet'):
+        try:
+            __import__(engine)
+            return True
+        except ImportError:
+            continue
+    return False
+
+
+def arrow_available():
+    # Arrow IPC (Feather) files can only be written with pyarrow
+    try:
+        __import__('pyarrow')
+        return True
+    except ImportError:
+        return False
+
+
+def frame_file_path(directory, name):
+    extension = 'parquet' if parquet_available() else 'pkl'
+    return os.path.join(directory, f"{name}.{extension}")
+
+
+def read_frame(path):
+    if not os.path.exists(path):
+        return None
+
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def write_frame_atomic(df, path):
+    # Write to a temp file next to the target and swap it in, so readers never see a half written file
+    tmp_path = f"{path}.tmp"
+
+    if path.endswith('.parquet'):
+        df.to_parquet(tmp_path)
+    else:
+        df.to_pickle(tmp_path)
+
+    os.replace(tmp_path, path)
+    return path
+
+
 def resample_data_to_weekly(df):
     # Resample using the index (which contains the Date) and take the last entry of each week
     df_weekly = df.resample('W').last()
@@ -37,35 +85,44 @@ def resample_data_to_weekly(df):
     return df_weekly
 
 def generate_results_file(sde_results):
-    final_results_df = StockDataEntry.new_dataframe()
+    # Fill a typed columnar buffer straight from the entries, no per-entry dicts or concat
+    with stage('generate_results_file'):
+        results_buffer = ResultsBuffer(capacity=len(sde_results))
+        results_buffer.extend(sde_results)
+        final_results_df = results_buffer.to_dataframe()
 
-    # Collect all result entries in a list
-    result_entries = []
+        if final_results_df.empty:
+            logger.warning("No valid entries to write.")
 
-    for result in sde_results:
-        result_entry = result.to_dict()
-        result_entries.append(result_entry)
+        current_datetime = datetime.now()
+        timestamp = current_datetime.strftime("%Y%m%d_%H%M%S")
 
-    # Create DataFrame from result_entries
-    result_entries_df = pd.DataFrame(result_entries)
+        # Sort results by lowest % move for target strike
+        final_results_sorted_df = final_results_df.sort_values(by='ticker', ascending=True)
 
-    # Drop columns that are entirely NA
-    result_entries_df = result_entries_df.dropna(how='all', axis=1)
+        # Create a Results File (one per output format) using the timestamp
+        path_base = os.path.join(config.RESULTS_DATA_DIR, f"RESULTS_{timestamp}")
 
-    # Only concatenate if result_entries_df is not empty
-    if not result_entries_df.empty:
-        final_results_df = pd.concat([final_results_df, result_entries_df], ignore_index=True)
-    else:
-        print("No valid entries to concatenate.")
+        return write_results(final_results_sorted_df, path_base, config.RESULTS_FORMATS)
 
-    current_datetime = datetime.now()
-    timestamp = current_datetime.strftime("%Y%m%d_%H%M%S")
 
-    # Sort results by lowest % move for target strike
-    final_results_sorted_df = final_results_df.sort_values(by='ticker', ascending=True)
+def generate_max_pain_file(sde_results):
+    # Stack every ticker's max pain term structure into one long table
+    term_structures = [result.df_max_pain_term.assign(ticker=result.ticker)
+                       for result in sde_results if result.df_max_pain_term is not None]
 
-    # Create a Results File using the timestamp
-    results_filename = f"RESULTS_{timestamp}.csv"
-    full_path = os.path.join(config.RESULTS_DATA_DIR, results_filename)
+    if not term_structures:
+        logger.warning("No max pain term structures to write.")
+        return None
 
-    final_results_sorted_df.to_csv(full_path, index=False)
+    max_pain_df = pd.concat(term_structures, ignore_index=True)[['ticker', 'expiry_date', 'max_pain']]
+    return write_results_table(max_pain_df, 'MAX_PAIN')
+
+
+def write_results_table(df, prefix):
+    # Write a supplementary results table next to the main results file
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    full_path = os.path.join(config.RESULTS_DATA_DIR, f"{prefix}_{timestamp}.csv")
+
+    df.to_csv(full_path, index=False)
+    return full_path
@@ -0,0 +1,86 @@
+import numpy as np
+
+
+class WeeklyStats:
+    """
+    Every weekly statistic the sde_* stages need, computed straight from the weekly close array.
+
+    Returns, their mean and the worst week are computed once on construction. Statistics that depend
+    on the target strike % (run lengths above it, closes below it) come from one pass per threshold in
+    threshold_stats. Nothing is written back to the weekly DataFrame.
+
+    Parameters:
+    dates (array): Week ending dates, oldest first.
+    closes (array): Weekly closes, NaN for weeks without trading.
+    """
+    def __init__(self, dates, closes):
+        self.dates = np.asarray(dates, dtype='datetime64[ns]')
+        self.closes = np.asarray(closes, dtype=np.float64)
+        self.total_weeks = self.closes.shape[0]
+
+        # Week over week change as a fraction, NaN for the first week and around missing closes
+        self.returns = np.full(self.total_weeks, np.nan)
+        self.returns[1:] = self.closes[1:] / self.closes[:-1] - 1
+
+        # 'Weekly Return' in percent
+        self.returns_pct = self.returns * 100
+
+        valid_returns = self.returns_pct[~np.isnan(self.returns_pct)]
+        self.mean_return_pct = valid_returns.sum() / valid_returns.shape[0] if valid_returns.size else np.nan
+        self.lowest_move_index = int(np.nanargmin(self.returns_pct)) if valid_returns.size else None
+
+        self._threshold_stats = {}
+
+    def threshold_stats(self, tgt_strike_pct):
+        """
+        Run length and close-below statistics for one target strike %, computed once and then reused.
+
+        Parameters:
+        tgt_strike_pct (float): Target strike move in percent (negative).
+
+        Returns:
+        ThresholdStats: Statistics for this threshold.
+        """
+        if tgt_strike_pct not in self._threshold_stats:
+            self._threshold_stats[tgt_strike_pct] = ThresholdStats(self, tgt_strike_pct)
+        return self._threshold_stats[tgt_strike_pct]
+
+
+class ThresholdStats:
+    def __init__(self, weekly_stats, tgt_strike_pct):
+        # Weeks that closed at or above the target move (missing returns never count)
+        above = weekly_stats.returns >= tgt_strike_pct / 100
+
+        # Runs of consecutive weeks above the target: boundaries are where the flag flips
+        flips = np.diff(np.concatenate(([False], above, [False])).astype(np.int8))
+        run_lengths = np.flatnonzero(flips == -1) - np.flatnonzero(flips == 1)
+
+        if run_lengths.size:
+            self.run_max = run_lengths.max()
+            self.run_min = run_lengths.min()
+            self.run_avg = np.round(run_lengths.mean(), 2)
+        else:
+            self.run_max = self.run_min = self.run_avg = np.nan
+
+        # Weeks whose return, rounded to 2 places, closed below the target move
+        below = np.round(weekly_stats.returns_pct, 2) < tgt_strike_pct
+        self._below_count = np.cumsum(below)
+
+        below_index = np.flatnonzero(below)
+        if below_index.size:
+            last_below_date = weekly_stats.dates[below_index[-1]]
+            days_since = (weekly_stats.dates[-1] - last_below_date) / np.timedelta64(1, 'D')
+            self.weeks_since_last_below = int(days_since / 7)
+        else:
+            self.weeks_since_last_below = -1
+
+    def recent_below_count(self, window_weeks):
+        # Closes below the target among the returns inside the last window_weeks weeks. The first week of
+        # the window has no return inside the window, so only window_weeks - 1 returns are counted.
+        returns_in_window = min(window_weeks - 1, self._below_count.shape[0])
+        if returns_in_window <= 0:
+            return 0
+
+        if returns_in_window == self._below_count.shape[0]:
+            return int(self._below_count[-1])
+        return int(self._below_count[-1] - self._below_count[-returns_in_window - 1])